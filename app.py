@@ -1,33 +1,44 @@
+import gzip
+import hashlib
+import json
 import logging
-import sys
+import os
+import time
 from datetime import datetime
 from functools import wraps
 
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, session
+from flask import Flask, abort, render_template, request, redirect, url_for, flash, jsonify, Response, session
+from jinja2 import FileSystemBytecodeCache
 
+import bulk
+from archive import ArchiveJob
+from health import TableStats
+import search
+from cache import TaskListCache, create_backend as create_cache_backend, private_directory
 from config import config, Config
-from database import get_db_connection, create_user, verify_user, get_user_by_id, get_user_by_username, get_user_by_email
+from logging_config import configure_logging
+from passwords import PasswordHasherBusy
+from metrics import init_app as init_metrics_app, generate as generate_metrics
+from database import init_app as init_database_app, current_database_key, count_table_rows, get_schema, get_task_connection, ping_database, get_task_version, get_replica_monitor, read_from_primary, task_read_source, create_user, verify_user, get_user_by_id, get_user_by_login
+from task_queries import (DEFAULT_CHANGES_LIMIT, DEFAULT_PAGE_SIZE, MAX_CHANGES_LIMIT, TaskFilters, TaskPage,
+                          InvalidCursor, decode_change_cursor, encode_change_cursor)
+from task_repository import get_task_repository
 
 # Prometheus metrics (optional)
 try:
-    from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+    from prometheus_client import Counter, Gauge
 
     PROMETHEUS_AVAILABLE = True
-    REQUEST_COUNT = Counter('http_requests_total', 'Total HTTP requests', ['method', 'endpoint', 'status'])
-    REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency', ['method', 'endpoint'])
     TASK_OPERATIONS = Counter('task_operations_total', 'Total task operations', ['operation'])
+    TASK_CACHE_EVENTS = Counter('task_cache_events_total', 'Task list cache hits, misses, evictions and invalidations', ['event'])
+    # Every worker on a host sees the same cache, so its latest reading wins
+    TASK_CACHE_ENTRIES = Gauge('task_cache_entries', 'Task list pages in the shared cache', multiprocess_mode='mostrecent')
+    TASK_CACHE_BYTES = Gauge('task_cache_bytes', 'Size of cached task list pages in bytes', multiprocess_mode='mostrecent')
 except ImportError:
     PROMETHEUS_AVAILABLE = False
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('app.log')
-    ]
-)
+configure_logging(Config)
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
@@ -38,74 +49,86 @@ env = Config.ENVIRONMENT
 app.config.from_object(config.get(env, config['default']))
 app.secret_key = app.config['SECRET_KEY']
 
+# One pooled connection per request, released on teardown
+init_database_app(app)
+init_metrics_app(app)
+
 
-def ensure_schema_columns():
-    """Ensure optional columns exist (supports older DBs)."""
-    columns_needed = [
-        ('due_date', "ALTER TABLE tasks ADD due_date DATETIME"),
-        ('priority', "ALTER TABLE tasks ADD priority VARCHAR(10) NOT NULL DEFAULT 'Medium'"),
-        ('category', "ALTER TABLE tasks ADD category VARCHAR(100) DEFAULT 'General'")
-    ]
+def template_bytecode_cache(directory):
+    """
+    Return a Jinja bytecode cache in directory, or None when it is unsafe.
 
+    Bytecode is loaded as code, so the directory must be private: without
+    one Jinja uses its per-user 0700 directory in the temp dir (and checks
+    it), and a configured one must pass the same owner and mode check.
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        if app.config['DB_TYPE'] == 'azure_sql':
-            azure_alters = {
-                'due_date': "ALTER TABLE tasks ADD due_date DATETIME",
-                'priority': "ALTER TABLE tasks ADD priority NVARCHAR(10) NOT NULL DEFAULT 'Medium'",
-                'category': "ALTER TABLE tasks ADD category NVARCHAR(100) DEFAULT 'General'",
-            }
-            for name, alter_stmt in azure_alters.items():
-                cursor.execute(
-                    "SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME='tasks' AND COLUMN_NAME=?",
-                    (name,)
-                )
-                exists = cursor.fetchone()
-                if not exists:
-                    cursor.execute(alter_stmt)
-                    conn.commit()
-                    logger.info("Added %s column to Azure SQL tasks table", name)
-        else:
-            cursor.execute("PRAGMA table_info(tasks)")
-            existing = []
-            for row in cursor.fetchall():
-                try:
-                    existing.append(row['name'])
-                except Exception:
-                    existing.append(row[1] if len(row) > 1 else row[0])
-
-            for name, alter_stmt in columns_needed:
-                if name not in existing:
-                    cursor.execute(alter_stmt)
-                    conn.commit()
-                    logger.info("Added %s column to SQLite tasks table", name)
-    except Exception as exc:
-        logger.warning("Could not ensure schema columns exist: %s", exc)
-    finally:
-        try:
-            cursor.close()
-            conn.close()
-        except Exception:
-            pass
+        if directory:
+            private_directory(directory)
+        return FileSystemBytecodeCache(directory or None)
+    except (OSError, RuntimeError) as e:
+        logger.warning("Template bytecode cache disabled, %s is not a private directory: %s",
+                       directory or 'the default directory', e)
+        return None
 
 
-def parse_datetime_value(value):
-    """Return datetime from DB value or None."""
-    if value is None:
-        return None
-    if isinstance(value, datetime):
-        return value
-    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S"):
-        try:
-            return datetime.strptime(str(value), fmt)
-        except ValueError:
-            continue
+# Gunicorn recycles workers every max_requests; a new worker loads compiled
+# templates from disk instead of recompiling them (stale entries are keyed
+# out by a checksum of the template source)
+if app.config['TEMPLATE_CACHE_DIR'] != 'none':
+    app.jinja_env.bytecode_cache = template_bytecode_cache(app.config['TEMPLATE_CACHE_DIR'])
+
+def refresh_task_cache_gauges(max_age=0):
+    """Read the shared cache's size into its gauges, at most once per max_age seconds."""
+    global task_cache_gauges_read
+    now = time.monotonic()
+    if not task_cache.enabled or now - task_cache_gauges_read < max_age:
+        return
+    task_cache_gauges_read = now
     try:
-        return datetime.fromisoformat(str(value))
-    except Exception:
-        return None
+        entries, size = task_cache.backend.size()
+        TASK_CACHE_ENTRIES.set(entries)
+        TASK_CACHE_BYTES.set(size)
+    except Exception as exc:
+        logger.warning("Could not read task cache size: %s", exc)
+
+
+def count_task_cache_event(event):
+    """Count a cache event; also keeps the size gauges fresh when workers are not scraped."""
+    TASK_CACHE_EVENTS.labels(event=event).inc()
+    refresh_task_cache_gauges(max_age=15)
+
+
+# Task list pages cached per user, shared by the workers on this host
+task_cache_gauges_read = 0.0
+task_cache = TaskListCache(
+    create_cache_backend(
+        app.config['TASK_CACHE_BACKEND'], app.config['TASK_CACHE_TTL'],
+        app.config['TASK_CACHE_MAX_ENTRIES'], app.config['TASK_CACHE_MAX_BYTES'],
+        app.config['TASK_CACHE_PATH'] or None
+    ),
+    on_event=count_task_cache_event if PROMETHEUS_AVAILABLE else None,
+    encode=TaskPage.to_data, decode=TaskPage.from_data
+)
+
+
+# Table counts for the health endpoints, refreshed in the background
+table_stats = TableStats(count_table_rows, app.config['HEALTH_STATS_INTERVAL'], key=current_database_key)
+
+
+def forget_archived_tasks(user_ids):
+    """Drop cached lists and search indexes of users whose tasks were archived."""
+    for user_id in user_ids:
+        search.invalidate(user_id)
+        task_cache.invalidate(task_cache_scope(user_id))
+
+
+# Old completed tasks move to tasks_archive (and old tombstones go) in the background
+archive_job = ArchiveJob(
+    app.config['ARCHIVE_AFTER_DAYS'], app.config['ARCHIVE_BATCH_SIZE'],
+    app.config['ARCHIVE_INTERVAL'], app.config['ARCHIVE_BATCH_PAUSE'],
+    on_archive=forget_archived_tasks, tombstone_days=app.config['TASK_TOMBSTONE_DAYS']
+)
 
 
 # Authentication decorator
@@ -120,83 +143,79 @@ def login_required(f):
     return decorated_function
 
 
-def row_to_dict(row, columns):
-    """Normalize DB row to dict for both SQLite and Azure SQL."""
-    try:
-        return dict(row)
-    except Exception:
-        return {col: row[idx] for idx, col in enumerate(columns)}
+def api_login_required(f):
+    """Like login_required, but answers API clients with 401 JSON."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Authentication required'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
 
 
-def fetch_tasks():
-    """Fetch tasks and annotate with derived flags."""
-    ensure_schema_columns()
-    
-    # Get current user's ID from session
-    user_id = session.get('user_id')
-    if not user_id:
-        return []
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Check if user_id column exists, if not skip filtering by user
-    try:
-        cursor.execute(
-            "SELECT id, title, description, completed, created_at, due_date, priority, category FROM tasks WHERE user_id = ? ORDER BY created_at DESC",
-            (user_id,)
-        )
-    except Exception:
-        # Fallback for old schema without user_id
-        cursor.execute(
-            "SELECT id, title, description, completed, created_at, due_date, priority, category FROM tasks ORDER BY created_at DESC"
-        )
-    
-    rows = cursor.fetchall()
-    column_names = [col[0] for col in cursor.description] if cursor.description else []
+def task_cache_scope(user_id):
+    """Cache scope for a user's task lists in the configured database."""
+    return f"{'/'.join(str(part) for part in current_database_key())}#{user_id}"
 
-    tasks = []
-    priority_order = {'High': 3, 'Medium': 2, 'Low': 1}
-    now = datetime.now()
-    for row in rows:
-        raw = row_to_dict(row, column_names)
-        created_at = parse_datetime_value(raw.get('created_at'))
-        due_date = parse_datetime_value(raw.get('due_date'))
-
-        task = {
-            'id': raw.get('id'),
-            'title': raw.get('title', ''),
-            'description': raw.get('description', ''),
-            'completed': bool(raw.get('completed')),
-            'created_at': created_at,
-            'due_date': due_date,
-            'priority': raw.get('priority', 'Medium'),
-            'category': raw.get('category', 'General')
-        }
-        task['is_overdue'] = (not task['completed']) and task['due_date'] is not None and task['due_date'] < now
-        task['is_due_today'] = task['due_date'] is not None and task['due_date'].date() == now.date()
-        task['priority_rank'] = priority_order.get(task['priority'], 2)
-        tasks.append(task)
 
-    cursor.close()
-    conn.close()
-    return tasks
+def remember_write():
+    """Let this session read its own writes: primary reads for REPLICA_STICKY_SECONDS."""
+    read_from_primary()
+    if app.config['READ_REPLICA']:
+        session['wrote_at'] = time.time()
+
+
+@app.before_request
+def read_own_writes():
+    """Send this session's reads to the primary shortly after it wrote."""
+    wrote_at = session.get('wrote_at')
+    if wrote_at and time.time() - wrote_at < app.config['REPLICA_STICKY_SECONDS']:
+        read_from_primary()
+
 
+@app.before_request
+def start_archive_job():
+    """Start this worker's archive thread with its first request (threads do not survive fork)."""
+    archive_job.start()
 
-# Middleware to track metrics (if installed)
-if PROMETHEUS_AVAILABLE:
-    @app.before_request
-    def before_request():
-        request.start_time = datetime.now()
 
-    @app.after_request
-    def after_request(response):
-        if hasattr(request, 'start_time'):
-            latency = (datetime.now() - request.start_time).total_seconds()
-            REQUEST_LATENCY.labels(method=request.method, endpoint=request.endpoint or 'unknown').observe(latency)
-            REQUEST_COUNT.labels(method=request.method, endpoint=request.endpoint or 'unknown',
-                                 status=response.status_code).inc()
-        return response
+def invalidate_user_tasks(user_id):
+    """Drop cached lists and search indexes after a user's tasks change."""
+    remember_write()
+    search.invalidate(user_id)
+    task_cache.invalidate(task_cache_scope(user_id))
+
+
+def fetch_tasks(filters=None, version=None):
+    """
+    Fetch one page of the current user's tasks with their derived flags.
+
+    The overdue/today flags come from the query, so cached pages are keyed
+    on the minute they were computed in and never show a flag more than a
+    minute stale. Passing the user's task_version keys the cached page on
+    it, so the page is never older than the version a caller has already read.
+    Pages read from the replica are cached apart from the primary's, so
+    a session reading its own writes never gets one.
+    """
+    filters = filters or TaskFilters()
+    # Get current user's ID from session
+    user_id = session.get('user_id')
+    if not user_id:
+        return TaskPage([])
+
+    now = datetime.now()
+    scope = task_cache_scope(user_id)
+    source = task_read_source()
+    cache_key = f"{filters.cache_key()}@{now:%Y-%m-%dT%H:%M}@{source}"
+    if version is not None:
+        cache_key = f"{cache_key}@{version}"
+    page, token = task_cache.lookup(scope, cache_key)
+    if page is None:
+        page = get_task_repository().list_page(user_id, filters, now)
+        if task_read_source() == source:
+            # Not when the replica's health changed mid-read: the page's source is unknown
+            task_cache.store(scope, cache_key, page, token)
+    return page
 
 
 # Authentication Routes
@@ -210,6 +229,15 @@ def landing():
     return render_template('landing.html')
 
 
+def hashing_busy(template):
+    """Answer 503 while password hashing is saturated, instead of queueing more."""
+    logger.warning("Password hashing is saturated, rejecting %s", request.path)
+    flash('Too many sign-ins right now. Please try again in a moment.', 'error')
+    response = app.make_response((render_template(template), 503))
+    response.headers['Retry-After'] = '1'
+    return response
+
+
 @app.route('/signup', methods=['GET', 'POST'])
 def signup():
     """User registration."""
@@ -239,26 +267,28 @@ def signup():
             flash('Passwords do not match', 'error')
             return render_template('signup.html')
         
-        # Check if user already exists
-        if get_user_by_username(username):
-            flash('Username already exists', 'error')
-            return render_template('signup.html')
-        
-        if get_user_by_email(email):
-            flash('Email already registered', 'error')
-            return render_template('signup.html')
-        
-        # Create user
-        user_id = create_user(username, email, password)
+        # The UNIQUE constraints reject duplicates; look up which one only on failure
+        try:
+            user_id = create_user(username, email, password)
+        except PasswordHasherBusy:
+            return hashing_busy('signup.html')
         if user_id:
+            remember_write()
             session['user_id'] = user_id
             session['username'] = username
             flash(f'Welcome, {username}! Your account has been created.', 'success')
             logger.info(f"New user registered: {username}")
             return redirect(url_for('home'))
+        # The user who took the name may have signed up too recently for the replica
+        read_from_primary()
+        existing = get_user_by_login(username, email)
+        if existing and existing['username'] == username:
+            flash('Username already exists', 'error')
+        elif existing:
+            flash('Email already registered', 'error')
         else:
             flash('Error creating account. Please try again.', 'error')
-            return render_template('signup.html')
+        return render_template('signup.html')
     
     return render_template('signup.html')
 
@@ -277,7 +307,10 @@ def login():
             flash('Username and password are required', 'error')
             return render_template('login.html')
         
-        user = verify_user(username, password)
+        try:
+            user = verify_user(username, password)
+        except PasswordHasherBusy:
+            return hashing_busy('login.html')
         if user:
             session['user_id'] = user['id']
             session['username'] = user['username']
@@ -307,53 +340,20 @@ def logout():
 def home():
     """Display all tasks with filtering, search, and sorting."""
     try:
-        tasks = fetch_tasks()
-
-        search_term = request.args.get('q', '').strip().lower()
-        status_filter = request.args.get('status', 'all')
-        category_filter = request.args.get('category', 'all').strip()
-        sort_option = request.args.get('sort', 'priority_desc')
-
-        filtered = []
-        for task in tasks:
-            if search_term and search_term not in task['title'].lower():
-                continue
-            if category_filter not in ('', 'all') and task['category'].lower() != category_filter.lower():
-                continue
-
-            if status_filter == 'completed' and not task['completed']:
-                continue
-            if status_filter == 'pending' and task['completed']:
-                continue
-            if status_filter == 'overdue' and not task['is_overdue']:
-                continue
-            if status_filter == 'today':
-                if not task['due_date'] or task['due_date'].date() != datetime.now().date():
-                    continue
-
-            filtered.append(task)
-
-        if sort_option.startswith('priority'):
-            reverse = sort_option == 'priority_desc'
-            filtered.sort(key=lambda t: t.get('priority_rank', 2), reverse=reverse)
-        else:
-            reverse = True if sort_option == 'created_desc' else False
-            filtered.sort(key=lambda t: t['created_at'] or datetime.min, reverse=reverse)
+        filters = TaskFilters.from_args(request.args)
+        page = fetch_tasks(filters)
 
         grouped_tasks = {}
-        for task in filtered:
-            category = task.get('category', 'General') or 'General'
+        for task in page.tasks:
+            category = task.category or 'General'
             grouped_tasks.setdefault(category, []).append(task)
 
-        filters = {
-            'q': search_term,
-            'status': status_filter,
-            'sort': sort_option,
-            'category': category_filter
-        }
-
-        logger.info("Rendering %d tasks after filters", len(filtered))
-        return render_template('index.html', tasks=filtered, grouped_tasks=grouped_tasks, filters=filters)
+        logger.info("Rendering %d tasks after filters", len(page.tasks))
+        return render_template('index.html', tasks=page.tasks, grouped_tasks=grouped_tasks,
+                               filters=filters.as_dict(), page=page)
+    except InvalidCursor:
+        flash('Invalid page link', 'error')
+        return redirect(url_for('home'))
     except Exception as exc:
         logger.error("Error fetching tasks: %s", exc)
         flash('Error loading tasks', 'error')
@@ -393,24 +393,8 @@ def add_task():
         if priority not in ('High', 'Medium', 'Low'):
             priority = 'Medium'
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Try to insert with user_id, fallback to without for old schema
-        try:
-            cursor.execute(
-                'INSERT INTO tasks (title, description, due_date, priority, category, user_id) VALUES (?, ?, ?, ?, ?, ?)',
-                (title, description, due_date.isoformat() if due_date else None, priority, category, user_id)
-            )
-        except Exception:
-            cursor.execute(
-                'INSERT INTO tasks (title, description, due_date, priority, category) VALUES (?, ?, ?, ?, ?)',
-                (title, description, due_date.isoformat() if due_date else None, priority, category)
-            )
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        get_task_repository().add(user_id, title, description, due_date, priority, category)
+        invalidate_user_tasks(user_id)
 
         if PROMETHEUS_AVAILABLE:
             TASK_OPERATIONS.labels(operation='create').inc()
@@ -429,25 +413,12 @@ def add_task():
 def toggle_task(task_id):
     """Toggle task completion status."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, completed FROM tasks WHERE id = ?', (task_id,))
-        row = cursor.fetchone()
-
-        if not row:
+        user_id = session.get('user_id')
+        new_status = get_task_repository().toggle(user_id, task_id)
+        if new_status is None:
             flash('Task not found', 'error')
-            cursor.close()
-            conn.close()
             return redirect(url_for('home'))
-
-        columns = [col[0] for col in cursor.description]
-        task = row_to_dict(row, columns)
-        new_status = 0 if task.get('completed') else 1
-
-        cursor.execute('UPDATE tasks SET completed = ? WHERE id = ?', (new_status, task_id))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        invalidate_user_tasks(user_id)
 
         if PROMETHEUS_AVAILABLE:
             TASK_OPERATIONS.labels(operation='toggle').inc()
@@ -466,12 +437,9 @@ def toggle_task(task_id):
 def delete_task(task_id):
     """Delete a task."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
-        conn.commit()
-
-        if cursor.rowcount > 0:
+        user_id = session.get('user_id')
+        if get_task_repository().delete(user_id, task_id):
+            invalidate_user_tasks(user_id)
             if PROMETHEUS_AVAILABLE:
                 TASK_OPERATIONS.labels(operation='delete').inc()
 
@@ -481,8 +449,6 @@ def delete_task(task_id):
             logger.warning("Task %s not found for deletion", task_id)
             flash('Task not found', 'error')
 
-        cursor.close()
-        conn.close()
         return redirect(url_for('home'))
     except Exception as exc:
         logger.error("Error deleting task %s: %s", task_id, exc)
@@ -490,6 +456,20 @@ def delete_task(task_id):
         return redirect(url_for('home'))
 
 
+@app.route('/task/<int:task_id>/edit', methods=['GET'])
+@login_required
+def edit_task_form(task_id):
+    """Edit form for one task: a fragment for the task list's script, or a page."""
+    task = get_task_repository().get(session.get('user_id'), task_id)
+    if task is None:
+        abort(404)
+
+    standalone = request.headers.get('X-Requested-With') != 'fetch'
+    response = app.make_response(render_template('task_edit_form.html', task=task, standalone=standalone))
+    response.vary.add('X-Requested-With')
+    return response
+
+
 @app.route('/task/<int:task_id>/edit', methods=['POST'])
 @login_required
 def edit_task(task_id):
@@ -520,19 +500,12 @@ def edit_task(task_id):
                 flash('Invalid due date format', 'error')
                 return redirect(url_for('home'))
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            UPDATE tasks 
-            SET title = ?, description = ?, priority = ?, category = ?, due_date = ?
-            WHERE id = ?
-            """,
-            (title, description, priority, category, due_date.isoformat() if due_date else None, task_id)
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
+        user_id = session.get('user_id')
+        if not get_task_repository().update(user_id, task_id, title, description, priority, category, due_date):
+            logger.warning("Task %s not found for editing", task_id)
+            flash('Task not found', 'error')
+            return redirect(url_for('home'))
+        invalidate_user_tasks(user_id)
 
         flash('Task updated successfully', 'success')
         return redirect(url_for('home'))
@@ -542,35 +515,344 @@ def edit_task(task_id):
         return redirect(url_for('home'))
 
 
+@app.route('/tasks/archived')
+@login_required
+def archived_tasks():
+    """Archived tasks, most recently archived first, read only when asked for."""
+    filters = TaskFilters.from_args(request.args)
+    pager = {'per_page': filters.page_size} if filters.page_size != DEFAULT_PAGE_SIZE else {}
+    try:
+        page = get_task_repository().list_archived(session.get('user_id'), filters)
+        return render_template('archived.html', page=page, pager=pager)
+    except InvalidCursor:
+        flash('Invalid page link', 'error')
+        return redirect(url_for('archived_tasks'))
+    except Exception as exc:
+        logger.error("Error fetching archived tasks: %s", exc)
+        flash('Error loading archived tasks', 'error')
+        return render_template('archived.html', page=TaskPage([]), pager=pager)
+
+
+@app.route('/task/<int:task_id>/restore', methods=['POST'])
+@login_required
+def restore_task(task_id):
+    """Move an archived task back to the task list."""
+    try:
+        user_id = session.get('user_id')
+        if not get_task_repository().restore(user_id, task_id):
+            flash('Task not found', 'error')
+            return redirect(url_for('archived_tasks'))
+        invalidate_user_tasks(user_id)
+
+        if PROMETHEUS_AVAILABLE:
+            TASK_OPERATIONS.labels(operation='restore').inc()
+
+        logger.info("Task %s restored from the archive", task_id)
+        flash('Task restored', 'success')
+        return redirect(url_for('archived_tasks'))
+    except Exception as exc:
+        logger.error("Error restoring task %s: %s", task_id, exc)
+        flash('Error restoring task', 'error')
+        return redirect(url_for('archived_tasks'))
+
+
+API_TASK_FIELDS = ('id', 'title', 'description', 'completed', 'created_at', 'due_date',
+                   'priority', 'category', 'is_overdue', 'is_due_today')
+# Fields and filters whose value changes with the clock, not only with writes
+TIME_DEPENDENT_FIELDS = frozenset(['is_overdue', 'is_due_today'])
+TIME_DEPENDENT_STATUSES = frozenset(['overdue', 'today'])
+
+
+def task_to_json(task, fields):
+    """Return the selected fields of a task as JSON-ready values."""
+    item = {}
+    for field in fields:
+        value = getattr(task, field)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        item[field] = value
+    return item
+
+
+def api_tasks_etag(user_id, version, filters, fields, now):
+    """
+    Strong ETag for an /api/tasks response computed without querying tasks
+
+    Args:
+        user_id: Current user's id
+        version: users.task_version of that user
+        filters: TaskFilters of the request
+        fields: Selected task fields
+        now: Request time
+
+    Returns:
+        ETag string that changes whenever the response body would
+    """
+    parts = [user_id, version, filters.cache_key(), fields]
+    if filters.status in TIME_DEPENDENT_STATUSES or TIME_DEPENDENT_FIELDS.intersection(fields):
+        # Due dates have minute precision, so the flags can only flip on the minute
+        parts.append(now.strftime('%Y-%m-%dT%H:%M'))
+    digest = hashlib.sha256(json.dumps(parts, separators=(',', ':')).encode()).hexdigest()[:32]
+    return f'v{version}-{digest}'
+
+
+def not_modified(etag):
+    """Return a 304 response when the client already holds etag (or its gzip twin)."""
+    for candidate in (etag, f'{etag}-gzip'):
+        if request.if_none_match.contains_weak(candidate):
+            response = Response(status=304)
+            response.set_etag(candidate)
+            response.headers['Vary'] = 'Accept-Encoding, Cookie'
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+    return None
+
+
+@app.route('/api/tasks')
+@api_login_required
+def api_tasks():
+    """JSON task list with the filters of home(), field selection and conditional GET."""
+    user_id = session['user_id']
+    filters = TaskFilters.from_args(request.args)
+    requested = request.args.get('fields', '')
+    fields = [f.strip() for f in requested.split(',') if f.strip()] if requested else list(API_TASK_FIELDS)
+    unknown = [f for f in fields if f not in API_TASK_FIELDS]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}", 'fields': list(API_TASK_FIELDS)}), 400
+
+    try:
+        # Unchanged lists cost one primary-key read: no task query, no body
+        version = get_task_version(user_id)
+        etag = api_tasks_etag(user_id, version, filters, fields, datetime.now()) if version is not None else None
+        if etag:
+            cached = not_modified(etag)
+            if cached is not None:
+                return cached
+
+        page = fetch_tasks(filters, version)
+        body = json.dumps({
+            'tasks': [task_to_json(task, fields) for task in page.tasks],
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+        }, separators=(',', ':')).encode()
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    except Exception as exc:
+        logger.error("Error fetching tasks for API: %s", exc)
+        return jsonify({'error': 'Error loading tasks'}), 500
+
+    if etag is None:
+        # Databases without task_version: fall back to hashing the body
+        etag = 'h-' + hashlib.sha256(body).hexdigest()[:32]
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+    response = Response(body, mimetype='application/json')
+    if len(body) >= app.config['API_GZIP_MIN_BYTES'] and request.accept_encodings['gzip']:
+        # mtime=0 keeps the bytes, and so the strong ETag, reproducible
+        response.set_data(gzip.compress(body, compresslevel=6, mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+        etag = f'{etag}-gzip'
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding, Cookie'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@app.route('/api/tasks/bulk', methods=['POST', 'PATCH', 'DELETE'])
+@api_login_required
+def api_tasks_bulk():
+    """
+    Create, update or delete many tasks in one transaction.
+
+    POST   {"tasks": [{...}, ...]}
+    PATCH  {"ids": [...]} or {"filter": {...}}, with "set": {...} and/or "toggle": true
+    DELETE {"ids": [...]} or {"filter": {...}}
+    """
+    user_id = session['user_id']
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object body'}), 400
+
+    try:
+        schema = get_schema()
+        conn = get_task_connection(user_id, write=True)
+        if request.method == 'POST':
+            count = bulk.create_tasks(conn, schema, user_id, data.get('tasks'), app.config['BULK_MAX_TASKS'])
+            operation, result = 'create', {'created': count}
+        else:
+            if ('ids' in data) == ('filter' in data):
+                raise bulk.BulkError('Provide exactly one of "ids" or "filter"')
+            ids = bulk.parse_ids(data['ids']) if 'ids' in data else None
+            filters = bulk.parse_filters(data['filter']) if 'filter' in data else None
+            if request.method == 'PATCH':
+                count = bulk.update_tasks(conn, schema, user_id, data.get('set'), bool(data.get('toggle')),
+                                          ids=ids, filters=filters)
+                operation, result = 'update', {'updated': count}
+            else:
+                count = bulk.delete_tasks(conn, schema, user_id, ids=ids, filters=filters)
+                operation, result = 'delete', {'deleted': count}
+    except bulk.BulkError as exc:
+        return jsonify({'error': str(exc)}), 400
+    except Exception as exc:
+        logger.error("Bulk %s failed: %s", request.method, exc)
+        return jsonify({'error': 'Bulk operation failed'}), 500
+
+    if count:
+        invalidate_user_tasks(user_id)
+        if PROMETHEUS_AVAILABLE:
+            TASK_OPERATIONS.labels(operation=f'bulk_{operation}').inc(count)
+    logger.info("Bulk %s of %d tasks", operation, count)
+    return jsonify(result), 200
+
+
+@app.route('/api/tasks/archived')
+@api_login_required
+def api_archived_tasks():
+    """JSON page of archived tasks, newest archive first, with a cursor to older ones."""
+    try:
+        page = get_task_repository().list_archived(session['user_id'], TaskFilters.from_args(request.args))
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    except Exception as exc:
+        logger.error("Error fetching archived tasks for API: %s", exc)
+        return jsonify({'error': 'Error loading archived tasks'}), 500
+    tasks = [{field: value.isoformat() if isinstance(value, datetime) else value for field, value in task.items()}
+             for task in page.tasks]
+    for task in tasks:
+        task['completed'] = bool(task['completed'])
+    return jsonify({'tasks': tasks, 'next_cursor': page.next_cursor}), 200
+
+
+@app.route('/api/tasks/<int:task_id>/restore', methods=['POST'])
+@api_login_required
+def api_restore_task(task_id):
+    """Move an archived task back to the task list; 404 when there is no such archived task."""
+    user_id = session['user_id']
+    try:
+        restored = get_task_repository().restore(user_id, task_id)
+    except Exception as exc:
+        logger.error("Error restoring task %s: %s", task_id, exc)
+        return jsonify({'error': 'Restore failed'}), 500
+    if not restored:
+        return jsonify({'error': 'Archived task not found'}), 404
+    invalidate_user_tasks(user_id)
+    if PROMETHEUS_AVAILABLE:
+        TASK_OPERATIONS.labels(operation='restore').inc()
+    return jsonify({'restored': task_id}), 200
+
+
+def change_to_json(change):
+    """Return a change feed entry as JSON: the task's fields, or a tombstone for a deleted task."""
+    if change['deleted']:
+        return {'id': change['id'], 'deleted': True, 'deleted_at': change['updated_at'].isoformat()}
+    item = {field: value.isoformat() if isinstance(value, datetime) else value
+            for field, value in change.items() if field != 'change_version'}
+    item['completed'] = bool(item['completed'])
+    item['deleted'] = False
+    return item
+
+
+@app.route('/api/tasks/changes')
+@api_login_required
+def api_task_changes():
+    """
+    Tasks created, changed or deleted since a change feed cursor, oldest first.
+
+    Without since every task is returned (a first sync). Each response
+    carries the cursor for the next call; while has_more is true the client
+    should call again at once. Cursors older than TASK_TOMBSTONE_DAYS get
+    410, as the tombstones they need may be gone: sync again without since.
+    """
+    user_id = session['user_id']
+    since = None
+    if request.args.get('since'):
+        try:
+            since, issued = decode_change_cursor(request.args['since'])
+        except InvalidCursor:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        max_age = app.config['TASK_TOMBSTONE_DAYS'] * 86400
+        if max_age > 0 and time.time() - issued > max_age:
+            return jsonify({'error': 'Cursor expired; sync again without since'}), 410
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_CHANGES_LIMIT)), 1), MAX_CHANGES_LIMIT)
+    except ValueError:
+        limit = DEFAULT_CHANGES_LIMIT
+
+    try:
+        current = get_task_version(user_id)
+        if since is not None and since[1] is None and current is not None and since[0] >= current:
+            # Nothing happened since: one primary-key read, no task query
+            changes, position, has_more = [], since, False
+        else:
+            page = get_task_repository().changes(user_id, since, limit, current)
+            changes, position, has_more = page.changes, page.position, page.has_more
+    except Exception as exc:
+        logger.error("Error fetching task changes: %s", exc)
+        return jsonify({'error': 'Error loading changes'}), 500
+    return jsonify({
+        'changes': [change_to_json(change) for change in changes],
+        'cursor': encode_change_cursor(position or (0, None), time.time()),
+        'has_more': has_more,
+    }), 200
+
+
 @app.route('/health')
 def health():
-    """Health check endpoint."""
+    """Health check endpoint: readiness plus the background task count."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM tasks')
-        count = cursor.fetchone()[0]
-        cursor.close()
-        conn.close()
-
+        ping_database(app.config['HEALTH_READY_TIMEOUT'])
         response = {
             'status': 'healthy',
-            'tasks_count': count,
+            'tasks_count': table_stats.get()['tables'].get('tasks'),
             'environment': app.config['ENVIRONMENT'],
             'database': app.config['DB_TYPE']
         }
-        logger.info("Health check passed")
         return jsonify(response), 200
     except Exception as exc:
         logger.error("Health check failed: %s", exc)
         return jsonify({'status': 'unhealthy', 'error': str(exc)}), 500
 
 
+@app.route('/health/live')
+def health_live():
+    """Liveness probe: the worker is serving requests. No I/O."""
+    return jsonify({'status': 'alive'}), 200
+
+
+@app.route('/health/ready')
+def health_ready():
+    """Readiness probe: a pooled connection answers SELECT 1 within HEALTH_READY_TIMEOUT."""
+    start = time.perf_counter()
+    try:
+        ping_database(app.config['HEALTH_READY_TIMEOUT'])
+    except Exception as exc:
+        logger.warning("Readiness check failed: %s", exc)
+        return jsonify({'status': 'unavailable', 'error': str(exc)}), 503
+    return jsonify({'status': 'ready', 'database_ms': round((time.perf_counter() - start) * 1000, 1)}), 200
+
+
+@app.route('/health/stats')
+def health_stats():
+    """Table row counts kept by a background refresh (approximate on Azure SQL)."""
+    try:
+        stats = table_stats.get()
+        if app.config['READ_REPLICA']:
+            stats['replica'] = get_replica_monitor().status()
+        return jsonify(stats), 200
+    except Exception as exc:
+        logger.error("Table statistics unavailable: %s", exc)
+        return jsonify({'error': 'Table statistics unavailable'}), 503
+
+
 @app.route('/metrics')
 def metrics():
     """Prometheus metrics endpoint."""
     if PROMETHEUS_AVAILABLE:
-        return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+        refresh_task_cache_gauges()
+        body, content_type = generate_metrics()
+        return Response(body, mimetype=content_type)
     return jsonify({'error': 'Prometheus client not installed'}), 503
 
 
@@ -0,0 +1,220 @@
+"""
+Archive tier for old completed tasks
+
+Completed tasks are rarely read again, yet every task list query of their
+owner walks past them. ArchiveJob moves tasks completed more than
+ARCHIVE_AFTER_DAYS ago from tasks to tasks_archive, so the hot table and
+each user's working set stay bounded by what is still live.
+
+Tasks move in batches of ARCHIVE_BATCH_SIZE, each in its own short
+transaction (one INSERT ... SELECT and one DELETE on SQLite, a single
+DELETE ... OUTPUT INTO on Azure SQL), with a pause between batches so the
+requests' writes get the lock in between. The owners' task_version is
+bumped in the same transaction, so cached lists and ETags move on too.
+Archived tasks keep their ids; the archived view reads them on demand and
+a restore moves one back (see task_repository.py).
+
+To the change feed an archived task is gone from the list, so it leaves a
+tombstone like a deleted one. The job also purges tombstones older than
+TASK_TOMBSTONE_DAYS; change feed cursors that old must sync again from
+scratch.
+"""
+import logging
+import os
+import threading
+import time
+
+from database import AzureSQLConnection, bump_task_version, get_schema, next_task_version_sql, task_pools
+from metrics import run_query
+
+logger = logging.getLogger(__name__)
+
+# Columns tasks and tasks_archive share; archived_at takes its default
+ARCHIVE_COLUMNS = "id, title, description, completed, priority, category, due_date, created_at, user_id, completed_at"
+
+# Tasks whose completion is older than the cutoff, on the database clock
+SQLITE_OLD_COMPLETED = "completed = 1 AND completed_at < datetime('now', ?)"
+AZURE_OLD_COMPLETED = "completed = 1 AND completed_at < DATEADD(day, ?, CURRENT_TIMESTAMP)"
+
+SQLITE_PURGE_TOMBSTONES = ("DELETE FROM task_tombstones WHERE id IN "
+                           "(SELECT id FROM task_tombstones WHERE deleted_at < datetime('now', ?) LIMIT {limit})")
+AZURE_PURGE_TOMBSTONES = ("DELETE TOP ({limit}) FROM task_tombstones "
+                          "WHERE deleted_at < DATEADD(day, ?, CURRENT_TIMESTAMP)")
+
+
+def archive_batch(conn, max_age_days, batch_size, tombstones=False):
+    """
+    Move up to batch_size old completed tasks to tasks_archive and commit
+
+    Args:
+        conn: Connection to a database holding tasks (the primary or a shard)
+        max_age_days: Days since completion after which a task is archived
+        batch_size: Most tasks moved by this call
+        tombstones: Leave a tombstone for each moved task (migration 9)
+
+    Returns:
+        (number of tasks moved, set of their owners' ids)
+    """
+    azure = isinstance(conn, AzureSQLConnection)
+    if azure:
+        old, age = AZURE_OLD_COMPLETED, -max_age_days
+        select_sql = f"SELECT TOP {batch_size} id, user_id FROM tasks WHERE {old} ORDER BY completed_at"
+    else:
+        old, age = SQLITE_OLD_COMPLETED, f"-{max_age_days} days"
+        select_sql = f"SELECT id, user_id FROM tasks WHERE {old} ORDER BY completed_at LIMIT {batch_size}"
+    cursor = conn.cursor()
+    try:
+        # Read outside the write transaction; the moves check the age again under it
+        rows = run_query(cursor, 'archive_select', select_sql, (age,), fetch='all')
+        if not rows:
+            return 0, set()
+        ids = [row[0] for row in rows]
+        owners = {row[1] for row in rows}
+        where = f"id IN ({', '.join('?' * len(ids))}) AND {old}"
+        params = ids + [age]
+        if tombstones:
+            run_query(
+                cursor, 'archive_tombstone',
+                f"INSERT INTO task_tombstones (id, user_id, change_version) "
+                f"SELECT id, user_id, {next_task_version_sql('tasks.user_id')} FROM tasks WHERE {where}",
+                params
+            )
+        if azure:
+            moved = run_query(
+                cursor, 'archive_move',
+                f"DELETE FROM tasks OUTPUT {', '.join('DELETED.' + c for c in ARCHIVE_COLUMNS.split(', '))} "
+                f"INTO tasks_archive ({ARCHIVE_COLUMNS}) WHERE {where}",
+                params
+            ).rowcount
+        else:
+            # The first INSERT takes the write lock (IMMEDIATE), so the DELETE matches the same rows
+            run_query(
+                cursor, 'archive_copy',
+                f"INSERT INTO tasks_archive ({ARCHIVE_COLUMNS}) SELECT {ARCHIVE_COLUMNS} FROM tasks WHERE {where}",
+                params
+            )
+            moved = run_query(cursor, 'archive_move', f"DELETE FROM tasks WHERE {where}", params).rowcount
+        for user_id in owners:
+            bump_task_version(cursor, user_id)
+        conn.commit()
+        return moved, owners
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def purge_tombstones(conn, max_age_days, batch_size):
+    """
+    Delete up to batch_size tombstones older than max_age_days and commit
+
+    Returns:
+        Number of tombstones deleted
+    """
+    azure = isinstance(conn, AzureSQLConnection)
+    if azure:
+        sql, age = AZURE_PURGE_TOMBSTONES.format(limit=batch_size), -max_age_days
+    else:
+        sql, age = SQLITE_PURGE_TOMBSTONES.format(limit=batch_size), f"-{max_age_days} days"
+    cursor = conn.cursor()
+    try:
+        purged = run_query(cursor, 'purge_tombstones', sql, (age,)).rowcount
+        conn.commit()
+        return purged
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+class ArchiveJob:
+    """Per-worker background mover of old completed tasks into tasks_archive (and tombstone purger)"""
+
+    def __init__(self, max_age_days=0, batch_size=500, interval=3600, pause=0.05, on_archive=None,
+                 tombstone_days=0):
+        """
+        Args:
+            max_age_days: Days since completion after which tasks move; 0 disables archiving
+            batch_size: Tasks moved (or tombstones purged) per transaction
+            interval: Seconds between runs
+            pause: Seconds to wait between batches
+            on_archive: Optional callable(set of user ids) run after each batch,
+                e.g. to drop the owners' cached lists
+            tombstone_days: Days change feed tombstones are kept; 0 keeps them
+        """
+        self.max_age_days = max_age_days
+        self.tombstone_days = tombstone_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pause = pause
+        self.on_archive = on_archive
+        self._lock = threading.Lock()
+        self._thread_pid = None
+
+    @property
+    def enabled(self):
+        return (self.max_age_days > 0 or self.tombstone_days > 0) and self.batch_size > 0
+
+    def _batches(self, pool, batch):
+        """Run batch(conn) on a pool until it handles less than a full batch; returns the total"""
+        total = 0
+        while True:
+            conn = pool.acquire()
+            try:
+                done = batch(conn)
+            finally:
+                pool.release(conn)
+            total += done
+            if done < self.batch_size:
+                return total
+            time.sleep(self.pause)
+
+    def _archive(self, conn, tombstones):
+        moved, owners = archive_batch(conn, self.max_age_days, self.batch_size, tombstones)
+        if owners and self.on_archive:
+            self.on_archive(owners)
+        return moved
+
+    def run_once(self):
+        """
+        Archive every eligible task and purge expired tombstones now, batch by batch
+
+        Returns:
+            Number of tasks moved
+        """
+        schema = get_schema()
+        if not self.enabled or not schema.has_archive:
+            return 0
+        total = purged = 0
+        for pool in task_pools():
+            if self.max_age_days > 0:
+                total += self._batches(pool, lambda conn: self._archive(conn, schema.has_change_feed))
+            if self.tombstone_days > 0 and schema.has_change_feed:
+                purged += self._batches(pool, lambda conn: purge_tombstones(conn, self.tombstone_days,
+                                                                            self.batch_size))
+        if total:
+            logger.info(f"Archived {total} tasks completed over {self.max_age_days} days ago")
+        if purged:
+            logger.info(f"Purged {purged} change feed tombstones older than {self.tombstone_days} days")
+        return total
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.warning(f"Task archiving failed: {e}")
+
+    def start(self):
+        """Start the background thread once per process (threads do not survive fork)"""
+        if not self.enabled:
+            return
+        pid = os.getpid()
+        with self._lock:
+            if self._thread_pid == pid:
+                return
+            self._thread_pid = pid
+        threading.Thread(target=self._run, name='task-archive', daemon=True).start()
@@ -0,0 +1,11 @@
+"""
+Performance benchmarks for the task manager
+
+- run: per-route throughput and p50/p95/p99 latency, in-process or against
+  gunicorn, with JSON baselines for regression checks
+- roundtrips: SQL statements and connections per request
+- throughput: requests/s of each gunicorn worker profile
+- memory: tracemalloc cost of task list rows (dicts vs Task objects)
+- render: /tasks response size, render time and template load time
+- login_storm: /tasks latency during a burst of logins
+"""
@@ -0,0 +1,117 @@
+"""
+Clients that drive the app in-process (Flask test client) or over HTTP
+(a local gunicorn), with the same interface
+"""
+import contextlib
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.parse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class InProcessClient:
+    """Flask test client; redirects are not followed"""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, data=None, headers=None):
+        """Return (status, response headers)"""
+        response = self._client.open(path, method=method, data=data, headers=headers or {})
+        response.close()
+        return response.status_code, response.headers
+
+    def login(self, username, password):
+        status, _ = self.request('POST', '/login', {'username': username, 'password': password})
+        if status != 302:
+            raise RuntimeError(f"Login as {username} failed ({status})")
+
+
+class HTTPClient:
+    """Keep-alive HTTP/1.1 client holding one session cookie"""
+
+    def __init__(self, port, host='127.0.0.1'):
+        self.host = host
+        self.port = port
+        self.cookie = None
+        self._conn = None
+
+    def request(self, method, path, data=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        for attempt in (1, 2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self._conn.request(method, path, body, headers)
+                response = self._conn.getresponse()
+                response.read()
+                return response.status, response.headers
+            except (OSError, http.client.HTTPException):
+                # The worker may have closed an idle keep-alive connection
+                self._conn.close()
+                self._conn = None
+                if attempt == 2:
+                    raise
+
+    def login(self, username, password):
+        status, headers = self.request('POST', '/login', {'username': username, 'password': password})
+        cookie = headers.get('Set-Cookie')
+        if status != 302 or not cookie:
+            raise RuntimeError(f"Login as {username} failed ({status})")
+        self.cookie = cookie.split(';', 1)[0]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    """Block until /health answers 200"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if HTTPClient(port).request('GET', '/health')[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"gunicorn did not become healthy on port {port}")
+
+
+@contextlib.contextmanager
+def gunicorn(env, profile='sync'):
+    """Run gunicorn with gunicorn_config.py and yield its port"""
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_config.py', '--bind', f'127.0.0.1:{port}',
+         '--access-logfile', '/dev/null', '--log-level', 'warning', 'app:app'],
+        cwd=ROOT, env=dict(env, GUNICORN_PROFILE=profile),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for(port)
+        yield port
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(len(ordered) * pct / 100.0)) - 1))]
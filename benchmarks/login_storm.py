@@ -0,0 +1,76 @@
+"""
+Measure /tasks latency while a burst of logins hits the same gunicorn
+
+Starts gunicorn on a seeded throwaway SQLite database, keeps --storm clients
+logging in back to back (backing off for Retry-After on a 503), and times
+GET /tasks from one logged-in client meanwhile. Run it with different
+PASSWORD_HASH_* settings in the environment to compare them.
+
+Usage:
+    python -m benchmarks.login_storm [--profile gthread] [--storm 16] [--duration 8]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from benchmarks.clients import HTTPClient, gunicorn, percentile
+from benchmarks.seed import DEFAULT_PASSWORD, seed, username
+
+
+def storm(port, stop_at, statuses, lock):
+    client = HTTPClient(port)
+    while time.monotonic() < stop_at:
+        client.cookie = None
+        status, headers = client.request('POST', '/login', {'username': username(0), 'password': DEFAULT_PASSWORD})
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+        if status == 503:
+            time.sleep(float(headers.get('Retry-After', 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profile', default='gthread')
+    parser.add_argument('--storm', type=int, default=16, help='clients logging in concurrently')
+    parser.add_argument('--duration', type=float, default=8, help='seconds of storm')
+    parser.add_argument('--tasks', type=int, default=200, help='tasks to seed')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='login-storm-')
+    db_path = os.path.join(workdir, 'bench.db')
+    seed(db_path, 1, args.tasks)
+    env = dict(os.environ, DB_TYPE='sqlite', ENVIRONMENT='development', SQLITE_DATABASE=db_path,
+               TASK_CACHE_BACKEND='none')
+
+    with gunicorn(env, args.profile) as port:
+        reader = HTTPClient(port)
+        reader.login(username(0), DEFAULT_PASSWORD)
+        statuses, lock = {}, threading.Lock()
+        stop_at = time.monotonic() + args.duration
+        clients = [threading.Thread(target=storm, args=(port, stop_at, statuses, lock)) for _ in range(args.storm)]
+        for t in clients:
+            t.start()
+        time.sleep(1)  # let the storm build up
+        latencies = []
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            reader.request('GET', '/tasks')
+            latencies.append(time.perf_counter() - start)
+        for t in clients:
+            t.join()
+
+    settings = ', '.join(f"{name}={os.environ[name]}" for name in sorted(os.environ) if name.startswith('PASSWORD_HASH_'))
+    print(f"{args.profile}, {args.storm} login clients, {settings or 'default PASSWORD_HASH_* settings'}")
+    print(f"GET /tasks: {len(latencies)} requests, p50 {percentile(latencies, 50) * 1000:.0f} ms, "
+          f"p95 {percentile(latencies, 95) * 1000:.0f} ms")
+    print(f"POST /login: {statuses.get(302, 0)} succeeded, {statuses.get(503, 0)} shed (503)")
+
+
+if __name__ == '__main__':
+    main()
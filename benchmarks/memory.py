@@ -0,0 +1,108 @@
+"""
+Compare the memory cost of task list rows
+
+Seeds a throwaway SQLite database and loads every task of one user with the
+task list query twice: as the old sqlite3.Row -> dict -> task dict chain
+and as Task objects from the task_row() row factory. tracemalloc reports the
+memory the loaded list retains and the peak while building it.
+
+Usage:
+    python -m benchmarks.memory [--tasks 10000,100000]
+"""
+import argparse
+import gc
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: F401  (registers the DATETIME adapter and converter)
+from database import SchemaInfo
+from migrations import LATEST_VERSION
+from task_queries import TaskFilters, build_task_list_query, task_row
+from benchmarks.seed import seed
+
+SCHEMA = SchemaInfo('sqlite', ['user_id', 'priority_rank'], LATEST_VERSION, search='fts5')
+
+
+def load_dicts(conn, sql, params):
+    """The previous shape: a sqlite3.Row, a dict copy and a task dict per row"""
+    conn.row_factory = sqlite3.Row
+    cursor = conn.execute(sql, params)
+    rows = cursor.fetchall()
+    tasks = []
+    for row in rows:
+        raw = dict(row)
+        task = {
+            'id': raw.get('id'),
+            'title': raw.get('title', ''),
+            'description': raw.get('description', ''),
+            'completed': bool(raw.get('completed')),
+            'created_at': raw.get('created_at'),
+            'due_date': raw.get('due_date'),
+            'priority': raw.get('priority', 'Medium'),
+            'category': raw.get('category', 'General'),
+            'priority_rank': raw.get('priority_rank', 2),
+            'is_overdue': bool(raw.get('is_overdue')),
+            'is_due_today': bool(raw.get('is_due_today')),
+        }
+        tasks.append((task, raw.get('sort_key')))
+    return tasks
+
+
+def load_tasks(conn, sql, params):
+    """Task objects straight from the cursor"""
+    cursor = conn.cursor()
+    cursor.row_factory = task_row
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+
+def measure(loader, conn, sql, params):
+    """Return (retained bytes, peak bytes, seconds, pickled page bytes)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = loader(conn, sql, params)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pickled = len(pickle.dumps([task for task, _ in result]))
+    del result
+    return current - before, peak - before, elapsed, pickled
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', default='10000,100000', help='comma-separated task counts')
+    args = parser.parse_args()
+
+    print("| Tasks | Rows as | Retained MiB | Bytes/task | Peak MiB | Load ms | Pickled bytes/task |")
+    print("|-------|---------|--------------|------------|----------|---------|--------------------|")
+    for count in (int(n) for n in args.tasks.split(',')):
+        path = os.path.join(tempfile.mkdtemp(prefix='memory-'), 'bench.db')
+        seed(path, 1, count)
+        filters = TaskFilters()
+        # Past MAX_PAGE_SIZE on purpose: one page holding every task
+        filters.page_size = count
+        sql, params, _ = build_task_list_query(SCHEMA, 1, filters, now=datetime.now())
+        conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+        try:
+            for label, loader in (('dicts', load_dicts), ('Task', load_tasks)):
+                retained, peak, elapsed, pickled = measure(loader, conn, sql, params)
+                print(f"| {count} | {label} | {retained / 2**20:.1f} | {retained / count:.0f} | "
+                      f"{peak / 2**20:.1f} | {elapsed * 1000:.0f} | {pickled / count:.0f} |")
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
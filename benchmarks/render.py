@@ -0,0 +1,79 @@
+"""
+Measure task list rendering: response size, render time and template compile time
+
+Seeds a throwaway SQLite database, renders /tasks through the Flask test
+client at several page sizes (task cache off, so each request queries and
+renders), and times compiling index.html from source against loading it
+from a warm Jinja bytecode cache, as a freshly recycled worker would.
+
+Usage:
+    python -m benchmarks.render [--tasks 500] [--per-page 50,200] [--requests 50]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from jinja2 import Environment, FileSystemBytecodeCache
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from benchmarks.clients import InProcessClient, percentile
+from benchmarks.run import configure_environment, load_inprocess_app
+from benchmarks.seed import DEFAULT_PASSWORD, seed, username
+
+
+def compile_times(loader, repeats=20):
+    """Return (ms to compile index.html from source, ms to load it from a warm bytecode cache)"""
+    cache = FileSystemBytecodeCache(tempfile.mkdtemp(prefix='jinja-'))
+    Environment(loader=loader, bytecode_cache=cache).get_template('index.html')
+    timings = {'source': [], 'bytecode': []}
+    for _ in range(repeats):
+        for label, bytecode_cache in (('source', None), ('bytecode', cache)):
+            # A new environment has an empty in-memory template cache, like a new worker
+            env = Environment(loader=loader, bytecode_cache=bytecode_cache)
+            start = time.perf_counter()
+            env.get_template('index.html')
+            timings[label].append(time.perf_counter() - start)
+    return percentile(timings['source'], 50) * 1000, percentile(timings['bytecode'], 50) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=500, help='tasks to seed')
+    parser.add_argument('--per-page', default='50,200', help='comma-separated page sizes')
+    parser.add_argument('--requests', type=int, default=50, help='renders per page size')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='render-')
+    db_path, _ = configure_environment(workdir, 'none')
+    seed(db_path, 1, args.tasks)
+    app = load_inprocess_app('none')
+    client = InProcessClient(app)
+    client.login(username(0), DEFAULT_PASSWORD)
+
+    print("| Tasks on page | Bytes/response | Bytes/task | p50 ms | p95 ms |")
+    print("|---------------|----------------|------------|--------|--------|")
+    for per_page in (int(n) for n in args.per_page.split(',')):
+        path = f'/tasks?per_page={per_page}'
+        client.request('GET', path)
+        timings = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            status, headers = client.request('GET', path)
+            timings.append(time.perf_counter() - start)
+            if status != 200:
+                raise RuntimeError(f"GET {path} answered {status}")
+        size = int(headers['Content-Length'])
+        print(f"| {per_page} | {size} | {size / per_page:.0f} | "
+              f"{percentile(timings, 50) * 1000:.1f} | {percentile(timings, 95) * 1000:.1f} |")
+
+    source_ms, bytecode_ms = compile_times(app.jinja_env.loader)
+    print(f"\nindex.html load in a new worker: {source_ms:.1f} ms compiled from source, "
+          f"{bytecode_ms:.1f} ms from the bytecode cache")
+
+
+if __name__ == '__main__':
+    main()
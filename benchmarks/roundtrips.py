@@ -0,0 +1,99 @@
+"""
+Count database round-trips per request
+
+Seeds a throwaway SQLite database, drives the real routes through the Flask
+test client and records how many SQL statements and new connections each
+request costs. Every statement is a network round-trip against Azure SQL.
+
+Usage:
+    python -m benchmarks.roundtrips [--tasks 200]
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from benchmarks.seed import DEFAULT_PASSWORD, seed, username
+
+
+class StatementCounter:
+    """Wraps sqlite3.connect to count connections and traced statements"""
+
+    def __init__(self):
+        self.connections = 0
+        self.statements = []
+        self._connect = sqlite3.connect
+
+    def connect(self, *args, **kwargs):
+        conn = self._connect(*args, **kwargs)
+        self.connections += 1
+        conn.set_trace_callback(self._trace)
+        return conn
+
+    def _trace(self, statement):
+        # Triggers and the FTS5 module run their own SQL inside the client's
+        # statement: trigger bodies trace as '-- ...', FTS5 shadow-table SQL
+        # names 'main'.x, and the outer statement is re-traced per trigger.
+        if statement.startswith('--') or "'main'." in statement:
+            return
+        if self.statements and self.statements[-1] == statement:
+            return
+        self.statements.append(statement)
+
+    def reset(self):
+        self.connections = 0
+        del self.statements[:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=200, help='tasks to seed for the user')
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    workdir = tempfile.mkdtemp(prefix='roundtrips-')
+    db_path = os.path.join(workdir, 'bench.db')
+    os.environ['SQLITE_DATABASE'] = db_path
+    # Keep the task cache out of the traced sqlite3 connections
+    os.environ['TASK_CACHE_BACKEND'] = 'memory'
+    task_ids = seed(db_path, 1, args.tasks)[username(0)]
+
+    counter = StatementCounter()
+    sqlite3.connect = counter.connect
+
+    from config import Config
+    Config.SQLITE_DATABASE = db_path
+    logging.disable(logging.INFO)
+    from app import app
+    app.config['TESTING'] = True
+    client = app.test_client()
+
+    def measure(label, fn):
+        counter.reset()
+        response = fn()
+        print(f"| {label:<22} | {response.status_code:>6} | {len(counter.statements):>10} | {counter.connections:>11} |")
+
+    print(f"Round-trips per request ({args.tasks} tasks)\n")
+    print("| Request                | Status | Statements | Connections |")
+    print("|------------------------|--------|------------|-------------|")
+    measure('POST /login', lambda: client.post('/login', data={'username': username(0), 'password': DEFAULT_PASSWORD}))
+    measure('GET /tasks', lambda: client.get('/tasks'))
+    measure('GET /tasks (cached)', lambda: client.get('/tasks'))
+    etag = client.get('/api/tasks').headers['ETag']
+    measure('GET /api/tasks', lambda: client.get('/api/tasks?fields=id,title'))
+    measure('GET /api/tasks (304)', lambda: client.get('/api/tasks', headers={'If-None-Match': etag}))
+    measure('GET /tasks?status=...', lambda: client.get('/tasks?status=pending&sort=created_desc'))
+    measure('POST /task/add', lambda: client.post('/task/add', data={'title': 'Bench task'}))
+    measure('POST /task/<id>/toggle', lambda: client.post(f'/task/{task_ids[0]}/toggle'))
+    measure('POST /task/<id>/edit', lambda: client.post(f'/task/{task_ids[0]}/edit', data={'title': 'Edited'}))
+    measure('POST /task/<id>/delete', lambda: client.post(f'/task/{task_ids[1]}/delete'))
+    measure('GET /health', lambda: client.get('/health'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+"""
+Per-route load and latency benchmark
+
+Seeds users × tasks into a throwaway SQLite database, then drives every
+route in turn with concurrent clients, either in-process through the Flask
+test client or over HTTP against a local gunicorn. Reports requests/s and
+p50/p95/p99 latency per route, and can save the results as a JSON baseline
+or compare them against one.
+
+Usage:
+    python -m benchmarks.run [--mode inprocess|gunicorn] [--users 10] [--tasks 500]
+                             [--clients 4] [--requests 200] [--routes tasks,add]
+                             [--save baseline.json] [--compare baseline.json --threshold 0.2]
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from benchmarks.clients import HTTPClient, InProcessClient, gunicorn, percentile
+from benchmarks.seed import DEFAULT_PASSWORD, WORDS, seed, username
+
+
+class UserState:
+    """One benchmark client's user, its task ids and per-client randomness"""
+
+    def __init__(self, name, task_ids, random_seed):
+        self.username = name
+        self.password = DEFAULT_PASSWORD
+        self.task_ids = list(task_ids)
+        self.rng = random.Random(random_seed)
+        self.etag = None
+        self.client = None
+
+    def pick(self):
+        return self.rng.choice(self.task_ids) if self.task_ids else 0
+
+    def take(self):
+        """Remove and return a task id (for deletes)"""
+        if not self.task_ids:
+            return 0
+        return self.task_ids.pop(self.rng.randrange(len(self.task_ids)))
+
+    def task_form(self):
+        return {
+            'title': ' '.join(self.rng.choice(WORDS) for _ in range(3)).capitalize(),
+            'description': ' '.join(self.rng.choice(WORDS) for _ in range(8)),
+            'priority': self.rng.choice(('High', 'Medium', 'Low')),
+            'category': self.rng.choice(('Work', 'Home', 'Personal')),
+            'due_date': '2030-01-01T09:00',
+        }
+
+
+class Route:
+    """A request to time; path, data and headers may be callables of UserState"""
+
+    def __init__(self, name, method, path, data=None, headers=None, anonymous=False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.headers = headers
+        self.anonymous = anonymous
+
+    def build(self, state):
+        resolve = lambda value: value(state) if callable(value) else value
+        return resolve(self.path), resolve(self.data), resolve(self.headers)
+
+
+# Reads first, then writes, so conditional GETs still match their ETags
+ROUTES = [
+    Route('login', 'POST', '/login', data=lambda s: {'username': s.username, 'password': s.password},
+          anonymous=True),
+    Route('tasks', 'GET', '/tasks'),
+    Route('tasks_pending', 'GET', '/tasks?status=pending'),
+    Route('tasks_completed', 'GET', '/tasks?status=completed'),
+    Route('tasks_overdue', 'GET', '/tasks?status=overdue'),
+    Route('tasks_today', 'GET', '/tasks?status=today'),
+    Route('tasks_category', 'GET', '/tasks?category=Work'),
+    Route('tasks_search', 'GET', '/tasks?q=report'),
+    Route('tasks_search_relevance', 'GET', '/tasks?q=report&sort=relevance'),
+    Route('tasks_priority_asc', 'GET', '/tasks?sort=priority_asc'),
+    Route('tasks_created_desc', 'GET', '/tasks?sort=created_desc'),
+    Route('tasks_created_asc', 'GET', '/tasks?sort=created_asc'),
+    Route('api_tasks', 'GET', '/api/tasks'),
+    Route('api_tasks_304', 'GET', '/api/tasks', headers=lambda s: {'If-None-Match': s.etag or ''}),
+    Route('add', 'POST', '/task/add', data=lambda s: s.task_form()),
+    Route('toggle', 'POST', lambda s: f'/task/{s.pick()}/toggle'),
+    Route('edit', 'POST', lambda s: f'/task/{s.pick()}/edit', data=lambda s: s.task_form()),
+    Route('delete', 'POST', lambda s: f'/task/{s.take()}/delete'),
+    Route('health', 'GET', '/health'),
+]
+
+
+def configure_environment(workdir, cache):
+    """Point the app at the benchmark database before (or after) it is imported"""
+    db_path = os.path.join(workdir, 'bench.db')
+    env = {
+        'DB_TYPE': 'sqlite',
+        'ENVIRONMENT': 'development',
+        'SQLITE_DATABASE': db_path,
+        'TASK_CACHE_BACKEND': cache,
+        'TASK_CACHE_PATH': os.path.join(workdir, 'cache.db'),
+    }
+    os.environ.update(env)
+    return db_path, dict(os.environ)
+
+
+def load_inprocess_app(cache):
+    """Import the app for in-process runs, re-pointing it if it was already imported"""
+    os.chdir(ROOT)
+    logging.disable(logging.INFO)
+    from config import Config
+    import database
+
+    Config.SQLITE_DATABASE = os.environ['SQLITE_DATABASE']
+    database.dispose_pool()
+    import app as app_module
+    from cache import create_backend
+
+    app_module.task_cache.backend = create_backend(
+        cache, Config.TASK_CACHE_TTL, Config.TASK_CACHE_MAX_ENTRIES, Config.TASK_CACHE_MAX_BYTES,
+        os.environ['TASK_CACHE_PATH']
+    )
+    app_module.app.config['TESTING'] = True
+    return app_module.app
+
+
+def run_route(route, states, requests, make_client):
+    """Issue `requests` requests of one route spread over the clients"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(state, count):
+        own = []
+        failed = []
+        for _ in range(count):
+            client = make_client() if route.anonymous else state.client
+            path, data, headers = route.build(state)
+            start = time.perf_counter()
+            try:
+                status, _ = client.request(route.method, path, data, headers)
+            except Exception as exc:
+                failed.append(type(exc).__name__)
+                continue
+            own.append(time.perf_counter() - start)
+            if status >= 400:
+                failed.append(status)
+        with lock:
+            latencies.extend(own)
+            errors.extend(failed)
+
+    counts = [requests // len(states) + (1 if i < requests % len(states) else 0) for i in range(len(states))]
+    threads = [threading.Thread(target=worker, args=(state, count)) for state, count in zip(states, counts)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / wall, 1) if wall else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run(mode='inprocess', users=10, tasks=500, clients=4, requests=200, routes=None,
+        profile='sync', cache='none', random_seed=0):
+    """
+    Seed a database and benchmark each route
+
+    Returns:
+        {'meta': {...}, 'routes': {name: {requests, errors, rps, mean_ms, p50_ms, p95_ms, p99_ms}}}
+    """
+    selected = [r for r in ROUTES if routes is None or r.name in routes]
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    db_path, env = configure_environment(workdir, cache)
+    task_ids = seed(db_path, users, tasks, random_seed=random_seed)
+    states = [UserState(username(i % users), task_ids[username(i % users)], random_seed + i) for i in range(clients)]
+
+    results = {}
+    with (gunicorn(env, profile) if mode == 'gunicorn' else contextlib.nullcontext()) as port:
+        if mode == 'gunicorn':
+            make_client = lambda: HTTPClient(port)
+        else:
+            app = load_inprocess_app(cache)
+            make_client = lambda: InProcessClient(app)
+        for state in states:
+            state.client = make_client()
+            state.client.login(state.username, state.password)
+            _, headers = state.client.request('GET', '/api/tasks')
+            state.etag = headers.get('ETag')
+        for route in selected:
+            results[route.name] = run_route(route, states, requests, make_client)
+
+    return {
+        'meta': {
+            'mode': mode, 'profile': profile if mode == 'gunicorn' else None, 'cache': cache,
+            'users': users, 'tasks_per_user': tasks, 'clients': clients, 'requests_per_route': requests,
+            'python': platform.python_version(), 'cpus': os.cpu_count(), 'git': _git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+        },
+        'routes': results,
+    }
+
+
+def compare(baseline, current, threshold=0.2):
+    """
+    Diff a run against a baseline
+
+    A route regresses when its p95 latency grows, or its throughput drops,
+    by more than threshold (a fraction).
+
+    Returns:
+        (rows, regressed route names); rows are (route, base p95, p95, p95 change, base rps, rps, rps change)
+    """
+    rows = []
+    regressed = []
+    for name, cur in current['routes'].items():
+        base = baseline['routes'].get(name)
+        if not base:
+            continue
+        p95_change = cur['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0.0
+        rps_change = cur['rps'] / base['rps'] - 1 if base['rps'] else 0.0
+        rows.append((name, base['p95_ms'], cur['p95_ms'], p95_change, base['rps'], cur['rps'], rps_change))
+        if p95_change > threshold or rps_change < -threshold:
+            regressed.append(name)
+    return rows, regressed
+
+
+def print_results(result):
+    meta = result['meta']
+    print(f"{meta['mode']}{' (' + meta['profile'] + ')' if meta['profile'] else ''}: "
+          f"{meta['users']} users x {meta['tasks_per_user']} tasks, {meta['clients']} clients, "
+          f"{meta['requests_per_route']} requests/route, cache={meta['cache']}, {meta['cpus']} CPU(s)\n")
+    print("| Route | Requests/s | p50 ms | p95 ms | p99 ms | Errors |")
+    print("|-------|------------|--------|--------|--------|--------|")
+    for name, r in result['routes'].items():
+        print(f"| {name} | {r['rps']:.0f} | {r['p50_ms']:.1f} | {r['p95_ms']:.1f} | {r['p99_ms']:.1f} | {r['errors']} |")
+
+
+SETTINGS = ('mode', 'profile', 'cache', 'users', 'tasks_per_user', 'clients', 'requests_per_route', 'cpus')
+
+
+def setting_differences(baseline, current):
+    """Return 'name: base -> now' for run settings that differ from the baseline"""
+    return [f"{key}: {baseline['meta'].get(key)} -> {current['meta'].get(key)}"
+            for key in SETTINGS if baseline['meta'].get(key) != current['meta'].get(key)]
+
+
+def print_comparison(rows, regressed, threshold):
+    print(f"\nAgainst baseline (regression = p95 +{threshold:.0%} or requests/s -{threshold:.0%}):\n")
+    print("| Route | p95 ms (base → now) | Change | Requests/s (base → now) | Change | |")
+    print("|-------|---------------------|--------|-------------------------|--------|--|")
+    for name, base_p95, p95, p95_change, base_rps, rps, rps_change in rows:
+        flag = 'REGRESSION' if name in regressed else ''
+        print(f"| {name} | {base_p95:.1f} → {p95:.1f} | {p95_change:+.0%} | "
+              f"{base_rps:.0f} → {rps:.0f} | {rps_change:+.0%} | {flag} |")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=['inprocess', 'gunicorn'], default='inprocess')
+    parser.add_argument('--profile', default='sync', help='GUNICORN_PROFILE for --mode gunicorn')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--tasks', type=int, default=500, help='tasks per user')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--routes', help='comma-separated route names (default: all)')
+    parser.add_argument('--cache', choices=['sqlite', 'memory', 'none'], default='none',
+                        help='task list cache backend (default none: measure the database path)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for data and requests')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON to diff against; exits 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p95/throughput change')
+    args = parser.parse_args(argv)
+
+    if args.routes:
+        known = {r.name for r in ROUTES}
+        unknown = set(args.routes.split(',')) - known
+        if unknown:
+            parser.error(f"unknown routes: {', '.join(sorted(unknown))} (known: {', '.join(r.name for r in ROUTES)})")
+
+    result = run(args.mode, args.users, args.tasks, args.clients, args.requests,
+                 args.routes.split(',') if args.routes else None, args.profile, args.cache, args.seed)
+    print_results(result)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nSaved {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        differences = setting_differences(baseline, result)
+        if differences:
+            print("\nWARNING: baseline was recorded with different settings; numbers are not comparable")
+            for line in differences:
+                print(f"  {line}")
+        rows, regressed = compare(baseline, result, args.threshold)
+        print_comparison(rows, regressed, args.threshold)
+        if regressed:
+            print(f"\n{len(regressed)} route(s) regressed: {', '.join(regressed)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Seed a throwaway SQLite database with realistic users and tasks
+"""
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+import migrations
+from task_queries import SQLITE_DATETIME_FORMAT
+
+DEFAULT_PASSWORD = 'benchpass'
+
+# (value, weight)
+CATEGORIES = [('Work', 30), ('Home', 15), ('Personal', 15), ('Shopping', 10),
+              ('Health', 8), ('Finance', 7), ('General', 15)]
+PRIORITIES = [('High', 20), ('Medium', 55), ('Low', 25)]
+WORDS = ('report invoice meeting groceries dentist budget review deploy email call plan '
+         'taxes receipts gym laundry renew passport book flight backup server draft slides '
+         'pay rent fix bug update docs order pizza clean garage water plants').split()
+
+
+def username(index):
+    """Name of the index-th benchmark user"""
+    return f'bench{index}'
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high))).capitalize()
+
+
+def _task(rng, now):
+    """One task row: title, description, completed, created_at, due_date, priority, category"""
+    created = now - timedelta(days=rng.uniform(0, 90))
+    roll = rng.random()
+    if roll < 0.3:
+        due = None
+    elif roll < 0.4:
+        # Due later today
+        due = now.replace(hour=rng.randint(now.hour, 23), minute=rng.choice((0, 15, 30, 45)), second=0, microsecond=0)
+    else:
+        due = (now + timedelta(days=rng.randint(-14, 30))).replace(
+            hour=rng.randint(8, 18), minute=rng.choice((0, 30)), second=0, microsecond=0)
+    return (
+        _sentence(rng, 2, 5),
+        _sentence(rng, 0, 12),
+        1 if rng.random() < 0.35 else 0,
+        created.strftime(SQLITE_DATETIME_FORMAT),
+        due.strftime(SQLITE_DATETIME_FORMAT) if due else None,
+        _weighted(rng, PRIORITIES),
+        _weighted(rng, CATEGORIES),
+    )
+
+
+def seed(path, users=1, tasks_per_user=200, password=DEFAULT_PASSWORD, random_seed=0, now=None):
+    """
+    Create the schema and users × tasks at path
+
+    Args:
+        path: SQLite file to create (must not exist yet)
+        users: Number of users (bench0, bench1, ...)
+        tasks_per_user: Tasks created for each user
+        password: Password of every benchmark user
+        random_seed: Seed for reproducible data
+        now: Reference time for created/due dates
+
+    Returns:
+        Dict of username -> list of that user's task ids
+    """
+    rng = random.Random(random_seed)
+    now = now or datetime.now()
+    password_hash = generate_password_hash(password)
+    conn = sqlite3.connect(path)
+    try:
+        migrations.upgrade(conn, 'sqlite')
+        task_ids = {}
+        for index in range(users):
+            name = username(index)
+            cursor = conn.execute(
+                "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+                (name, f'{name}@example.com', password_hash)
+            )
+            user_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO tasks (title, description, completed, created_at, due_date, priority, category, user_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [_task(rng, now) + (user_id,) for _ in range(tasks_per_user)]
+            )
+            task_ids[name] = [row[0] for row in conn.execute("SELECT id FROM tasks WHERE user_id = ?", (user_id,))]
+        conn.commit()
+        return task_ids
+    finally:
+        conn.close()
@@ -0,0 +1,105 @@
+"""
+Compare gunicorn worker profiles under concurrent load
+
+Starts gunicorn once per profile (GUNICORN_PROFILE) on a seeded throwaway
+SQLite database, or on the Azure SQL database configured in the environment
+with --backend azure_sql, then drives it with concurrent HTTP clients and
+reports requests per second and latency percentiles.
+
+Usage:
+    python -m benchmarks.throughput [--profiles sync,gthread,gevent] [--clients 32]
+                                    [--duration 10] [--write-ratio 0.1] [--backend sqlite]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from benchmarks.clients import HTTPClient, gunicorn, percentile
+from benchmarks.seed import DEFAULT_PASSWORD, seed, username
+
+
+def client_loop(port, cookie, stop_at, write_ratio, latencies, errors):
+    client = HTTPClient(port)
+    client.cookie = cookie
+    rng = random.Random()
+    while time.monotonic() < stop_at:
+        start = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                status, _ = client.request('POST', '/task/add', {'title': f'Load task {rng.randrange(10**6)}'})
+            else:
+                status, _ = client.request('GET', '/tasks')
+        except Exception as exc:
+            errors.append(type(exc).__name__)
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status >= 400:
+            errors.append(status)
+
+
+def run_profile(profile, args, env):
+    with gunicorn(env, profile) as port:
+        login = HTTPClient(port)
+        login.login(args.username, args.password)
+        latencies, errors = [], []
+        stop_at = time.monotonic() + args.duration
+        clients = [threading.Thread(target=client_loop,
+                                    args=(port, login.cookie, stop_at, args.write_ratio, latencies, errors))
+                   for _ in range(args.clients)]
+        for t in clients:
+            t.start()
+        for t in clients:
+            t.join()
+    return {
+        'profile': profile,
+        'requests': len(latencies),
+        'rps': len(latencies) / args.duration,
+        'p50': percentile(latencies, 50) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profiles', default='sync,gthread,gevent')
+    parser.add_argument('--clients', type=int, default=32, help='concurrent HTTP clients')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per profile')
+    parser.add_argument('--write-ratio', type=float, default=0.1, help='share of requests that add a task')
+    parser.add_argument('--tasks', type=int, default=200, help='tasks to seed (sqlite)')
+    parser.add_argument('--backend', choices=['sqlite', 'azure_sql'], default='sqlite')
+    parser.add_argument('--cache', choices=['sqlite', 'memory', 'none'], default='none',
+                        help='task list cache backend (default none: measure the database path)')
+    parser.add_argument('--username', default=username(0))
+    parser.add_argument('--password', default=DEFAULT_PASSWORD)
+    args = parser.parse_args()
+
+    env = dict(os.environ, TASK_CACHE_BACKEND=args.cache, DB_TYPE=args.backend)
+    if args.backend == 'sqlite':
+        workdir = tempfile.mkdtemp(prefix='throughput-')
+        db_path = os.path.join(workdir, 'bench.db')
+        seed(db_path, 1, args.tasks)
+        env.update(SQLITE_DATABASE=db_path, ENVIRONMENT='development',
+                   TASK_CACHE_PATH=os.path.join(workdir, 'cache.db'))
+    else:
+        env.update(ENVIRONMENT='production')
+
+    print(f"{args.backend}, {args.clients} clients, {args.duration:.0f}s per profile, "
+          f"{args.write_ratio:.0%} writes, cache={args.cache}, {os.cpu_count()} CPU(s)\n")
+    print("| Profile | Requests/s | p50 ms | p99 ms | Errors |")
+    print("|---------|------------|--------|--------|--------|")
+    for profile in args.profiles.split(','):
+        result = run_profile(profile.strip(), args, env)
+        print(f"| {result['profile']} | {result['rps']:.0f} | {result['p50']:.1f} | "
+              f"{result['p99']:.1f} | {result['errors']} |")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Bulk task operations: many creates, updates or deletes in one transaction
+
+Creates are sent with executemany (pyodbc fast_executemany on Azure SQL, so
+the rows travel as one parameter array). Updates and deletes are set-based:
+either chunked `id IN (...)` lists or a subquery built from the same filters
+as the task list.
+
+Like the single-task writes, every change stamps the rows with updated_at
+and the owner's next task_version, and deletes leave tombstones, for the
+change feed.
+"""
+from datetime import datetime
+
+import search
+from database import bump_task_version, next_task_version_sql
+from metrics import run_query
+from task_queries import STATUS_FILTERS, TaskFilters, build_task_selection
+
+PRIORITIES = ('High', 'Medium', 'Low')
+# Azure SQL allows ~2100 parameters per statement
+ID_CHUNK_SIZE = 500
+FILTER_KEYS = ('q', 'status', 'category')
+EDITABLE_FIELDS = ('title', 'description', 'priority', 'category', 'due_date', 'completed')
+
+# completed_at follows completed on the database clock (see archive.py); a
+# task set complete again keeps its original completion time
+CREATED_COMPLETED_AT = "CASE WHEN ? = 1 THEN CURRENT_TIMESTAMP END"
+SET_COMPLETED_AT = ("completed_at = CASE WHEN ? = 1 THEN "
+                    "(CASE WHEN completed = 1 THEN completed_at ELSE CURRENT_TIMESTAMP END) END")
+TOGGLED_COMPLETED_AT = "completed_at = CASE WHEN completed = 1 THEN NULL ELSE CURRENT_TIMESTAMP END"
+
+
+class BulkError(ValueError):
+    """Raised when a bulk request is malformed; nothing has been written"""
+
+
+def parse_due_date(value):
+    """Return a naive local due date from an ISO 8601 string (or None)."""
+    if value in (None, ''):
+        return None
+    try:
+        due_date = datetime.fromisoformat(str(value))
+    except ValueError:
+        raise BulkError(f"Invalid due_date: {value!r}")
+    if due_date.tzinfo is not None:
+        # Stored dates are naive local time, like the HTML form's
+        due_date = due_date.astimezone().replace(tzinfo=None)
+    return due_date.replace(microsecond=0)
+
+
+def parse_task(item, partial=False):
+    """
+    Validate one task object the same way the HTML forms are validated
+
+    Args:
+        item: Dict from the request body
+        partial: Only validate the fields present (updates)
+
+    Returns:
+        Dict of column -> value ready to bind
+    """
+    if not isinstance(item, dict):
+        raise BulkError("Each task must be an object")
+    unknown = set(item) - set(EDITABLE_FIELDS)
+    if unknown:
+        raise BulkError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    values = {}
+    if 'title' in item or not partial:
+        title = str(item.get('title') or '').strip()
+        if not title:
+            raise BulkError("Task title is required")
+        if len(title) > 255:
+            raise BulkError("Task title too long (max 255 characters)")
+        values['title'] = title
+    if 'description' in item or not partial:
+        values['description'] = str(item.get('description') or '').strip()
+    if 'priority' in item or not partial:
+        priority = str(item.get('priority') or 'Medium').title()
+        values['priority'] = priority if priority in PRIORITIES else 'Medium'
+    if 'category' in item or not partial:
+        values['category'] = str(item.get('category') or '').strip() or 'General'
+    if 'due_date' in item or not partial:
+        values['due_date'] = parse_due_date(item.get('due_date'))
+    if 'completed' in item or not partial:
+        values['completed'] = 1 if item.get('completed') else 0
+    return values
+
+
+def parse_filters(data):
+    """Build TaskFilters from a JSON filter object, rejecting anything unknown."""
+    if not isinstance(data, dict):
+        raise BulkError("filter must be an object")
+    unknown = set(data) - set(FILTER_KEYS)
+    if unknown:
+        raise BulkError(f"Unknown filter keys: {', '.join(sorted(unknown))}")
+    status = data.get('status', 'all')
+    if status not in STATUS_FILTERS:
+        # TaskFilters would quietly widen a typo to 'all'; too risky for deletes
+        raise BulkError(f"Invalid status filter: {status!r}")
+    return TaskFilters(q=data.get('q', ''), status=status, category=data.get('category', 'all'))
+
+
+def parse_ids(data):
+    """Return a de-duplicated list of integer task ids."""
+    if not isinstance(data, list):
+        raise BulkError("ids must be a list")
+    try:
+        return list(dict.fromkeys(int(task_id) for task_id in data))
+    except (TypeError, ValueError):
+        raise BulkError("ids must be integers")
+
+
+def _chunks(ids):
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        yield ids[start:start + ID_CHUNK_SIZE]
+
+
+def _targets(conn, schema, user_id, ids, filters):
+    """
+    Yield (where sql, params) batches selecting the user's targeted tasks
+    """
+    owner_sql = "user_id = ? AND " if schema.has_user_id else ""
+    owner_params = [user_id] if schema.has_user_id else []
+    if ids is not None:
+        for chunk in _chunks(ids):
+            placeholders = ', '.join('?' * len(chunk))
+            yield f"{owner_sql}id IN ({placeholders})", owner_params + chunk
+        return
+    if filters.terms and schema.search is None:
+        # Every match, not just the page-sized first FALLBACK_MAX_RESULTS
+        search_ids = search.fallback_search(conn, user_id, filters.q, schema.has_user_id, limit=None)
+        for chunk in _chunks(search_ids):
+            selection_sql, selection_params = build_task_selection(schema, user_id, filters, search_ids=chunk)
+            yield f"{owner_sql}id IN ({selection_sql})", owner_params + list(selection_params)
+        return
+    selection_sql, selection_params = build_task_selection(schema, user_id, filters)
+    yield f"{owner_sql}id IN ({selection_sql})", owner_params + list(selection_params)
+
+
+def _run(conn, user_id, work):
+    """Run work(cursor) in one transaction, counting the change for ETags."""
+    cursor = conn.cursor()
+    try:
+        count = work(cursor)
+        if count:
+            bump_task_version(cursor, user_id)
+        conn.commit()
+        return count
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def create_tasks(conn, schema, user_id, items, max_tasks):
+    """
+    Insert many tasks with one executemany
+
+    Returns:
+        Number of tasks created
+    """
+    if not isinstance(items, list) or not items:
+        raise BulkError("tasks must be a non-empty list")
+    if len(items) > max_tasks:
+        raise BulkError(f"At most {max_tasks} tasks per request")
+    rows = []
+    for index, item in enumerate(items):
+        try:
+            rows.append(parse_task(item))
+        except BulkError as exc:
+            raise BulkError(f"tasks[{index}]: {exc}")
+
+    columns = list(EDITABLE_FIELDS)
+    params = [tuple(row[col] for col in columns) for row in rows]
+    values = ['?'] * len(columns)
+    if schema.has_user_id:
+        columns.append('user_id')
+        values.append('?')
+        params = [p + (user_id,) for p in params]
+    if schema.has_completed_at:
+        columns.append('completed_at')
+        values.append(CREATED_COMPLETED_AT)
+        params = [p + (row['completed'],) for p, row in zip(params, rows)]
+    if schema.has_change_feed:
+        columns.extend(['updated_at', 'change_version'])
+        values.extend(['CURRENT_TIMESTAMP', next_task_version_sql()])
+        params = [p + (user_id,) for p in params]
+    sql = f"INSERT INTO tasks ({', '.join(columns)}) VALUES ({', '.join(values)})"
+
+    def work(cursor):
+        if schema.backend == 'azure_sql':
+            cursor.fast_executemany = True
+        run_query(cursor, 'bulk_insert', sql, params, many=True)
+        return len(params)
+
+    return _run(conn, user_id, work)
+
+
+def update_tasks(conn, schema, user_id, changes=None, toggle=False, ids=None, filters=None):
+    """
+    Apply the same changes (and/or a completion toggle) to many tasks
+
+    Args:
+        changes: Dict of EDITABLE_FIELDS values to set
+        toggle: Flip completed on every targeted task
+        ids: Task ids to update, or
+        filters: TaskFilters selecting the tasks to update
+
+    Returns:
+        Number of tasks updated
+    """
+    values = parse_task(changes or {}, partial=True)
+    if toggle and 'completed' in values:
+        raise BulkError("Use either toggle or set.completed, not both")
+    if not values and not toggle:
+        raise BulkError("Nothing to update")
+    assignments = [f"{column} = ?" for column in values]
+    set_params = list(values.values())
+    if toggle:
+        assignments.append("completed = CASE WHEN completed = 1 THEN 0 ELSE 1 END")
+        if schema.has_completed_at:
+            assignments.append(TOGGLED_COMPLETED_AT)
+    elif 'completed' in values and schema.has_completed_at:
+        # Right-hand sides see the row as it was before this UPDATE
+        assignments.append(SET_COMPLETED_AT)
+        set_params.append(values['completed'])
+    if schema.has_change_feed:
+        assignments.append(f"updated_at = CURRENT_TIMESTAMP, change_version = {next_task_version_sql()}")
+        set_params.append(user_id)
+    set_sql = ', '.join(assignments)
+
+    def work(cursor):
+        count = 0
+        for where_sql, where_params in _targets(conn, schema, user_id, ids, filters):
+            run_query(cursor, 'bulk_update', f"UPDATE tasks SET {set_sql} WHERE {where_sql}", set_params + where_params)
+            count += max(cursor.rowcount, 0)
+        return count
+
+    return _run(conn, user_id, work)
+
+
+def delete_tasks(conn, schema, user_id, ids=None, filters=None):
+    """
+    Delete many tasks selected by ids or filters
+
+    Returns:
+        Number of tasks deleted
+    """
+    tombstone_sql = (f"INSERT INTO task_tombstones (id, user_id, change_version) "
+                     f"SELECT id, user_id, {next_task_version_sql()} FROM tasks WHERE ")
+
+    def work(cursor):
+        count = 0
+        for where_sql, where_params in _targets(conn, schema, user_id, ids, filters):
+            if schema.has_change_feed:
+                # Same selection as the DELETE below, inside its transaction
+                run_query(cursor, 'bulk_tombstone', tombstone_sql + where_sql, [user_id] + where_params)
+            run_query(cursor, 'bulk_delete', f"DELETE FROM tasks WHERE {where_sql}", where_params)
+            count += max(cursor.rowcount, 0)
+        return count
+
+    return _run(conn, user_id, work)
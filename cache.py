@@ -0,0 +1,360 @@
+"""
+Per-user cache for task list pages
+
+Entries are grouped by scope (database + user). Every scope has a generation
+number: readers remember the generation they saw before querying the
+database and only store their result under it, and invalidate() bumps it, so
+a page read before a write can never be served after that write.
+
+Backends:
+
+- SQLiteCacheBackend: a local SQLite file shared by all gunicorn workers on a host
+- MemoryCacheBackend: per-process LRU, for tests and single-process runs
+
+Values are stored as JSON, never pickles: whoever can write the cache file
+can change what is shown, but not run code in the workers. The default file
+lives in a directory only the app's user can enter (see private_directory).
+"""
+import json
+import logging
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCacheBackend:
+    """In-process LRU with TTL, entry and byte limits"""
+
+    def __init__(self, ttl=60, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (scope, key) -> (generation, expires_at, blob)
+        self._generations = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def generation(self, scope):
+        with self._lock:
+            return self._generations.get(scope, 0)
+
+    def get(self, scope, key, generation):
+        """Return (blob or None, evicted count)"""
+        with self._lock:
+            entry = self._entries.get((scope, key))
+            if entry is None:
+                return None, 0
+            entry_generation, expires_at, blob = entry
+            if entry_generation != generation or expires_at <= time.time():
+                self._drop((scope, key))
+                return None, 0
+            self._entries.move_to_end((scope, key))
+            return blob, 0
+
+    def set(self, scope, key, generation, blob):
+        """Store an entry; returns how many entries were evicted to fit it"""
+        if len(blob) > self.max_bytes:
+            return 0
+        with self._lock:
+            if self._generations.get(scope, 0) != generation:
+                return 0
+            self._drop((scope, key))
+            self._entries[(scope, key)] = (generation, time.time() + self.ttl, blob)
+            self._bytes += len(blob)
+            evicted = 0
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                evicted += 1
+            return evicted
+
+    def invalidate(self, scope):
+        with self._lock:
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+            for entry_key in [k for k in self._entries if k[0] == scope]:
+                self._drop(entry_key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._bytes = 0
+
+    def size(self):
+        """Return (entries, bytes)"""
+        with self._lock:
+            return len(self._entries), self._bytes
+
+    def _drop(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._bytes -= len(entry[2])
+
+
+class SQLiteCacheBackend:
+    """LRU with TTL, entry and byte limits in a SQLite file shared by local processes"""
+
+    def __init__(self, path, ttl=60, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        """Open (or reopen after fork) this process's connection; lock held"""
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            # A cache needs no durability, only cross-process visibility
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    scope TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    generation INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    value BLOB NOT NULL,
+                    PRIMARY KEY (scope, key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries (accessed_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_generations (
+                    scope TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL
+                )
+            """)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def generation(self, scope):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT generation FROM cache_generations WHERE scope = ?", (scope,)
+            ).fetchone()
+            return row[0] if row else 0
+
+    def get(self, scope, key, generation):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value FROM cache_entries WHERE scope = ? AND key = ? AND generation = ? AND expires_at > ?",
+                (scope, key, generation, now)
+            ).fetchone()
+            if row is None:
+                return None, 0
+            conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE scope = ? AND key = ?", (now, scope, key))
+            return row[0], 0
+
+    def set(self, scope, key, generation, blob):
+        if len(blob) > self.max_bytes:
+            return 0
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT generation FROM cache_generations WHERE scope = ?", (scope,)).fetchone()
+                if (row[0] if row else 0) != generation:
+                    conn.execute("COMMIT")
+                    return 0
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries "
+                    "(scope, key, generation, expires_at, accessed_at, size, value) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (scope, key, generation, now + self.ttl, now, len(blob), sqlite3.Binary(blob))
+                )
+                evicted = self._evict(conn, now)
+                conn.execute("COMMIT")
+                return evicted
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, conn, now):
+        """Drop expired entries, then least recently used ones over the limits"""
+        evicted = conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,)).rowcount
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return evicted
+        doomed = []
+        for scope, key, size in conn.execute(
+            "SELECT scope, key, size FROM cache_entries ORDER BY accessed_at"
+        ):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((scope, key))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM cache_entries WHERE scope = ? AND key = ?", doomed)
+        return evicted + len(doomed)
+
+    def invalidate(self, scope):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO cache_generations (scope, generation) VALUES (?, 1) "
+                    "ON CONFLICT(scope) DO UPDATE SET generation = generation + 1",
+                    (scope,)
+                )
+                conn.execute("DELETE FROM cache_entries WHERE scope = ?", (scope,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM cache_entries")
+            conn.execute("DELETE FROM cache_generations")
+
+    def size(self):
+        with self._lock:
+            return tuple(self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+            ).fetchone())
+
+
+class TaskListCache:
+    """
+    Cache of task list pages keyed by user and list parameters
+
+    Cache failures are logged and treated as misses so the database remains
+    the source of truth.
+
+    Args:
+        backend: MemoryCacheBackend, SQLiteCacheBackend or None (disabled)
+        on_event: Optional callable(event) for 'hit', 'miss', 'eviction',
+            'invalidation' and 'error' (used for Prometheus counters)
+        encode: Optional callable turning a value into JSON-ready data
+            (e.g. TaskPage.to_data)
+        decode: Optional callable rebuilding a value from that data
+    """
+
+    def __init__(self, backend, on_event=None, encode=None, decode=None):
+        self.backend = backend
+        self.on_event = on_event
+        self.encode = encode
+        self.decode = decode
+        self.stats = {'hit': 0, 'miss': 0, 'eviction': 0, 'invalidation': 0, 'error': 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def _record(self, event, count=1):
+        if count <= 0:
+            return
+        with self._stats_lock:
+            self.stats[event] += count
+        if self.on_event is not None:
+            for _ in range(count):
+                self.on_event(event)
+
+    def lookup(self, scope, key):
+        """
+        Return (value or None, token); pass the token to store() after a miss
+        """
+        if self.backend is None:
+            return None, None
+        try:
+            generation = self.backend.generation(scope)
+            blob, evicted = self.backend.get(scope, key, generation)
+        except Exception as exc:
+            logger.warning(f"Task cache lookup failed: {exc}")
+            self._record('error')
+            return None, None
+        self._record('eviction', evicted)
+        if blob is None:
+            self._record('miss')
+            return None, generation
+        try:
+            data = json.loads(blob)
+            value = self.decode(data) if self.decode else data
+        except (ValueError, TypeError) as exc:
+            logger.warning(f"Unreadable task cache entry: {exc}")
+            self._record('error')
+            return None, generation
+        self._record('hit')
+        return value, generation
+
+    def store(self, scope, key, value, token):
+        """Cache a value computed after lookup() returned token"""
+        if self.backend is None or token is None:
+            return
+        try:
+            data = self.encode(value) if self.encode else value
+            blob = json.dumps(data, separators=(',', ':')).encode()
+            evicted = self.backend.set(scope, key, token, blob)
+        except Exception as exc:
+            logger.warning(f"Task cache store failed: {exc}")
+            self._record('error')
+            return
+        self._record('eviction', evicted)
+
+    def invalidate(self, scope):
+        """Forget every cached page of a scope (call after each write)"""
+        if self.backend is None:
+            return
+        try:
+            self.backend.invalidate(scope)
+        except Exception as exc:
+            logger.warning(f"Task cache invalidation failed: {exc}")
+            self._record('error')
+            return
+        self._record('invalidation')
+
+
+def private_directory(path):
+    """
+    Create a directory only this user can enter, or check an existing one is
+
+    Raises:
+        OSError: The path is not a directory owned by this user with mode 0700
+            (someone else may have planted it, e.g. in the shared temp dir)
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise OSError(f"{path} is not a private directory of this user (owner {info.st_uid}, "
+                      f"mode {stat.S_IMODE(info.st_mode):o})")
+    return path
+
+
+def default_cache_path():
+    """cache.db in this user's private taskmanager directory under the temp dir"""
+    directory = private_directory(os.path.join(tempfile.gettempdir(), f'taskmanager-{os.getuid()}'))
+    return os.path.join(directory, 'cache.db')
+
+
+def create_backend(kind, ttl, max_entries, max_bytes, path=None):
+    """Build a cache backend from configuration ('sqlite', 'memory' or 'none')"""
+    if kind == 'none':
+        return None
+    if kind == 'memory':
+        return MemoryCacheBackend(ttl, max_entries, max_bytes)
+    if kind == 'sqlite':
+        if not path:
+            try:
+                path = default_cache_path()
+            except OSError as exc:
+                logger.warning(f"Shared task cache disabled, using a per-process one: {exc}")
+                return MemoryCacheBackend(ttl, max_entries, max_bytes)
+        return SQLiteCacheBackend(path, ttl, max_entries, max_bytes)
+    raise ValueError(f"Unknown task cache backend: {kind}")
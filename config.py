@@ -13,12 +13,111 @@ class Config:
     # SQLite configuration (local development)
     SQLITE_DATABASE = os.environ.get('SQLITE_DATABASE', 'tasks.db')
     
+    # SQLite profile applied to every connection. WAL lets readers run while
+    # one connection writes; use DELETE on network file systems (SMB/NFS),
+    # where WAL's shared memory does not work.
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')  # NORMAL is durable across app crashes in WAL
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'))  # ms to wait for a lock
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', '-8000'))  # pages, or KiB when negative, per connection
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024)))  # bytes; 0 disables
+    SQLITE_TEMP_STORE = os.environ.get('SQLITE_TEMP_STORE', 'MEMORY')
+    SQLITE_BUSY_RETRIES = int(os.environ.get('SQLITE_BUSY_RETRIES', '3'))  # retries after the busy timeout runs out
+    SQLITE_BUSY_BACKOFF = float(os.environ.get('SQLITE_BUSY_BACKOFF', '0.05'))  # seconds, doubled per retry, jittered
+    SQLITE_MAINTENANCE_INTERVAL = float(os.environ.get('SQLITE_MAINTENANCE_INTERVAL', '300'))  # WAL checkpoint + optimize; 0 = off
+    
     # Azure SQL configuration (production)
     AZURE_SQL_SERVER = os.environ.get('AZURE_SQL_SERVER', '')
     AZURE_SQL_DATABASE = os.environ.get('AZURE_SQL_DATABASE', '')
     AZURE_SQL_USERNAME = os.environ.get('AZURE_SQL_USERNAME', '')
     AZURE_SQL_PASSWORD = os.environ.get('AZURE_SQL_PASSWORD', '')
     
+    # Group commit (SQLite): concurrent task writes in a worker share one
+    # transaction and one sync (see group_commit.py)
+    WRITE_COALESCE = os.environ.get('WRITE_COALESCE', 'False').lower() in ['true', '1', 'yes']
+    WRITE_COALESCE_WINDOW_MS = float(os.environ.get('WRITE_COALESCE_WINDOW_MS', '0'))  # extra wait for more writes
+    WRITE_COALESCE_MAX_BATCH = int(os.environ.get('WRITE_COALESCE_MAX_BATCH', '64'))  # writes per commit
+    
+    # Read replica: read-only queries go to an Azure SQL readable secondary
+    # (ApplicationIntent=ReadOnly) or, locally, to a SQLite copy of the
+    # database refreshed every REPLICA_SYNC_INTERVAL seconds (see replica.py)
+    READ_REPLICA = os.environ.get('READ_REPLICA', 'False').lower() in ['true', '1', 'yes']
+    AZURE_SQL_REPLICA_SERVER = os.environ.get('AZURE_SQL_REPLICA_SERVER', '')  # geo-replica; default: AZURE_SQL_SERVER
+    SQLITE_REPLICA_DATABASE = os.environ.get('SQLITE_REPLICA_DATABASE', '')  # default: <SQLITE_DATABASE>-replica
+    REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', '5'))  # seconds behind before reads use the primary
+    REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', '2'))  # seconds between lag checks
+    REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', '5'))  # primary reads after own write
+    REPLICA_SYNC_INTERVAL = float(os.environ.get('REPLICA_SYNC_INTERVAL', '1'))  # SQLite copy refresh
+    
+    # Sharding (SQLite): tasks spread over this many files by user id, each
+    # with its own write lock (see shards.py); 0 keeps them in SQLITE_DATABASE
+    SQLITE_SHARDS = int(os.environ.get('SQLITE_SHARDS', '0'))
+    SQLITE_SHARD_PATH = os.environ.get('SQLITE_SHARD_PATH', '')  # e.g. /data/tasks-{shard}.db; default: <name>-shard<n>.db
+    
+    # Archive tier: completed tasks older than ARCHIVE_AFTER_DAYS move to
+    # tasks_archive in small batches, from a background thread in each worker
+    # (see archive.py), so the task lists only scan live tasks. Off unless
+    # set; on Azure SQL restores need ALTER permission on tasks (IDENTITY_INSERT)
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '0'))  # days since completion; 0 = off
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))  # tasks moved per transaction
+    ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', '3600'))  # seconds between runs
+    ARCHIVE_BATCH_PAUSE = float(os.environ.get('ARCHIVE_BATCH_PAUSE', '0.05'))  # seconds between batches
+    
+    # Change feed (/api/tasks/changes): tombstones of deleted and archived
+    # tasks are purged by the archive job after this many days, and older
+    # cursors get 410 Gone (the client syncs again from scratch)
+    TASK_TOMBSTONE_DAYS = int(os.environ.get('TASK_TOMBSTONE_DAYS', '30'))  # 0 = keep tombstones forever
+    
+    # Connection pool (per worker process)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))  # max connection lifetime in seconds
+    DB_POOL_PRE_PING = int(os.environ.get('DB_POOL_PRE_PING', '30'))  # ping Azure SQL connections idle longer than this
+    
+    # Apply pending schema migrations when a worker starts
+    AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', 'True').lower() in ['true', '1', 'yes']
+    
+    # Task list cache shared by the workers on a host ('sqlite', 'memory' or 'none')
+    TASK_CACHE_BACKEND = os.environ.get('TASK_CACHE_BACKEND', 'sqlite')
+    TASK_CACHE_PATH = os.environ.get('TASK_CACHE_PATH', '')  # default: a private taskmanager-<uid> dir in the temp dir
+    TASK_CACHE_TTL = int(os.environ.get('TASK_CACHE_TTL', '60'))  # seconds
+    TASK_CACHE_MAX_ENTRIES = int(os.environ.get('TASK_CACHE_MAX_ENTRIES', '10000'))
+    TASK_CACHE_MAX_BYTES = int(os.environ.get('TASK_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    
+    # /api/tasks responses at least this large are gzipped for clients that accept it
+    API_GZIP_MIN_BYTES = int(os.environ.get('API_GZIP_MIN_BYTES', '1024'))
+    
+    # Max tasks created by one /api/tasks/bulk request
+    BULK_MAX_TASKS = int(os.environ.get('BULK_MAX_TASKS', '5000'))
+    
+    # Password hashing (see passwords.py). Stored hashes made with other
+    # parameters are upgraded on the user's next login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '1'))  # processes per worker; 0 = in the request thread
+    # Hashes running or queued per worker: one per request thread (gunicorn_config.py sets it from the profile)
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', os.environ.get('DB_POOL_SIZE', '5')))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '1'))  # seconds to wait for a slot, at least one hash
+    PASSWORD_HASH_NICE = int(os.environ.get('PASSWORD_HASH_NICE', '10'))  # priority drop of hashing processes
+    
+    # Compiled Jinja templates, kept across worker restarts ('none' disables)
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', '')  # default: Jinja's private per-user temp dir
+    
+    # Logging (see logging_config.py). Records go through an in-memory queue to
+    # stdout and LOG_FILE; '' logs to stdout only. Every worker appends to
+    # LOG_FILE, so rotate it with logrotate, not in the app.
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')  # 'text' or 'json'
+    LOG_FILE = os.environ.get('LOG_FILE', 'app.log')
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))  # records buffered before dropping
+    LOG_RATE_LIMIT = int(os.environ.get('LOG_RATE_LIMIT', '20'))  # INFO/DEBUG records per message per window; 0 = off
+    LOG_RATE_WINDOW = float(os.environ.get('LOG_RATE_WINDOW', '60'))  # seconds
+    LOG_SAMPLING = os.environ.get('LOG_SAMPLING', '')  # e.g. 'app=0.1,cache=0.5': fraction of INFO/DEBUG kept
+    
+    # Health endpoints: deadline of the /health/ready database check, and how
+    # often each worker recounts the tables for /health/stats
+    HEALTH_READY_TIMEOUT = float(os.environ.get('HEALTH_READY_TIMEOUT', '2'))  # seconds
+    HEALTH_STATS_INTERVAL = float(os.environ.get('HEALTH_STATS_INTERVAL', '60'))  # seconds
+    
     # Azure Application Insights
     APPINSIGHTS_INSTRUMENTATION_KEY = os.environ.get('APPINSIGHTS_INSTRUMENTATION_KEY', '')
     
@@ -1,42 +1,886 @@
 """
 Database connection module supporting both SQLite and Azure SQL
 """
+import functools
+import os
+import random
 import sqlite3
 import logging
-from werkzeug.security import generate_password_hash, check_password_hash
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import g, has_app_context
 from config import Config
+import migrations
+import search
+from group_commit import WriteCoalescer
+from replica import ReplicaMonitor
+from shards import ShardMap, prepare_shard, read_map, shard_path, write_map
+from metrics import QueryTimer, record_busy_retry, record_connection_opened, run_query, set_pool_connections
+from passwords import hash_password, needs_rehash, verify_password
+from task_queries import SQLITE_DATETIME_FORMAT
 
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
+
+def _adapt_datetime(value):
+    return value.strftime(SQLITE_DATETIME_FORMAT)
+
+
+def _convert_datetime(value):
+    # Canonical values parse in one call; anything older is unreadable, as before
+    try:
+        return datetime.fromisoformat(value.decode())
+    except ValueError:
+        return None
+
+
+# SQLite has no date type: datetimes are bound as canonical
+# 'YYYY-MM-DD HH:MM:SS' text (the CURRENT_TIMESTAMP form, which sorts and
+# compares correctly as text) and DATETIME columns read back as datetimes.
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_converter('DATETIME', _convert_datetime)
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class PooledConnectionMixin:
     """
-    Create database connection based on configuration
-    Returns a connection object with row_factory set
+    Pool bookkeeping shared by the SQLite and Azure SQL connection types
+
+    close() hands the connection back to its pool instead of closing it, and
+    is a no-op while the connection is bound to a Flask request.
     """
-    config = Config()
+    _pool = None
+    _pool_pid = None
+    _pool_created = 0.0
+    _pool_returned = 0.0
+    _request_bound = False
+
+    def close(self):
+        if self._request_bound:
+            return
+        pool = self._pool
+        if pool is None:
+            self.close_physical()
+        else:
+            pool.release(self)
+
+
+def _is_busy(exc):
+    """Return True for SQLITE_BUSY / SQLITE_LOCKED errors"""
+    name = getattr(exc, 'sqlite_errorname', '')
+    if name:
+        return name.startswith(('SQLITE_BUSY', 'SQLITE_LOCKED'))
+    message = str(exc)
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def _retry_busy(operation, *args):
+    """
+    Run operation(*args), retrying it a few times while SQLite stays locked
     
-    if config.DB_TYPE == 'azure_sql':
-        return get_azure_sql_connection()
-    else:
-        return get_sqlite_connection()
+    Each attempt already waits SQLITE_BUSY_TIMEOUT inside SQLite. A statement
+    that fails with SQLITE_BUSY has no effect and leaves the transaction
+    open, so running it again is safe. Retries sleep a random fraction of a
+    doubling backoff, so writers that collided do not collide again.
+    """
+    retries = Config.SQLITE_BUSY_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            return operation(*args)
+        except sqlite3.OperationalError as e:
+            if attempt == retries or not _is_busy(e):
+                raise
+            record_busy_retry()
+            logger.warning(f"SQLite busy, retry {attempt + 1} of {retries}: {e}")
+            time.sleep(random.uniform(0, Config.SQLITE_BUSY_BACKOFF * 2 ** attempt))
+
+
+class SQLiteCursor(sqlite3.Cursor):
+    """sqlite3 cursor that retries statements while the database is locked"""
+
+    def execute(self, sql, parameters=()):
+        return _retry_busy(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        # A generator would be used up by the first attempt
+        return _retry_busy(super().executemany, sql, list(seq_of_parameters))
+
+
+class SQLiteConnection(PooledConnectionMixin, sqlite3.Connection):
+    """sqlite3 connection that can be returned to a ConnectionPool"""
+    _file_id = None
+
+    def cursor(self, factory=None):
+        return sqlite3.Connection.cursor(self, factory or SQLiteCursor)
+
+    def commit(self):
+        with QueryTimer('commit'):
+            _retry_busy(sqlite3.Connection.commit, self)
+
+    def close_physical(self):
+        sqlite3.Connection.close(self)
+
+
+class AzureSQLConnection(PooledConnectionMixin):
+    """Proxy around a pyodbc connection that can be returned to a ConnectionPool"""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def commit(self):
+        with QueryTimer('commit'):
+            self._raw.commit()
+
+    def close_physical(self):
+        self._raw.close()
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe and fork-aware pool of database connections
+
+    Args:
+        creator: Callable returning a new PooledConnectionMixin connection
+        max_size: Maximum number of open connections
+        timeout: Seconds to wait for a free connection before PoolTimeout
+        max_lifetime: Seconds after which a connection is recycled
+        validate: Optional callable(conn, idle_seconds) -> bool run on checkout
+    """
+
+    def __init__(self, creator, max_size=5, timeout=30, max_lifetime=1800, validate=None):
+        self._creator = creator
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self._validate = validate
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._size = 0
+        self._pid = os.getpid()
+        self._disposed = False
+        # Connections inherited across fork() are never closed by the child,
+        # since that would tear down sockets/files the parent still uses.
+        self._orphans = []
+
+    @property
+    def size(self):
+        """Number of open connections (idle and checked out)"""
+        return self._size
+
+    @property
+    def idle(self):
+        """Number of idle connections"""
+        return len(self._idle)
+
+    def _publish(self):
+        """Report open and checked-out connections to the metrics"""
+        set_pool_connections(self._size, self._size - len(self._idle))
+
+    def _check_fork(self):
+        """Forget connections inherited from a parent process (lock held)"""
+        pid = os.getpid()
+        if pid != self._pid:
+            self._orphans.extend(self._idle)
+            self._idle.clear()
+            self._size = 0
+            self._pid = pid
+
+    def _usable(self, conn):
+        """Return True if an idle connection may be handed out again"""
+        now = time.monotonic()
+        if self.max_lifetime and now - conn._pool_created > self.max_lifetime:
+            return False
+        if self._validate is None:
+            return True
+        try:
+            return self._validate(conn, now - conn._pool_returned)
+        except Exception as e:
+            logger.warning(f"Discarding broken pooled connection: {e}")
+            return False
+
+    def _discard(self, conn):
+        """Close a connection and free its slot"""
+        try:
+            conn.close_physical()
+        except Exception:
+            pass
+        with self._cond:
+            if conn._pool_pid == self._pid:
+                self._size -= 1
+            self._cond.notify()
+        self._publish()
+
+    def acquire(self, timeout=None):
+        """Check out a connection, opening one if the pool has room
+
+        Args:
+            timeout: Seconds to wait instead of the pool's timeout
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                self._check_fork()
+                conn = None
+                while conn is None:
+                    if self._idle:
+                        conn = self._idle.pop()
+                    elif self._size < self.max_size:
+                        self._size += 1
+                        break
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise PoolTimeout(
+                                f"No database connection available within {timeout}s "
+                                f"(pool size {self.max_size})"
+                            )
+                        self._cond.wait(remaining)
+                        self._check_fork()
+
+            if conn is None:
+                return self._open()
+            # Validation may hit the network, so it runs outside the lock
+            if self._usable(conn):
+                self._publish()
+                return conn
+            self._discard(conn)
+
+    def _open(self):
+        """Open a new connection for a slot already reserved by acquire()"""
+        try:
+            conn = self._creator()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        record_connection_opened()
+        conn._pool = self
+        conn._pool_pid = os.getpid()
+        conn._pool_created = conn._pool_returned = time.monotonic()
+        self._publish()
+        return conn
+
+    def release(self, conn):
+        """Return a checked-out connection to the pool"""
+        if conn._pool_pid != os.getpid():
+            self._orphans.append(conn)
+            return
+        try:
+            conn.rollback()
+        except Exception as e:
+            logger.warning(f"Discarding connection that failed to roll back: {e}")
+            self._discard(conn)
+            return
+        with self._cond:
+            if conn._pool_pid != self._pid:
+                return
+            if self._disposed:
+                self._size -= 1
+                conn.close_physical()
+                return
+            conn._pool_returned = time.monotonic()
+            self._idle.append(conn)
+            self._cond.notify()
+        self._publish()
+
+    def dispose(self):
+        """Close all idle connections; checked-out ones close on release"""
+        with self._cond:
+            self._check_fork()
+            self._disposed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for conn in idle:
+            try:
+                conn.close_physical()
+            except Exception:
+                pass
+
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+
+def current_database_key():
+    """Identify the database the configuration currently points at"""
+    if Config.DB_TYPE == 'azure_sql':
+        return ('azure_sql', Config.AZURE_SQL_SERVER, Config.AZURE_SQL_DATABASE, Config.AZURE_SQL_USERNAME)
+    return ('sqlite', Config.SQLITE_DATABASE)
+
+
+def _sqlite_file_id(path):
+    """Return (device, inode) of a database file, or None for in-memory databases"""
+    if path == ':memory:' or path.startswith('file:'):
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+def _validate_sqlite(conn, idle_seconds):
+    """A pooled SQLite connection is stale once its file was deleted or replaced"""
+    if conn._file_id is None:
+        return True
+    if _sqlite_file_id(conn._path) == conn._file_id:
+        return True
+    if conn._path == Config.SQLITE_DATABASE:
+        # A new file may have a different schema as well
+        invalidate_schema()
+    return False
+
+
+def _validate_azure_sql(conn, idle_seconds):
+    """Ping connections that sat idle long enough for the server to drop them"""
+    if idle_seconds < Config.DB_POOL_PRE_PING:
+        return True
+    cursor = conn.cursor()
+    try:
+        run_query(cursor, 'pool_ping', "SELECT 1", fetch='one')
+    finally:
+        cursor.close()
+    return True
+
+
+def get_pool():
+    """Return the process-wide pool for the configured database"""
+    global _pool, _pool_key
+    key = current_database_key()
+    pool = _pool
+    if pool is not None and _pool_key == key:
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            if _pool is not None:
+                _pool.dispose()
+            if key[0] == 'azure_sql':
+                creator, validate = get_azure_sql_connection, _validate_azure_sql
+            else:
+                creator, validate = get_sqlite_connection, _validate_sqlite
+            _pool = ConnectionPool(
+                creator,
+                max_size=Config.DB_POOL_SIZE,
+                timeout=Config.DB_POOL_TIMEOUT,
+                max_lifetime=Config.DB_POOL_RECYCLE,
+                validate=validate,
+            )
+            _pool_key = key
+        return _pool
+
+
+def dispose_pool():
+    """Close idle pooled connections and drop the pool (and the replica's and shards')"""
+    global _pool, _pool_key, _replica_pool, _replica_pool_key, _shard_map, _shard_map_key
+    with _pool_lock:
+        for pool in [_pool, _replica_pool] + list(_shard_pools.values()):
+            if pool is not None:
+                pool.dispose()
+        _pool = _replica_pool = None
+        _pool_key = _replica_pool_key = None
+        _shard_pools.clear()
+        _shard_map = _shard_map_key = None
+    invalidate_schema()
+
+
+# Read replica
+
+_replica_pool = None
+_replica_pool_key = None
+_replica_monitor = None
+
+# (touch the heartbeat, read its age in seconds) per backend, on the database's own clock
+HEARTBEAT_SQL = {
+    'sqlite': ("UPDATE replica_heartbeat SET beat_at = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE id = 1",
+               "SELECT (julianday('now') - julianday(beat_at)) * 86400.0 FROM replica_heartbeat WHERE id = 1"),
+    'azure_sql': ("UPDATE replica_heartbeat SET beat_at = SYSUTCDATETIME() WHERE id = 1",
+                  "SELECT DATEDIFF_BIG(millisecond, beat_at, SYSUTCDATETIME()) / 1000.0 "
+                  "FROM replica_heartbeat WHERE id = 1"),
+}
+
+
+def sqlite_replica_path():
+    """Path of the local SQLite replica: SQLITE_REPLICA_DATABASE, or <primary>-replica"""
+    if Config.SQLITE_REPLICA_DATABASE:
+        return Config.SQLITE_REPLICA_DATABASE
+    root, ext = os.path.splitext(Config.SQLITE_DATABASE)
+    return f"{root}-replica{ext or '.db'}"
+
+
+def current_replica_key():
+    """Identify the replica the configuration currently points at"""
+    if Config.DB_TYPE == 'azure_sql':
+        return ('azure_sql', Config.AZURE_SQL_REPLICA_SERVER or Config.AZURE_SQL_SERVER, Config.AZURE_SQL_DATABASE,
+                Config.AZURE_SQL_USERNAME, 'ReadOnly')
+    return ('sqlite', sqlite_replica_path())
+
+
+def get_replica_pool():
+    """Return the process-wide pool of read-only connections to the replica"""
+    global _replica_pool, _replica_pool_key
+    key = current_replica_key()
+    pool = _replica_pool
+    if pool is not None and _replica_pool_key == key:
+        return pool
+    with _pool_lock:
+        if _replica_pool is None or _replica_pool_key != key:
+            if _replica_pool is not None:
+                _replica_pool.dispose()
+            if key[0] == 'azure_sql':
+                creator = functools.partial(get_azure_sql_connection, read_only=True)
+                validate = _validate_azure_sql
+            else:
+                creator = functools.partial(get_sqlite_connection, key[1], read_only=True)
+                validate = _validate_sqlite
+            _replica_pool = ConnectionPool(
+                creator,
+                max_size=Config.DB_POOL_SIZE,
+                timeout=Config.DB_POOL_TIMEOUT,
+                max_lifetime=Config.DB_POOL_RECYCLE,
+                validate=validate,
+            )
+            _replica_pool_key = key
+        return _replica_pool
+
+
+def _heartbeat_age(conn, backend, name):
+    """Seconds since the heartbeat row seen by conn was touched"""
+    cursor = conn.cursor()
+    try:
+        row = run_query(cursor, name, HEARTBEAT_SQL[backend][1], fetch='one')
+    finally:
+        cursor.close()
+    if row is None:
+        raise RuntimeError("replica_heartbeat has no row; apply migration 6")
+    return float(row[0])
+
+
+def sync_sqlite_replica(source):
+    """Copy the primary SQLite database into the replica file (SQLite backup API)"""
+    target = sqlite3.connect(sqlite_replica_path(), timeout=Config.SQLITE_BUSY_TIMEOUT / 1000)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+
+
+def check_replica_lag():
+    """
+    Measure how far the replica trails the primary, then touch the heartbeat
+    
+    The lag is the replica's heartbeat age minus the primary's, accurate to
+    about REPLICA_CHECK_INTERVAL. A local SQLite replica is copied from the
+    primary when it trails by REPLICA_SYNC_INTERVAL or more, or has no copy
+    yet; it is current after the copy.
+    
+    Returns:
+        Replica lag in seconds; raises when the replica cannot be read
+    """
+    backend = 'azure_sql' if Config.DB_TYPE == 'azure_sql' else 'sqlite'
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        primary_age = _heartbeat_age(conn, backend, 'heartbeat_primary')
+        try:
+            replica = get_replica_pool().acquire()
+            try:
+                lag = max(0.0, _heartbeat_age(replica, backend, 'heartbeat_replica') - primary_age)
+            finally:
+                replica.close()
+        except Exception:
+            if backend == 'azure_sql':
+                raise
+            lag = None
+        cursor = conn.cursor()
+        try:
+            run_query(cursor, 'heartbeat_beat', HEARTBEAT_SQL[backend][0])
+            conn.commit()
+        finally:
+            cursor.close()
+        if backend == 'sqlite' and (lag is None or lag >= Config.REPLICA_SYNC_INTERVAL):
+            sync_sqlite_replica(conn)
+            lag = 0.0
+        return lag
+    finally:
+        pool.release(conn)
+
+
+def get_replica_monitor():
+    """Return the process-wide ReplicaMonitor"""
+    global _replica_monitor
+    if _replica_monitor is None:
+        with _pool_lock:
+            if _replica_monitor is None:
+                _replica_monitor = ReplicaMonitor(
+                    check_replica_lag, Config.REPLICA_CHECK_INTERVAL, Config.REPLICA_MAX_LAG,
+                    key=lambda: (current_database_key(), current_replica_key())
+                )
+    return _replica_monitor
+
+
+def replica_usable():
+    """Return True when READ_REPLICA is on and the replica is healthy and close enough"""
+    return Config.READ_REPLICA and get_replica_monitor().usable()
+
+
+def read_from_primary():
+    """Send the rest of this request's reads to the primary (read-your-writes)"""
+    if has_app_context():
+        g.read_from_primary = True
+
+
+def task_read_source():
+    """
+    Return where this request's task reads go right now: 'replica' or 'primary'
+
+    Pages cached from the replica are kept apart from the primary's, so a
+    session reading its own writes never gets a page a lagging replica served.
+    """
+    if sharding_enabled() or (has_app_context() and g.get('read_from_primary')) or not replica_usable():
+        return 'primary'
+    return 'replica'
+
+
+def get_read_connection():
+    """
+    Return a pooled connection for read-only work
+    
+    Reads go to the replica when READ_REPLICA is on, the last check found it
+    within REPLICA_MAX_LAG and the request has not called
+    read_from_primary(); otherwise they use get_db_connection(). Like that
+    one, the connection is bound to the request inside an app context, and
+    owned by the caller outside one. Nothing may be written through it.
+    """
+    if has_app_context() and g.get('read_from_primary'):
+        return get_db_connection()
+    if not replica_usable():
+        return get_db_connection()
+    if has_app_context():
+        conn = g.get('db_read_conn')
+        if conn is not None:
+            return conn
+    try:
+        conn = get_replica_pool().acquire()
+    except Exception as e:
+        get_replica_monitor().mark_failed(e)
+        return get_db_connection()
+    if has_app_context():
+        conn._request_bound = True
+        g.db_read_conn = conn
+    return conn
+
+
+# Sharding (SQLite)
+
+_shard_pools = {}
+_shard_map = None
+_shard_map_key = None
+_shard_lock = threading.Lock()
+
+
+def sharding_enabled():
+    """Return True when tasks are spread over SQLITE_SHARDS files (SQLite only)"""
+    return Config.DB_TYPE != 'azure_sql' and Config.SQLITE_SHARDS > 0
+
+
+def shard_database_path(shard):
+    """Return the file of a shard"""
+    return shard_path(Config.SQLITE_DATABASE, shard, Config.SQLITE_SHARD_PATH)
+
+
+def get_shard_map():
+    """
+    Return the shard map stored in the main database, read once per process
+    
+    The first worker started with sharding on stores a map dealing the
+    buckets over SQLITE_SHARDS shards. After that only shard_db.py changes
+    it, and workers pick the change up when they restart.
+    
+    Reading the map takes a main-pool connection (the request's own inside
+    a request), so outside a request it must not be called while holding
+    one: with DB_POOL_SIZE=1 it would wait on itself. init_app() and
+    init_database() load it up front, so later calls find it cached.
+    """
+    global _shard_map, _shard_map_key
+    key = current_database_key()
+    shard_map = _shard_map
+    if shard_map is not None and _shard_map_key == key:
+        return shard_map
+    get_schema()  # migration 7 creates the shard_map table
+    with _shard_lock:
+        if _shard_map is None or _shard_map_key != key:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            try:
+                shard_map = read_map(cursor)
+                if shard_map is None:
+                    write_map(cursor, ShardMap.spread(Config.SQLITE_SHARDS), replace=False)
+                    conn.commit()
+                    shard_map = read_map(cursor)
+                    logger.info(f"Created shard map over {shard_map.count} shards")
+                elif shard_map.count != Config.SQLITE_SHARDS:
+                    logger.warning(f"Shard map spans {shard_map.count} shards but SQLITE_SHARDS is "
+                                   f"{Config.SQLITE_SHARDS}; run `python shard_db.py --rebalance`")
+                if run_query(cursor, 'shard_leftovers', "SELECT 1 FROM tasks LIMIT 1", fetch='one'):
+                    logger.warning(f"Tasks are still in {Config.SQLITE_DATABASE}; "
+                                   f"run `python shard_db.py --rebalance` to move them to their shards")
+            finally:
+                cursor.close()
+                conn.close()  # a no-op for the request's own connection
+            _shard_map, _shard_map_key = shard_map, key
+        return _shard_map
+
+
+def shard_of(user_id):
+    """Return the shard holding a user's tasks"""
+    return get_shard_map().shard_of(user_id)
+
+
+def get_shard_pool(shard):
+    """Return the process-wide pool of a shard, creating and migrating the file on first use"""
+    path = shard_database_path(shard)
+    pool = _shard_pools.get(path)
+    if pool is not None:
+        return pool
+    with _shard_lock:
+        pool = _shard_pools.get(path)
+        if pool is None:
+            pool = ConnectionPool(
+                functools.partial(get_sqlite_connection, path),
+                max_size=Config.DB_POOL_SIZE,
+                timeout=Config.DB_POOL_TIMEOUT,
+                max_lifetime=Config.DB_POOL_RECYCLE,
+                validate=_validate_sqlite,
+            )
+            conn = pool.acquire()
+            try:
+                prepare_shard(conn, shard)
+            finally:
+                pool.release(conn)
+            _shard_pools[path] = pool
+        return pool
+
+
+def get_shard_connection(shard):
+    """
+    Return a pooled connection to a shard, bound to the request like
+    get_db_connection()
+    """
+    if not has_app_context():
+        return get_shard_pool(shard).acquire()
+    conns = g.setdefault('db_shard_conns', {})
+    conn = conns.get(shard)
+    if conn is None:
+        conn = get_shard_pool(shard).acquire()
+        conn._request_bound = True
+        conns[shard] = conn
+    return conn
+
+
+def get_task_connection(user_id, write=False):
+    """
+    Return a pooled connection for work on one user's tasks
+    
+    That is the user's shard when sharding is on; otherwise the primary for
+    writes and get_read_connection() for reads.
+    """
+    if sharding_enabled():
+        return get_shard_connection(shard_of(user_id))
+    return get_db_connection() if write else get_read_connection()
+
+
+def for_each_shard(work):
+    """
+    Run work(cursor) on every shard in turn, for admin queries across shards
+    
+    Returns:
+        List of (shard, what work returned)
+    """
+    results = []
+    for shard in range(get_shard_map().count):
+        pool = get_shard_pool(shard)
+        conn = pool.acquire()
+        cursor = conn.cursor()
+        try:
+            results.append((shard, work(cursor)))
+        finally:
+            cursor.close()
+            pool.release(conn)
+    return results
+
+
+def task_pools():
+    """Return the pools of every database holding tasks: the shards, or the primary"""
+    if sharding_enabled():
+        return [get_shard_pool(shard) for shard in range(get_shard_map().count)]
+    return [get_pool()]
+
+
+def get_db_connection():
+    """
+    Return a pooled database connection
+
+    Inside a Flask app context the same connection is shared by everything
+    that runs during the request and is released by the teardown handler
+    registered in init_app(); calling close() on it does nothing. Outside a
+    request the caller owns the connection and close() returns it to the pool.
+    """
+    if has_app_context():
+        conn = g.get('db_conn')
+        if conn is None:
+            conn = get_pool().acquire()
+            conn._request_bound = True
+            g.db_conn = conn
+        return conn
+    return get_pool().acquire()
+
+
+def release_request_connection(exc=None):
+    """Return the request's connections to their pools (teardown handler)"""
+    conns = [g.pop('db_conn', None), g.pop('db_read_conn', None)]
+    conns.extend(g.pop('db_shard_conns', {}).values())
+    for conn in conns:
+        if conn is not None:
+            conn._request_bound = False
+            conn.close()
+
+
+def init_app(app):
+    """Register per-request connection handling on a Flask app, probe the schema and load the shard map"""
+    app.teardown_appcontext(release_request_connection)
+    try:
+        get_schema()
+        if sharding_enabled():
+            get_shard_map()
+    except Exception as e:
+        # The first request probes again once the database is reachable
+        logger.warning(f"Schema probe deferred, database unavailable: {e}")
+
+
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'SQLITE_JOURNAL_MODE'),
+    ('synchronous', 'SQLITE_SYNCHRONOUS'),
+    ('cache_size', 'SQLITE_CACHE_SIZE'),
+    ('mmap_size', 'SQLITE_MMAP_SIZE'),
+    ('temp_store', 'SQLITE_TEMP_STORE'),
+)
+
 
-def get_sqlite_connection():
-    """Create SQLite database connection for local development"""
+def get_sqlite_connection(path=None, read_only=False):
+    """
+    Create SQLite database connection for local development
+    
+    Args:
+        path: Database file (default: SQLITE_DATABASE)
+        read_only: Refuse writes on this connection (the local replica)
+    """
+    path = path or Config.SQLITE_DATABASE
     try:
-        conn = sqlite3.connect(Config.SQLITE_DATABASE)
+        # Pooled connections move between request threads; each one is only
+        # ever used by a single request at a time. Write transactions begin
+        # IMMEDIATE: they take the write lock up front, waiting for it with
+        # the busy timeout, instead of failing when a deferred transaction
+        # tries to upgrade from reading to writing.
+        conn = sqlite3.connect(path, factory=SQLiteConnection, check_same_thread=False,
+                               detect_types=sqlite3.PARSE_DECLTYPES, timeout=Config.SQLITE_BUSY_TIMEOUT / 1000,
+                               isolation_level='IMMEDIATE')
+        for pragma, setting in SQLITE_PRAGMAS:
+            value = getattr(Config, setting)
+            if value not in (None, ''):
+                conn.execute(f"PRAGMA {pragma} = {value}")
         conn.row_factory = sqlite3.Row
-        logger.info("Connected to SQLite database")
+        conn._path = path
+        conn._file_id = _sqlite_file_id(path)
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            _start_sqlite_maintenance()
+        logger.debug("Opened SQLite connection to %s", path)
         return conn
     except Exception as e:
         logger.error(f"Failed to connect to SQLite: {e}")
         raise
 
-def get_azure_sql_connection():
-    """Create Azure SQL database connection for production"""
+_maintenance_lock = threading.Lock()
+_maintenance_pid = None
+
+
+def sqlite_maintenance(pool=None):
+    """
+    Checkpoint the WAL into the database file and refresh planner statistics
+    
+    A PASSIVE checkpoint copies what it can without waiting for readers or
+    writers; PRAGMA optimize runs ANALYZE only on tables that need it.
+    
+    Args:
+        pool: Pool of the database to maintain (default: the primary)
+    
+    Returns:
+        (busy, WAL frames, frames checkpointed) from wal_checkpoint
+    """
+    pool = pool or get_pool()
+    conn = pool.acquire()
+    try:
+        result = tuple(conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone())
+        conn.execute("PRAGMA optimize")
+        return result
+    finally:
+        pool.release(conn)
+
+
+def _sqlite_maintenance_loop():
+    while True:
+        time.sleep(Config.SQLITE_MAINTENANCE_INTERVAL)
+        if Config.DB_TYPE == 'azure_sql':
+            continue
+        # The shards this worker has opened have WALs of their own
+        for name, pool in [('primary', None)] + [(f"shard {path}", pool) for path, pool in list(_shard_pools.items())]:
+            try:
+                busy, frames, checkpointed = sqlite_maintenance(pool)
+                logger.debug(f"SQLite checkpoint of {name}: {checkpointed} of {frames} WAL frames, busy={busy}")
+            except Exception as e:
+                logger.warning(f"SQLite maintenance of {name} failed: {e}")
+
+
+def _start_sqlite_maintenance():
+    """Start the maintenance thread once per process (threads do not survive fork)"""
+    global _maintenance_pid
+    if Config.SQLITE_MAINTENANCE_INTERVAL <= 0 or _maintenance_pid == os.getpid():
+        return
+    with _maintenance_lock:
+        if _maintenance_pid == os.getpid():
+            return
+        _maintenance_pid = os.getpid()
+    threading.Thread(target=_sqlite_maintenance_loop, name='sqlite-maintenance', daemon=True).start()
+
+
+def get_azure_sql_connection(read_only=False):
+    """
+    Create Azure SQL database connection for production
+    
+    Args:
+        read_only: Connect with ApplicationIntent=ReadOnly, which routes to a
+            readable secondary (on AZURE_SQL_REPLICA_SERVER when set)
+    """
     try:
         import pyodbc
         
         server = Config.AZURE_SQL_SERVER
+        if read_only and Config.AZURE_SQL_REPLICA_SERVER:
+            server = Config.AZURE_SQL_REPLICA_SERVER
         database = Config.AZURE_SQL_DATABASE
         username = Config.AZURE_SQL_USERNAME
         password = Config.AZURE_SQL_PASSWORD
@@ -52,9 +896,11 @@ def get_azure_sql_connection():
             f'TrustServerCertificate=no;'
             f'Connection Timeout=30;'
         )
+        if read_only:
+            connection_string += 'ApplicationIntent=ReadOnly;'
         
-        conn = pyodbc.connect(connection_string)
-        logger.info(f"Connected to Azure SQL database: {database}")
+        conn = AzureSQLConnection(pyodbc.connect(connection_string))
+        logger.debug("Opened Azure SQL connection to %s", database)
         return conn
     except ImportError:
         logger.error("pyodbc not installed. Install with: pip install pyodbc")
@@ -63,61 +909,107 @@ def get_azure_sql_connection():
         logger.error(f"Failed to connect to Azure SQL: {e}")
         raise
 
-def init_database():
-    """Initialize database schema"""
+# Schema capabilities
+
+class SchemaInfo:
+    """Schema version and capability flags detected once per process"""
+
+    def __init__(self, backend, task_columns, version=0, search=None, user_columns=()):
+        self.backend = backend
+        self.task_columns = frozenset(task_columns)
+        self.has_user_id = 'user_id' in self.task_columns
+        # Generated from priority (3 High, 2 Medium, 1 Low) and indexed with user_id
+        self.has_priority_rank = 'priority_rank' in self.task_columns
+        # Every stored date is canonical text once migration 5 has run (SQLite)
+        self.canonical_dates = backend == 'azure_sql' or version >= migrations.CANONICAL_DATES_VERSION
+        # users.task_version counts each user's task changes (API ETags)
+        self.has_task_version = 'task_version' in frozenset(user_columns)
+        # tasks.completed_at and the tasks_archive table (migration 8, see archive.py)
+        self.has_completed_at = 'completed_at' in self.task_columns
+        self.has_archive = version >= migrations.ARCHIVE_VERSION
+        # tasks.updated_at/change_version and task_tombstones (migration 9, the change feed)
+        self.has_change_feed = version >= migrations.CHANGE_FEED_VERSION
+        # Highest applied migration (see migrations.py)
+        self.version = version
+        # Full-text backend: 'fts5', 'fulltext' or None (in-process index)
+        self.search = search
+
+    def __repr__(self):
+        return (f"<SchemaInfo {self.backend} v{self.version} search={self.search} "
+                f"columns={sorted(self.task_columns)}>")
+
+
+_schema = None
+_schema_key = None
+_schema_lock = threading.Lock()
+
+
+def probe_schema():
+    """
+    Apply pending migrations (if AUTO_MIGRATE) and record schema capabilities
+
+    Returns:
+        SchemaInfo describing the database the configuration points at
+    """
+    backend = 'azure_sql' if Config.DB_TYPE == 'azure_sql' else 'sqlite'
     conn = get_db_connection()
-    
-    if Config.DB_TYPE == 'azure_sql':
-        init_azure_sql_schema(conn)
-    else:
-        init_sqlite_schema(conn)
-    
-    conn.close()
-    logger.info("Database initialized successfully")
+    try:
+        if Config.AUTO_MIGRATE:
+            migrations.upgrade(conn, backend)
+        cursor = conn.cursor()
+        try:
+            columns = migrations.table_columns(cursor, backend, 'tasks')
+            search_backend = search.detect_search_backend(cursor, backend) if columns else None
+            user_columns = migrations.table_columns(cursor, backend, 'users')
+        finally:
+            cursor.close()
+        versions = migrations.applied_versions(conn, backend)
+        info = SchemaInfo(backend, columns, max(versions, default=0), search_backend, user_columns)
+        logger.info(f"Detected database schema: {info!r}")
+        return info
+    finally:
+        conn.close()
 
-def init_sqlite_schema(conn):
-    """Initialize SQLite schema"""
-    with open('schema.sql', 'r') as f:
-        conn.executescript(f.read())
-    conn.commit()
 
-def init_azure_sql_schema(conn):
-    """Initialize Azure SQL schema"""
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute("""
-        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='users' AND xtype='U')
-        CREATE TABLE users (
-            id INT IDENTITY(1,1) PRIMARY KEY,
-            username NVARCHAR(80) UNIQUE NOT NULL,
-            email NVARCHAR(120) UNIQUE NOT NULL,
-            password_hash NVARCHAR(255) NOT NULL,
-            created_at DATETIME DEFAULT GETDATE()
-        )
-    """)
-    
-    # Create tasks table with user_id foreign key
-    cursor.execute("""
-        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='tasks' AND xtype='U')
-        CREATE TABLE tasks (
-            id INT IDENTITY(1,1) PRIMARY KEY,
-            title NVARCHAR(255) NOT NULL,
-            description NVARCHAR(MAX),
-            completed BIT DEFAULT 0,
-            priority NVARCHAR(10) NOT NULL DEFAULT 'Medium',
-            category NVARCHAR(100) DEFAULT 'General',
-            due_date DATETIME NULL,
-            created_at DATETIME DEFAULT GETDATE(),
-            user_id INT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-        )
-    """)
-    
-    conn.commit()
-    cursor.close()
+def get_schema():
+    """Return the cached SchemaInfo, probing the database on first use"""
+    global _schema, _schema_key
+    key = current_database_key()
+    info = _schema
+    if info is not None and _schema_key == key:
+        return info
+    with _schema_lock:
+        if _schema is None or _schema_key != key:
+            info = probe_schema()
+            if not info.task_columns:
+                # Nothing to cache until init_database() has created the tables
+                return info
+            _schema = info
+            _schema_key = key
+        return _schema
+
+
+def invalidate_schema():
+    """Forget the cached SchemaInfo so the next get_schema() probes again"""
+    global _schema, _schema_key
+    _schema = None
+    _schema_key = None
 
-def execute_query(query, params=None, fetch_one=False, fetch_all=False):
+
+def init_database():
+    """Initialize database schema by applying all migrations"""
+    conn = get_db_connection()
+    backend = 'azure_sql' if Config.DB_TYPE == 'azure_sql' else 'sqlite'
+    try:
+        migrations.upgrade(conn, backend)
+    finally:
+        conn.close()
+    invalidate_schema()
+    if sharding_enabled():
+        get_shard_map()
+    logger.info("Database initialized successfully")
+
+def execute_query(query, params=None, fetch_one=False, fetch_all=False, name='execute_query'):
     """
     Execute a database query with automatic connection management
     
@@ -126,6 +1018,7 @@ def execute_query(query, params=None, fetch_one=False, fetch_all=False):
         params: Query parameters tuple
         fetch_one: Return single row
         fetch_all: Return all rows
+        name: Query name for the metrics
     
     Returns:
         Query results or row count
@@ -134,16 +1027,9 @@ def execute_query(query, params=None, fetch_one=False, fetch_all=False):
     cursor = conn.cursor()
     
     try:
-        if params:
-            cursor.execute(query, params)
-        else:
-            cursor.execute(query)
-        
-        if fetch_one:
-            result = cursor.fetchone()
-        elif fetch_all:
-            result = cursor.fetchall()
-        else:
+        fetch = 'one' if fetch_one else 'all' if fetch_all else None
+        result = run_query(cursor, name, query, params, fetch=fetch)
+        if fetch is None:
             conn.commit()
             result = cursor.rowcount
         
@@ -170,25 +1056,31 @@ def create_user(username, email, password):
     
     Returns:
         User ID if successful, None if user exists
+
+    The UNIQUE constraints on username and email reject duplicates, so no
+    lookup runs first. Raises PasswordHasherBusy when hashing is saturated.
     """
+    password_hash = hash_password(password)
     try:
-        password_hash = generate_password_hash(password)
         conn = get_db_connection()
         cursor = conn.cursor()
         
         if Config.DB_TYPE == 'azure_sql':
-            cursor.execute(
-                "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
-                (username, email, password_hash)
-            )
+            # pyodbc has no lastrowid; OUTPUT returns the id in the same round-trip
+            user_id = run_query(
+                cursor, 'user_insert',
+                "INSERT INTO users (username, email, password_hash) OUTPUT INSERTED.id VALUES (?, ?, ?)",
+                (username, email, password_hash), fetch='one'
+            )[0]
         else:
-            cursor.execute(
+            run_query(
+                cursor, 'user_insert',
                 "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
                 (username, email, password_hash)
             )
+            user_id = cursor.lastrowid
         
         conn.commit()
-        user_id = cursor.lastrowid
         cursor.close()
         conn.close()
         
@@ -210,10 +1102,11 @@ def get_user_by_username(username):
         User dict or None if not found
     """
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT id, username, email, password_hash FROM users WHERE username = ?", (username,))
-        user = cursor.fetchone()
+        user = run_query(cursor, 'user_by_username',
+                         "SELECT id, username, email, password_hash FROM users WHERE username = ?", (username,),
+                         fetch='one')
         cursor.close()
         conn.close()
         
@@ -241,10 +1134,11 @@ def get_user_by_email(email):
         User dict or None if not found
     """
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT id, username, email, password_hash FROM users WHERE email = ?", (email,))
-        user = cursor.fetchone()
+        user = run_query(cursor, 'user_by_email',
+                         "SELECT id, username, email, password_hash FROM users WHERE email = ?", (email,),
+                         fetch='one')
         cursor.close()
         conn.close()
         
@@ -261,6 +1155,58 @@ def get_user_by_email(email):
         return None
 
 
+def get_user_by_login(username, email=None):
+    """
+    Retrieve the user whose username or email matches, in one indexed query
+
+    Args:
+        username: Username (or email) to search for
+        email: Email to search for (default: username)
+
+    Returns:
+        User dict or None if not found; a username match wins over an email match
+    """
+    email = username if email is None else email
+    try:
+        conn = get_read_connection()
+        cursor = conn.cursor()
+        # Each side of the OR is served by its UNIQUE index
+        rows = run_query(
+            cursor, 'user_by_login',
+            "SELECT id, username, email, password_hash FROM users WHERE username = ? OR email = ?",
+            (username, email), fetch='all'
+        )
+        cursor.close()
+        conn.close()
+
+        users = [dict(zip(('id', 'username', 'email', 'password_hash'), row)) for row in rows]
+        users.sort(key=lambda user: user['username'] != username)
+        return users[0] if users else None
+    except Exception as e:
+        logger.error(f"Failed to get user by login: {e}")
+        return None
+
+
+def _upgrade_password_hash(user, password):
+    """Re-hash a password whose stored hash uses old parameters"""
+    try:
+        new_hash = hash_password(password)
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        # Only replace the hash we verified; a concurrent password change wins
+        run_query(
+            cursor, 'user_upgrade_hash',
+            "UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+            (new_hash, user['id'], user['password_hash'])
+        )
+        conn.commit()
+        cursor.close()
+        conn.close()
+        logger.info(f"Upgraded password hash for user {user['id']}")
+    except Exception as e:
+        logger.warning(f"Could not upgrade password hash for user {user['id']}: {e}")
+
+
 def verify_user(username, password):
     """
     Verify user credentials
@@ -271,13 +1217,13 @@ def verify_user(username, password):
     
     Returns:
         User dict if valid, None if invalid
+
+    Raises PasswordHasherBusy when hashing is saturated.
     """
-    # Try username first, then email
-    user = get_user_by_username(username)
-    if not user:
-        user = get_user_by_email(username)
-    
-    if user and check_password_hash(user['password_hash'], password):
+    user = get_user_by_login(username)
+    if user and verify_password(user['password_hash'], password):
+        if needs_rehash(user['password_hash']):
+            _upgrade_password_hash(user, password)
         return user
     return None
 
@@ -293,10 +1239,10 @@ def get_user_by_id(user_id):
         User dict or None if not found
     """
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT id, username, email FROM users WHERE id = ?", (user_id,))
-        user = cursor.fetchone()
+        user = run_query(cursor, 'user_by_id', "SELECT id, username, email FROM users WHERE id = ?", (user_id,),
+                         fetch='one')
         cursor.close()
         conn.close()
         
@@ -310,3 +1256,232 @@ def get_user_by_id(user_id):
     except Exception as e:
         logger.error(f"Failed to get user by ID: {e}")
         return None
+
+
+def get_task_version(user_id):
+    """
+    Retrieve a user's task change counter
+    
+    Args:
+        user_id: User ID
+    
+    Returns:
+        Integer bumped by every change to the user's tasks, or None when the
+        database predates migration 4
+    
+    With sharding on, the counter is kept on the user's shard, next to the tasks.
+    """
+    if sharding_enabled():
+        conn = get_task_connection(user_id)
+        cursor = conn.cursor()
+        try:
+            row = run_query(cursor, 'task_version', "SELECT version FROM task_versions WHERE user_id = ?",
+                            (user_id,), fetch='one')
+            return row[0] if row else 0
+        finally:
+            cursor.close()
+            conn.close()
+    if not get_schema().has_task_version:
+        return None
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    try:
+        row = run_query(cursor, 'task_version', "SELECT task_version FROM users WHERE id = ?", (user_id,),
+                        fetch='one')
+        return row[0] if row else None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def bump_task_version(cursor, user_id):
+    """
+    Count a change to a user's tasks inside the caller's transaction
+    
+    Args:
+        cursor: Cursor of the transaction that changes the tasks
+        user_id: Owner of the changed tasks
+    """
+    if sharding_enabled():
+        run_query(cursor, 'task_version_bump',
+                  "INSERT INTO task_versions (user_id, version) VALUES (?, 1) "
+                  "ON CONFLICT (user_id) DO UPDATE SET version = version + 1", (user_id,))
+    elif get_schema().has_task_version:
+        run_query(cursor, 'task_version_bump', "UPDATE users SET task_version = task_version + 1 WHERE id = ?",
+                  (user_id,))
+
+
+def next_task_version_sql(owner='?'):
+    """
+    SQL for the value the owner's next bump_task_version() sets
+    
+    Changed rows are stamped with it (tasks.change_version) by the statement
+    that changes them, before the counter is bumped in the same transaction.
+    Writers of one user take turns (the SQLite write lock, UPDLOCK on Azure
+    SQL), so versions are committed in order and the change feed misses
+    nothing after a version it has handed out.
+    
+    Args:
+        owner: SQL naming the owner: '?' to bind the user id, or a column
+            such as 'tasks.user_id' for rows of several users
+    """
+    if sharding_enabled():
+        return f"(SELECT COALESCE(MAX(version), 0) + 1 FROM task_versions WHERE user_id = {owner})"
+    if Config.DB_TYPE == 'azure_sql':
+        return f"(SELECT task_version + 1 FROM users WITH (UPDLOCK) WHERE users.id = {owner})"
+    return f"(SELECT task_version + 1 FROM users WHERE users.id = {owner})"
+
+
+_coalescer = None
+_shard_coalescers = {}
+_coalescer_lock = threading.Lock()
+
+
+def _connect_shard(shard):
+    """Open a connection to a shard outside its pool (the shard's group commit writer)"""
+    get_shard_pool(shard)  # creates and migrates the file
+    return get_sqlite_connection(shard_database_path(shard))
+
+
+def get_write_coalescer(shard=None):
+    """
+    Return the process-wide WriteCoalescer, or None when WRITE_COALESCE is off or not SQLite
+    
+    Args:
+        shard: Shard whose writes to coalesce; each shard has its own writer
+    """
+    global _coalescer
+    if not Config.WRITE_COALESCE or Config.DB_TYPE == 'azure_sql':
+        return None
+    if shard is not None:
+        path = shard_database_path(shard)
+        coalescer = _shard_coalescers.get(path)
+        if coalescer is None:
+            with _coalescer_lock:
+                coalescer = _shard_coalescers.get(path)
+                if coalescer is None:
+                    coalescer = _shard_coalescers[path] = WriteCoalescer(
+                        functools.partial(_connect_shard, shard), Config.WRITE_COALESCE_WINDOW_MS / 1000,
+                        Config.WRITE_COALESCE_MAX_BATCH
+                    )
+        return coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = WriteCoalescer(
+                    get_sqlite_connection, Config.WRITE_COALESCE_WINDOW_MS / 1000,
+                    Config.WRITE_COALESCE_MAX_BATCH, key=current_database_key
+                )
+    return _coalescer
+
+
+def run_write(work, user_id=None):
+    """
+    Run work(cursor) in a committed write transaction
+    
+    With WRITE_COALESCE on (SQLite), the write joins other requests' writes
+    in one group commit (see group_commit.py); otherwise it runs and commits
+    on the request's connection.
+    
+    Args:
+        work: Callable(cursor) making the changes; must not commit
+        user_id: Owner of the tasks work changes; with sharding on, the
+            write runs on that user's shard
+    
+    Returns:
+        What work returned, once it is committed; exceptions propagate
+    """
+    shard = shard_of(user_id) if user_id is not None and sharding_enabled() else None
+    coalescer = get_write_coalescer(shard)
+    if coalescer is not None:
+        return coalescer.submit(work)
+    conn = get_db_connection() if shard is None else get_shard_connection(shard)
+    cursor = conn.cursor()
+    try:
+        result = work(cursor)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()  # a no-op for the request's own connection
+
+
+def ping_database(timeout):
+    """
+    Check out a pooled connection and run SELECT 1 on it within a deadline
+    
+    Args:
+        timeout: Seconds allowed for the checkout and, on Azure SQL, the query
+    
+    Raises PoolTimeout or the driver's error when the database is unavailable.
+    """
+    pool = get_pool()
+    conn = pool.acquire(timeout=timeout)
+    azure = isinstance(conn, AzureSQLConnection)
+    try:
+        if azure:
+            # pyodbc query timeout, in whole seconds (0 = none)
+            conn._raw.timeout = max(1, int(timeout + 0.999))
+        cursor = conn.cursor()
+        try:
+            run_query(cursor, 'ready_ping', "SELECT 1", fetch='one')
+        finally:
+            cursor.close()
+    finally:
+        if azure:
+            conn._raw.timeout = 0
+        pool.release(conn)
+
+
+def count_table_rows(tables=('tasks', 'users')):
+    """
+    Row counts of tables, for the health statistics
+    
+    Azure SQL reads the approximate counts it keeps in sys.partitions, which
+    costs the same however large the tables are. SQLite keeps no such counts
+    (sqlite_stat1 only changes on ANALYZE), so it counts the rows.
+    
+    Counted on the replica while it is usable. With sharding on, the tasks
+    of every shard are added up.
+    
+    Returns:
+        (dict of table name -> rows, source of the counts)
+    """
+    pool = get_replica_pool() if replica_usable() else get_pool()
+    conn = pool.acquire()
+    cursor = conn.cursor()
+    try:
+        if isinstance(conn, AzureSQLConnection):
+            placeholders = ', '.join('?' * len(tables))
+            rows = run_query(
+                cursor, 'table_stats',
+                f"""
+                SELECT t.name, SUM(p.rows) FROM sys.tables t
+                JOIN sys.partitions p ON p.object_id = t.object_id
+                WHERE p.index_id IN (0, 1) AND t.name IN ({placeholders})
+                GROUP BY t.name
+                """,
+                tuple(tables), fetch='all'
+            )
+            return {name: int(count) for name, count in rows}, 'sys.partitions'
+        placeholders = ', '.join('?' * len(tables))
+        existing = run_query(cursor, 'table_stats',
+                             f"SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})",
+                             tuple(tables), fetch='all')
+        counts = {}
+        for (table,) in existing:
+            counts[table] = run_query(cursor, 'table_stats', f"SELECT COUNT(*) FROM {table}", fetch='one')[0]
+    finally:
+        cursor.close()
+        pool.release(conn)
+    # Only once the connection is back: loading the shard map takes one from
+    # the same pool, which may hold a single connection (sync profile)
+    if sharding_enabled() and 'tasks' in counts:
+        for _, rows in for_each_shard(
+                lambda shard_cursor: run_query(shard_cursor, 'table_stats', "SELECT COUNT(*) FROM tasks",
+                                               fetch='one')[0]):
+            counts['tasks'] += rows
+    return counts, 'count'
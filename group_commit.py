@@ -0,0 +1,150 @@
+"""
+Group commit: merge concurrent write transactions into one
+
+SQLite has a single writer, and every commit syncs the WAL to disk, so a
+burst of task writes from a threaded worker queues up one sync per row.
+With WRITE_COALESCE on, routes hand their writes to the worker's
+WriteCoalescer instead of committing themselves. A writer thread takes
+every write that arrived while the previous commit was running (at most
+WRITE_COALESCE_MAX_BATCH, optionally waiting WRITE_COALESCE_WINDOW_MS for
+more), runs each in its own savepoint and commits them together. A write
+that fails is rolled back to its savepoint alone; each caller gets its own
+result or exception, and only after the commit that made its write durable.
+
+Batches only form when a worker runs requests concurrently (gthread or
+gevent). A sync worker serves one request at a time and gains nothing.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingWrite:
+    __slots__ = ('work', 'result', 'error', 'done')
+
+    def __init__(self, work):
+        self.work = work
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class WriteCoalescer:
+    """Per-process queue of write transactions committed in batches by one thread"""
+
+    def __init__(self, connect, window=0, max_batch=64, key=None):
+        """
+        Args:
+            connect: Callable returning a new SQLite connection for the writer thread
+            window: Seconds to wait for more writes after the first one arrives;
+                with 0, a batch is whatever queued during the previous commit
+            max_batch: Most writes committed together
+            key: Optional callable naming the database; the writer reconnects
+                when it changes
+        """
+        self.connect = connect
+        self.key = key or (lambda: None)
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._thread_pid = None
+        self._conn = None
+        self._conn_key = None
+        self.batches = 0
+        self.writes = 0
+
+    def submit(self, work):
+        """
+        Run work(cursor) in the next batch and wait for its commit
+
+        Returns:
+            What work returned; raises what work raised, or the commit error
+        """
+        pending = _PendingWrite(work)
+        with self._cond:
+            if self._thread_pid != os.getpid():
+                # First use in this process (threads do not survive fork)
+                self._thread_pid = os.getpid()
+                self._queue.clear()
+                self._conn = None
+                threading.Thread(target=self._run, name='group-commit', daemon=True).start()
+            self._queue.append(pending)
+            self._cond.notify()
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            if self.window > 0:
+                deadline = time.monotonic() + self.window
+                while len(self._queue) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            return [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._commit(batch)
+            except Exception as e:
+                for pending in batch:
+                    if pending.error is None:
+                        pending.error = e
+            finally:
+                for pending in batch:
+                    pending.done.set()
+
+    def _commit(self, batch):
+        key = self.key()
+        if self._conn is not None and self._conn_key != key:
+            self._conn.close()
+            self._conn = None
+        if self._conn is None:
+            self._conn = self.connect()
+            self._conn_key = key
+        conn = self._conn
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for index, pending in enumerate(batch):
+                savepoint = f"write_{index}"
+                cursor.execute(f"SAVEPOINT {savepoint}")
+                try:
+                    pending.result = pending.work(cursor)
+                except Exception as e:
+                    cursor.execute(f"ROLLBACK TO {savepoint}")
+                    pending.error = e
+                cursor.execute(f"RELEASE {savepoint}")
+            conn.commit()
+        except Exception as e:
+            logger.warning(f"Group commit of {len(batch)} writes failed: {e}")
+            # Nothing in the batch is durable; open a fresh connection next time
+            self._conn = None
+            try:
+                conn.close()
+            except Exception:
+                pass
+            for pending in batch:
+                pending.result = None
+                if pending.error is None:
+                    pending.error = e
+            return
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        self.batches += 1
+        self.writes += len(batch)
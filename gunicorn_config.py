@@ -1,21 +1,71 @@
 # Gunicorn configuration for production deployment
 # Use this for Azure App Service and production environments
+#
+# Worker profile (GUNICORN_PROFILE):
+#   sync    - one request per process; simplest, most memory per request
+#   gthread - a thread pool per process; requests overlap while waiting on the database
+#   gevent  - greenlets per process; best for many slow or idle clients
+# GUNICORN_WORKERS, GUNICORN_THREADS and GUNICORN_WORKER_CONNECTIONS override the profile.
+#
+# Prometheus metrics are collected in multiprocess mode (see metrics.py): the
+# workers write them to PROMETHEUS_MULTIPROC_DIR, and any worker's /metrics or,
+# with METRICS_PORT set, a listener in the master process serves the total.
 
+import importlib.util
 import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+cpu_count = multiprocessing.cpu_count()
+
+PROFILES = {
+    'sync': {'worker_class': 'sync', 'workers': cpu_count * 2 + 1, 'threads': 1, 'db_pool_size': 1},
+    'gthread': {'worker_class': 'gthread', 'workers': cpu_count + 1, 'threads': 8, 'db_pool_size': 8},
+    # pyodbc and sqlite3 block the whole worker while a query runs, so
+    # greenlets overlap client I/O but not database calls
+    'gevent': {'worker_class': 'gevent', 'workers': cpu_count + 1, 'threads': 1, 'db_pool_size': 10},
+}
+
+profile_name = os.environ.get('GUNICORN_PROFILE', 'sync').lower()
+if profile_name not in PROFILES:
+    sys.stderr.write(f"Unknown GUNICORN_PROFILE {profile_name!r}, using sync\n")
+    profile_name = 'sync'
+if profile_name == 'gevent' and importlib.util.find_spec('gevent') is None:
+    sys.stderr.write("gevent is not installed, using the gthread profile\n")
+    profile_name = 'gthread'
+profile = PROFILES[profile_name]
 
 # Server Socket
 bind = "0.0.0.0:8000"
 backlog = 2048
 
 # Worker Processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = 'sync'
-worker_connections = 1000
+workers = int(os.environ.get('GUNICORN_WORKERS', profile['workers']))
+worker_class = profile['worker_class']
+threads = int(os.environ.get('GUNICORN_THREADS', profile['threads']))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '1000'))
 max_requests = 1000
 max_requests_jitter = 50
-timeout = 120
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
 keepalive = 5
 
+# One pooled connection per concurrent request in each worker (see database.ConnectionPool);
+# workers import config.py after this file runs, so the default reaches them.
+os.environ.setdefault('DB_POOL_SIZE', str(max(threads, profile['db_pool_size'])))
+# Likewise one password hash slot per concurrent request, so logins only
+# queue for the hashing pool once every request thread is signing in
+os.environ.setdefault('PASSWORD_HASH_MAX_PENDING', str(max(threads, profile['db_pool_size'])))
+
+# Prometheus multiprocess mode; workers inherit the directory before they
+# import prometheus_client. By default one private directory per master,
+# made by mkdtemp (an unguessable name, mode 0700) and removed on exit.
+metrics_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if not metrics_dir:
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='taskmanager-prometheus-')
+metrics_port = int(os.environ.get('METRICS_PORT', '0'))  # 0 = only /metrics on the app port
+
 # Logging
 accesslog = '-'
 errorlog = '-'
@@ -36,3 +86,53 @@ tmp_upload_dir = None
 limit_request_line = 4096
 limit_request_fields = 100
 limit_request_field_size = 8190
+
+
+# Server Hooks
+def on_starting(server):
+    """
+    Start from an empty, private metrics directory; files left by an earlier
+    run would be summed in, and files another user can write would be trusted
+
+    Raises:
+        OSError: PROMETHEUS_MULTIPROC_DIR exists but is not a 0700 directory
+            owned by this user; gunicorn then refuses to start
+    """
+    from cache import private_directory
+
+    private_directory(metrics_dir)
+    for entry in os.scandir(metrics_dir):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.unlink(entry.path)
+
+
+def when_ready(server):
+    """Serve the merged metrics of all workers from the master on METRICS_PORT"""
+    if not metrics_port:
+        return
+    try:
+        from prometheus_client import start_http_server
+        from prometheus_client.multiprocess import MultiProcessCollector
+        from prometheus_client.registry import CollectorRegistry
+    except ImportError:
+        server.log.warning("prometheus_client is not installed, METRICS_PORT ignored")
+        return
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry, path=metrics_dir)
+    start_http_server(metrics_port, registry=registry)
+    server.log.info("Serving metrics on port %s", metrics_port)
+
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges (e.g. a worker recycled by max_requests)"""
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid, metrics_dir)
+
+
+def on_exit(server):
+    shutil.rmtree(metrics_dir, ignore_errors=True)
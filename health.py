@@ -0,0 +1,82 @@
+"""
+Table statistics for the health endpoints, refreshed off the request path
+
+Counting rows on every health probe scans the tables each time a load
+balancer or container runtime asks. TableStats keeps the last counts in
+memory and a daemon thread in each worker refreshes them every
+HEALTH_STATS_INTERVAL seconds, so the endpoints only read a dict.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class TableStats:
+    """Per-worker snapshot of table row counts kept fresh by a background thread"""
+
+    def __init__(self, fetch, interval=60, key=None):
+        """
+        Args:
+            fetch: Callable returning (dict of table -> rows, source)
+            interval: Seconds between refreshes
+            key: Optional callable naming the database; counts taken from
+                another database are fetched again
+        """
+        self.fetch = fetch
+        self.interval = interval
+        self.key = key or (lambda: None)
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._thread_pid = None
+
+    def refresh(self):
+        """Fetch the counts now and keep them"""
+        key = self.key()
+        counts, source = self.fetch()
+        snapshot = {
+            '_key': key,
+            'tables': counts,
+            'source': source,
+            'refreshed_at': datetime.now().isoformat(timespec='seconds'),
+            '_refreshed': time.monotonic(),
+        }
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Could not refresh table statistics: {e}")
+
+    def _ensure_thread(self):
+        # Threads do not survive fork, so each worker starts its own
+        pid = os.getpid()
+        with self._lock:
+            if self._thread_pid == pid:
+                return
+            self._thread_pid = pid
+        threading.Thread(target=self._run, name='table-stats', daemon=True).start()
+
+    def get(self):
+        """
+        Return the latest counts, fetching them in the caller on first use
+
+        Returns:
+            Dict with tables, source, refreshed_at and age_seconds
+        """
+        self._ensure_thread()
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot is None or snapshot['_key'] != self.key():
+            snapshot = self.refresh()
+        result = {key: value for key, value in snapshot.items() if not key.startswith('_')}
+        result['age_seconds'] = round(time.monotonic() - snapshot['_refreshed'], 1)
+        return result
@@ -0,0 +1,210 @@
+"""
+Non-blocking log pipeline
+
+Request threads only put records on a bounded in-memory queue
+(QueueHandler); a QueueListener thread formats them and writes them to stdout
+and the log file. When the queue is full, records are
+dropped and counted rather than making a request wait on disk.
+
+Every gunicorn worker appends to the same LOG_FILE, so none of them rotates
+it: the stdlib rotating handlers are not safe across processes (each would
+roll over on its own, losing and interleaving lines). Rotation is left to
+logrotate; WatchedFileHandler reopens the file once it has been moved.
+
+Hot INFO/DEBUG messages are rate limited per (logger, message template), and
+loggers can be sampled (LOG_SAMPLING). Warnings and errors always pass.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_traceback_formatter = logging.Formatter()
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most `limit` INFO/DEBUG records per (logger, message
+    template) per `window` seconds
+
+    The first record after a suppressed stretch reports how many were dropped.
+    """
+
+    def __init__(self, limit=10, window=60.0):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._counts = {}  # (logger, template) -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.limit <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            state = self._counts.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._counts[key] = [now, 1, 0]
+                if len(self._counts) > 10000:
+                    # Unbounded templates (f-strings); start over rather than grow
+                    self._counts = {key: self._counts[key]}
+                if suppressed:
+                    record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+                return True
+            if state[1] < self.limit:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of the INFO/DEBUG records of chosen loggers (and their children)"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates  # logger name -> fraction kept
+
+    def _rate(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return None
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate is None or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge the arguments now (they may change before the listener runs),
+        # but leave the layout to the listener's formatter
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sampling(value):
+    """Parse 'logger=fraction,...' into a dict"""
+    rates = {}
+    for part in (value or '').split(','):
+        if '=' in part:
+            name, _, rate = part.partition('=')
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def _file_handler(settings):
+    return logging.handlers.WatchedFileHandler(settings.LOG_FILE, encoding='utf-8', delay=True)
+
+
+_listener = None
+
+
+def configure_logging(settings):
+    """
+    Route the root logger through a queue to stdout and the log file
+
+    Args:
+        settings: Object with the LOG_* attributes of config.Config
+
+    Returns:
+        The DroppingQueueHandler installed on the root logger
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    formatter = JSONFormatter() if settings.LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if settings.LOG_FILE:
+        handlers.append(_file_handler(settings))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    queue_handler.addFilter(RateLimitFilter(settings.LOG_RATE_LIMIT, settings.LOG_RATE_WINDOW))
+    rates = parse_sampling(settings.LOG_SAMPLING)
+    if rates:
+        queue_handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(settings.LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return queue_handler
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_listener_after_fork():
+    # The listener thread does not survive fork (gunicorn --preload)
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
+
+
+atexit.register(stop_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listener_after_fork)
@@ -0,0 +1,210 @@
+"""
+Request and database instrumentation for Prometheus
+
+Every database statement the app runs goes through run_query() with a name
+('fetch_tasks', 'toggle_task', 'user_by_login', ...), which records its
+duration (executing and fetching the rows), the rows returned or changed,
+and failures per name. Each request is split into the time spent in the
+database, in rendering templates and in the remaining Python code, and its
+database round-trips are counted, so a slow endpoint shows where its time
+goes.
+
+Under gunicorn every worker has its own registry, so gunicorn_config.py
+sets PROMETHEUS_MULTIPROC_DIR: workers write their samples to files there
+and generate() merges the files of all workers, dead ones included, into
+one scrape. Gauges declare how their per-worker values combine.
+
+Everything is a no-op when prometheus_client is not installed.
+"""
+import os
+import time
+
+from flask import g, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                                   generate_latest, multiprocess)
+
+    PROMETHEUS_AVAILABLE = True
+    # Statements on a local SQLite file take tens of microseconds
+    QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+    REQUEST_COUNT = Counter('http_requests_total', 'Total HTTP requests', ['method', 'endpoint', 'status'])
+    REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency', ['method', 'endpoint'])
+    REQUEST_PHASE = Histogram('http_request_phase_seconds', 'Request time spent in the database, templates and Python',
+                              ['endpoint', 'phase'], buckets=QUERY_BUCKETS)
+    REQUEST_DB_QUERIES = Histogram('http_request_db_queries', 'Database round-trips per request', ['endpoint'],
+                                   buckets=(0, 1, 2, 3, 4, 5, 8, 12, 20, 50))
+    DB_QUERY_LATENCY = Histogram('db_query_duration_seconds', 'Database statement time, including fetching rows',
+                                 ['query'], buckets=QUERY_BUCKETS)
+    DB_QUERY_ROWS = Histogram('db_query_rows', 'Rows returned or changed per statement', ['query'],
+                              buckets=(0, 1, 5, 10, 25, 50, 100, 250, 1000, 5000))
+    DB_QUERY_ERRORS = Counter('db_query_errors_total', 'Failed database statements', ['query'])
+    DB_BUSY_RETRIES = Counter('db_busy_retries_total', 'SQLite statements retried after the database stayed locked')
+    DB_CONNECTIONS_OPENED = Counter('db_connections_opened_total', 'Database connections opened by the pool')
+    DB_POOL_CONNECTIONS = Gauge('db_pool_connections', 'Pooled database connections (open, in_use)', ['state'],
+                                multiprocess_mode='livesum')
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+
+class QueryTimer:
+    """
+    Context manager recording one database round-trip as query `name`
+
+    Set .rows inside the block to record the rows returned or changed.
+    """
+    __slots__ = ('name', 'rows', '_start')
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record_query(self.name, time.perf_counter() - self._start, self.rows, error=exc_type is not None)
+        return False
+
+
+_query_series = {}  # name -> (latency, rows) children; labels() takes a lock per call
+
+
+def record_query(name, seconds, rows=0, error=False):
+    """Record one database round-trip, and add it to the current request's totals"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+    if error:
+        DB_QUERY_ERRORS.labels(query=name).inc()
+    else:
+        series = _query_series.get(name)
+        if series is None:
+            series = _query_series[name] = (DB_QUERY_LATENCY.labels(query=name), DB_QUERY_ROWS.labels(query=name))
+        series[0].observe(seconds)
+        series[1].observe(rows)
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_seconds = g.get('db_seconds', 0.0) + seconds
+
+
+def run_query(cursor, name, sql, params=(), fetch=None, many=False):
+    """
+    Execute sql on cursor and record it as query `name`
+
+    The timing includes fetching the rows: SQLite does most of the work of a
+    SELECT while rows are fetched.
+
+    Args:
+        cursor: DB-API cursor
+        name: Query name used as the metric label, e.g. 'fetch_tasks'
+        sql: SQL statement
+        params: Statement parameters (a sequence of them when many is True)
+        fetch: None to leave any rows on the cursor, 'one' or 'all' to fetch them
+        many: Run the statement once per parameter set with executemany
+
+    Returns:
+        The fetched row (or None) for 'one', the list of rows for 'all',
+        otherwise the cursor
+    """
+    with QueryTimer(name) as timer:
+        if many:
+            cursor.executemany(sql, params)
+        elif params:
+            cursor.execute(sql, params)
+        else:
+            cursor.execute(sql)
+        if fetch == 'one':
+            result = cursor.fetchone()
+            timer.rows = 0 if result is None else 1
+        elif fetch == 'all':
+            result = cursor.fetchall()
+            timer.rows = len(result)
+        else:
+            result = cursor
+            timer.rows = max(cursor.rowcount, 0)
+    return result
+
+
+def record_busy_retry():
+    """Count a statement retried because SQLite stayed locked"""
+    if PROMETHEUS_AVAILABLE:
+        DB_BUSY_RETRIES.inc()
+
+
+def record_connection_opened():
+    """Count a new physical database connection"""
+    if PROMETHEUS_AVAILABLE:
+        DB_CONNECTIONS_OPENED.inc()
+
+
+def set_pool_connections(open_count, in_use):
+    """Publish the size of this worker's connection pool"""
+    if PROMETHEUS_AVAILABLE:
+        DB_POOL_CONNECTIONS.labels(state='open').set(open_count)
+        DB_POOL_CONNECTIONS.labels(state='in_use').set(in_use)
+
+
+def multiprocess_dir():
+    """Return the directory shared by the workers' metric files, or None"""
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR') or None
+
+
+def multiprocess_registry(path=None):
+    """Return a registry that merges the metric files of every worker in path"""
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=path or multiprocess_dir())
+    return registry
+
+
+def generate():
+    """
+    Render the metrics in the Prometheus text format
+
+    Returns:
+        (body, content type); the body covers every worker in multiprocess mode
+    """
+    registry = multiprocess_registry() if multiprocess_dir() else REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def _render_started(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+
+def _render_finished(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        g.render_seconds = g.get('render_seconds', 0.0) + time.perf_counter() - started
+
+
+def init_app(app):
+    """Time every request of app and split it into database, template and Python time"""
+    if not PROMETHEUS_AVAILABLE:
+        return
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        total = time.perf_counter() - started
+        endpoint = request.endpoint or 'unknown'
+        db_seconds = g.get('db_seconds', 0.0)
+        render_seconds = g.get('render_seconds', 0.0)
+        REQUEST_LATENCY.labels(method=request.method, endpoint=endpoint).observe(total)
+        REQUEST_COUNT.labels(method=request.method, endpoint=endpoint, status=response.status_code).inc()
+        REQUEST_DB_QUERIES.labels(endpoint=endpoint).observe(g.get('db_queries', 0))
+        REQUEST_PHASE.labels(endpoint=endpoint, phase='db').observe(db_seconds)
+        REQUEST_PHASE.labels(endpoint=endpoint, phase='render').observe(render_seconds)
+        REQUEST_PHASE.labels(endpoint=endpoint, phase='python').observe(max(total - db_seconds - render_seconds, 0.0))
+        return response
+
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
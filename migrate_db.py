@@ -1,11 +1,23 @@
 """
-Migration script to add users table and update tasks table with user_id column.
-This will backup the old database and create the new schema.
+Database migration command line tool.
+
+Applies the numbered migrations from migrations.py to SQLite or Azure SQL.
+Legacy SQLite files without users are first backed up and converted
+(users table plus tasks.user_id), as before.
+
+Usage:
+    python migrate_db.py                 # apply all pending migrations
+    python migrate_db.py --dry-run       # show what would run
+    python migrate_db.py --status        # list applied and pending migrations
+    python migrate_db.py --check-indexes # verify hot queries use the task indexes
 """
+import argparse
 import sqlite3
 import shutil
+import sys
 from datetime import datetime
-from database import init_database, Config
+from database import get_db_connection, invalidate_schema, Config
+import migrations
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -114,14 +126,57 @@ def migrate_sqlite():
         cursor.close()
         conn.close()
 
-if __name__ == "__main__":
-    logger.info("Starting database migration...")
-    
-    if Config.DB_TYPE == 'sqlite':
-        migrate_sqlite()
-    elif Config.DB_TYPE == 'azure_sql':
-        logger.info("For Azure SQL, run init_azure_db.py to create the new schema")
-    else:
+def run(args):
+    """Run the requested migration command; returns a process exit code"""
+    if Config.DB_TYPE not in ('sqlite', 'azure_sql'):
         logger.error(f"Unknown database type: {Config.DB_TYPE}")
-    
-    logger.info("Migration process complete!")
+        return 1
+    backend = Config.DB_TYPE
+
+    if backend == 'sqlite' and not (args.dry_run or args.status or args.check_indexes):
+        migrate_sqlite()
+
+    conn = get_db_connection()
+    try:
+        if args.status:
+            applied = migrations.applied_versions(conn, backend)
+            for migration in migrations.MIGRATIONS:
+                state = 'applied' if migration.version in applied else 'pending'
+                print(f"{migration.version:04d}_{migration.name}: {state}")
+            return 0
+
+        if args.check_indexes:
+            ok = True
+            for name, index, plan in migrations.check_index_usage(conn, backend):
+                print(f"{name}: {index or 'NO TASK INDEX'}")
+                if index is None:
+                    ok = False
+                    print(f"    {plan}")
+            return 0 if ok else 1
+
+        ran = migrations.upgrade(conn, backend, target=args.target, dry_run=args.dry_run)
+        verb = 'Would apply' if args.dry_run else 'Applied'
+        for migration, steps in ran:
+            print(f"{verb} {migration.version:04d}_{migration.name}")
+            for step in steps:
+                print(f"    {step}")
+        if not ran:
+            print("Database schema is up to date")
+        invalidate_schema()
+        return 0
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply versioned database migrations")
+    parser.add_argument('--dry-run', action='store_true', help='show pending migrations without applying them')
+    parser.add_argument('--status', action='store_true', help='list applied and pending migrations')
+    parser.add_argument('--target', type=int, help='highest migration version to apply')
+    parser.add_argument('--check-indexes', action='store_true',
+                        help='explain the hot task queries and fail if one skips the task indexes')
+    return run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,492 @@
+"""
+Versioned schema migrations for SQLite and Azure SQL
+
+Each migration has a number, a name and a list of idempotent up-steps per
+backend. Applied versions are recorded in the schema_migrations table, and
+runs are serialised with BEGIN IMMEDIATE on SQLite or a session-level
+application lock on Azure SQL, so several workers can start at once safely.
+"""
+import logging
+import os
+from datetime import datetime
+
+import search
+from task_queries import PRIORITY_RANK_SQL, SQLITE_DATETIME_FORMAT, TaskFilters, build_task_list_query
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+
+class MigrationBlocked(Exception):
+    """Raised by a step when the database needs manual work before it can run"""
+
+
+class Migration:
+    """A numbered schema change with up-steps for each backend"""
+
+    def __init__(self, version, name, sqlite, azure_sql):
+        self.version = version
+        self.name = name
+        self.steps = {'sqlite': sqlite, 'azure_sql': azure_sql}
+
+    def __repr__(self):
+        return f"<Migration {self.version:04d}_{self.name}>"
+
+
+def table_columns(cursor, backend, table):
+    """Return the column names of a table (empty if it does not exist)"""
+    if backend == 'azure_sql':
+        cursor.execute("SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ?", (table,))
+        return {row[0] for row in cursor.fetchall()}
+    # table_xinfo also lists generated columns
+    cursor.execute(f"PRAGMA table_xinfo({table})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def _schema_sql_statements():
+    """Split schema.sql into statements that can run inside a transaction"""
+    with open(SCHEMA_FILE) as f:
+        lines = [line for line in f if not line.lstrip().startswith('--')]
+    return [stmt.strip() for stmt in ''.join(lines).split(';') if stmt.strip()]
+
+
+def _add_optional_columns(alters, table='tasks'):
+    """Build a step adding columns introduced after the first release"""
+    def step(cursor, backend):
+        existing = table_columns(cursor, backend, table)
+        for name, alter_stmt in alters:
+            if name not in existing:
+                cursor.execute(alter_stmt)
+                logger.info(f"Added {name} column to {backend} {table} table")
+    step.__doc__ = "Add missing columns: " + ", ".join(name for name, _ in alters)
+    return step
+
+
+def _require_user_id(cursor, backend):
+    """Require tasks.user_id (legacy SQLite files: run migrate_db.py first)"""
+    if 'user_id' not in table_columns(cursor, backend, 'tasks'):
+        raise MigrationBlocked("tasks.user_id is missing; run `python migrate_db.py` to assign owners")
+
+
+def _canonical_sqlite_dates(cursor, backend):
+    """Rewrite task dates as 'YYYY-MM-DD HH:MM:SS' (ISO 'T', fractional and short forms)"""
+    for column in ('due_date', 'created_at'):
+        canonical = f"strftime('{SQLITE_DATETIME_FORMAT}', {column})"
+        cursor.execute(
+            f"UPDATE tasks SET {column} = {canonical} "
+            f"WHERE {column} IS NOT NULL AND {canonical} IS NOT NULL AND {column} <> {canonical}"
+        )
+        logger.info(f"Normalised {cursor.rowcount} {column} values")
+
+
+def _backfill_completed_at(cursor, backend):
+    """Date tasks completed before completed_at existed by their creation"""
+    cursor.execute("UPDATE tasks SET completed_at = created_at WHERE completed = 1 AND completed_at IS NULL")
+    logger.info(f"Set completed_at of {cursor.rowcount} completed tasks")
+
+
+SQLITE_ARCHIVE_TABLE = """
+    CREATE TABLE IF NOT EXISTS tasks_archive (
+        id INTEGER PRIMARY KEY,
+        title VARCHAR(255) NOT NULL,
+        description TEXT,
+        completed BOOLEAN DEFAULT 1,
+        priority VARCHAR(10) NOT NULL DEFAULT 'Medium',
+        category VARCHAR(100) DEFAULT 'General',
+        due_date DATETIME,
+        created_at DATETIME,
+        user_id INTEGER NOT NULL,
+        completed_at DATETIME,
+        archived_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+AZURE_ARCHIVE_TABLE = """
+    IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='tasks_archive' AND xtype='U')
+    CREATE TABLE tasks_archive (
+        id INT PRIMARY KEY,
+        title NVARCHAR(255) NOT NULL,
+        description NVARCHAR(MAX),
+        completed BIT DEFAULT 1,
+        priority NVARCHAR(10) NOT NULL DEFAULT 'Medium',
+        category NVARCHAR(100) DEFAULT 'General',
+        due_date DATETIME NULL,
+        created_at DATETIME NULL,
+        user_id INT NOT NULL,
+        completed_at DATETIME NULL,
+        archived_at DATETIME NOT NULL DEFAULT GETDATE()
+    )
+"""
+
+
+def _backfill_updated_at(cursor, backend):
+    """Date tasks changed before updated_at existed by their creation"""
+    cursor.execute("UPDATE tasks SET updated_at = created_at WHERE updated_at IS NULL")
+    logger.info(f"Set updated_at of {cursor.rowcount} tasks")
+
+
+def _sqlite_index(name, columns):
+    return f"CREATE INDEX IF NOT EXISTS {name} ON tasks ({columns})"
+
+
+def _azure_index(name, columns):
+    return (
+        f"IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = '{name}' AND object_id = OBJECT_ID('tasks')) "
+        f"CREATE INDEX {name} ON tasks ({columns})"
+    )
+
+
+AZURE_SQL_TABLES = [
+    """
+    IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='users' AND xtype='U')
+    CREATE TABLE users (
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        username NVARCHAR(80) UNIQUE NOT NULL,
+        email NVARCHAR(120) UNIQUE NOT NULL,
+        password_hash NVARCHAR(255) NOT NULL,
+        created_at DATETIME DEFAULT GETDATE()
+    )
+    """,
+    """
+    IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='tasks' AND xtype='U')
+    CREATE TABLE tasks (
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        title NVARCHAR(255) NOT NULL,
+        description NVARCHAR(MAX),
+        completed BIT DEFAULT 0,
+        priority NVARCHAR(10) NOT NULL DEFAULT 'Medium',
+        category NVARCHAR(100) DEFAULT 'General',
+        due_date DATETIME NULL,
+        created_at DATETIME DEFAULT GETDATE(),
+        user_id INT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+]
+
+TASK_INDEXES = [
+    ('idx_tasks_user_created', 'user_id, created_at'),
+    ('idx_tasks_user_completed_due', 'user_id, completed, due_date'),
+    ('idx_tasks_user_category', 'user_id, category'),
+]
+# The category filter compares case-insensitively (see task_queries)
+SQLITE_INDEX_COLUMNS = {'idx_tasks_user_category': 'user_id, category COLLATE NOCASE'}
+# Added with the priority_rank column; serves the default priority sort
+RANK_INDEX = ('idx_tasks_user_priority', 'user_id, priority_rank')
+
+# Serves the archive job's scan for old completed tasks
+COMPLETED_INDEX = ('idx_tasks_completed_at', 'completed, completed_at')
+# Serves the change feed (/api/tasks/changes)
+CHANGES_INDEX = ('idx_tasks_user_changes', 'user_id, change_version')
+
+# Versions after which a schema capability can be relied on
+CANONICAL_DATES_VERSION = 5
+ARCHIVE_VERSION = 8
+CHANGE_FEED_VERSION = 9
+
+MIGRATIONS = [
+    Migration(
+        1, 'base_tables',
+        sqlite=_schema_sql_statements() + [_add_optional_columns([
+            ('due_date', "ALTER TABLE tasks ADD due_date DATETIME"),
+            ('priority', "ALTER TABLE tasks ADD priority VARCHAR(10) NOT NULL DEFAULT 'Medium'"),
+            ('category', "ALTER TABLE tasks ADD category VARCHAR(100) DEFAULT 'General'"),
+        ])],
+        azure_sql=AZURE_SQL_TABLES + [_add_optional_columns([
+            ('due_date', "ALTER TABLE tasks ADD due_date DATETIME"),
+            ('priority', "ALTER TABLE tasks ADD priority NVARCHAR(10) NOT NULL DEFAULT 'Medium'"),
+            ('category', "ALTER TABLE tasks ADD category NVARCHAR(100) DEFAULT 'General'"),
+        ])],
+    ),
+    Migration(
+        2, 'task_indexes',
+        sqlite=[_require_user_id] + [_sqlite_index(name, SQLITE_INDEX_COLUMNS.get(name, cols))
+                                     for name, cols in TASK_INDEXES],
+        azure_sql=[_require_user_id] + [_azure_index(name, cols) for name, cols in TASK_INDEXES],
+    ),
+    Migration(
+        3, 'task_search',
+        sqlite=[search.create_sqlite_fts],
+        azure_sql=[search.create_azure_fulltext],
+    ),
+    Migration(
+        4, 'task_versions',
+        sqlite=[_add_optional_columns(
+            [('task_version', "ALTER TABLE users ADD task_version INTEGER NOT NULL DEFAULT 0")], 'users')],
+        azure_sql=[_add_optional_columns(
+            [('task_version', "ALTER TABLE users ADD task_version INT NOT NULL DEFAULT 0")], 'users')],
+    ),
+    Migration(
+        CANONICAL_DATES_VERSION, 'canonical_task_fields',
+        # SQLite can only add a generated column as VIRTUAL; the index stores it
+        sqlite=[_canonical_sqlite_dates, _add_optional_columns([
+            ('priority_rank', f"ALTER TABLE tasks ADD priority_rank INTEGER "
+                              f"GENERATED ALWAYS AS ({PRIORITY_RANK_SQL}) VIRTUAL"),
+        ]), _sqlite_index(*RANK_INDEX)],
+        azure_sql=[_add_optional_columns([
+            ('priority_rank', f"ALTER TABLE tasks ADD priority_rank AS ({PRIORITY_RANK_SQL}) PERSISTED"),
+        ]), _azure_index(*RANK_INDEX)],
+    ),
+    Migration(
+        6, 'replica_heartbeat',
+        # One row the primary keeps touching; its age on a replica is the lag
+        sqlite=[
+            "CREATE TABLE IF NOT EXISTS replica_heartbeat (id INTEGER PRIMARY KEY, beat_at DATETIME NOT NULL)",
+            "INSERT OR IGNORE INTO replica_heartbeat (id, beat_at) VALUES (1, CURRENT_TIMESTAMP)",
+        ],
+        azure_sql=[
+            """
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='replica_heartbeat' AND xtype='U')
+            CREATE TABLE replica_heartbeat (id INT PRIMARY KEY, beat_at DATETIME2 NOT NULL)
+            """,
+            """
+            IF NOT EXISTS (SELECT * FROM replica_heartbeat WHERE id = 1)
+            INSERT INTO replica_heartbeat (id, beat_at) VALUES (1, SYSUTCDATETIME())
+            """,
+        ],
+    ),
+    Migration(
+        7, 'shard_map',
+        # Shard of each user bucket when SQLITE_SHARDS is set (see shards.py)
+        sqlite=["CREATE TABLE IF NOT EXISTS shard_map (bucket INTEGER PRIMARY KEY, shard INTEGER NOT NULL)"],
+        # Sharding is SQLite only; Azure SQL scales with its service tier
+        azure_sql=[],
+    ),
+    Migration(
+        ARCHIVE_VERSION, 'task_archive',
+        # Old completed tasks move to tasks_archive (see archive.py); ids are kept
+        sqlite=[
+            _add_optional_columns([('completed_at', "ALTER TABLE tasks ADD completed_at DATETIME")]),
+            _backfill_completed_at,
+            _sqlite_index(*COMPLETED_INDEX),
+            SQLITE_ARCHIVE_TABLE,
+            "CREATE INDEX IF NOT EXISTS idx_tasks_archive_user ON tasks_archive (user_id, archived_at)",
+        ],
+        azure_sql=[
+            _add_optional_columns([('completed_at', "ALTER TABLE tasks ADD completed_at DATETIME NULL")]),
+            _backfill_completed_at,
+            _azure_index(*COMPLETED_INDEX),
+            AZURE_ARCHIVE_TABLE,
+            """
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'idx_tasks_archive_user'
+                           AND object_id = OBJECT_ID('tasks_archive'))
+            CREATE INDEX idx_tasks_archive_user ON tasks_archive (user_id, archived_at)
+            """,
+        ],
+    ),
+    Migration(
+        CHANGE_FEED_VERSION, 'task_changes',
+        # change_version is the owner's task_version of a task's last change;
+        # deleted and archived tasks leave a tombstone for the change feed
+        sqlite=[
+            _add_optional_columns([
+                ('updated_at', "ALTER TABLE tasks ADD updated_at DATETIME"),
+                ('change_version', "ALTER TABLE tasks ADD change_version INTEGER NOT NULL DEFAULT 0"),
+            ]),
+            _backfill_updated_at,
+            _sqlite_index(*CHANGES_INDEX),
+            """
+            CREATE TABLE IF NOT EXISTS task_tombstones (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                change_version INTEGER NOT NULL,
+                deleted_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_task_tombstones_user ON task_tombstones (user_id, change_version)",
+        ],
+        azure_sql=[
+            _add_optional_columns([
+                ('updated_at', "ALTER TABLE tasks ADD updated_at DATETIME NULL"),
+                ('change_version', "ALTER TABLE tasks ADD change_version INT NOT NULL DEFAULT 0"),
+            ]),
+            _backfill_updated_at,
+            _azure_index(*CHANGES_INDEX),
+            """
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='task_tombstones' AND xtype='U')
+            CREATE TABLE task_tombstones (
+                id INT PRIMARY KEY,
+                user_id INT NOT NULL,
+                change_version INT NOT NULL,
+                deleted_at DATETIME NOT NULL DEFAULT GETDATE()
+            )
+            """,
+            """
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'idx_task_tombstones_user'
+                           AND object_id = OBJECT_ID('task_tombstones'))
+            CREATE INDEX idx_task_tombstones_user ON task_tombstones (user_id, change_version)
+            """,
+        ],
+    ),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def describe_step(step):
+    """Human-readable form of a step for dry runs and logs"""
+    if callable(step):
+        return f"-- {(step.__doc__ or step.__name__).strip()}"
+    return ' '.join(step.split())
+
+
+def _ensure_migrations_table(cursor, backend):
+    if backend == 'azure_sql':
+        cursor.execute("""
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='schema_migrations' AND xtype='U')
+            CREATE TABLE schema_migrations (
+                version INT PRIMARY KEY,
+                name NVARCHAR(100) NOT NULL,
+                applied_at DATETIME DEFAULT GETDATE()
+            )
+        """)
+    else:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(100) NOT NULL,
+                applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+
+def applied_versions(conn, backend):
+    """Return the set of applied migration versions (empty if never migrated)"""
+    cursor = conn.cursor()
+    try:
+        if backend == 'azure_sql':
+            cursor.execute("SELECT 1 FROM sysobjects WHERE name='schema_migrations' AND xtype='U'")
+        else:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='schema_migrations'")
+        if not cursor.fetchone():
+            return set()
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def pending_migrations(conn, backend, target=None):
+    """Return migrations not yet applied, up to target (default: latest)"""
+    done = applied_versions(conn, backend)
+    return [m for m in MIGRATIONS if m.version not in done and (target is None or m.version <= target)]
+
+
+def upgrade(conn, backend, target=None, dry_run=False):
+    """
+    Apply pending migrations in order
+
+    Args:
+        conn: Open connection (committed on success, rolled back on failure)
+        backend: 'sqlite' or 'azure_sql'
+        target: Highest version to apply (default: latest)
+        dry_run: Only report what would run
+
+    Returns:
+        List of (Migration, [step descriptions]) that ran, or would run
+    """
+    if dry_run:
+        return [(m, [describe_step(s) for s in m.steps[backend]]) for m in pending_migrations(conn, backend, target)]
+    if not pending_migrations(conn, backend, target):
+        # Already up to date, as on most worker starts: skip the write lock,
+        # which would also wait on a write transaction the caller has open
+        return []
+
+    cursor = conn.cursor()
+    ran = []
+    try:
+        if backend == 'azure_sql':
+            # Session-owned so steps that must commit (full-text DDL) keep the lock
+            cursor.execute(
+                "EXEC sp_getapplock @Resource = 'schema_migrations', @LockMode = 'Exclusive', "
+                "@LockOwner = 'Session', @LockTimeout = 60000"
+            )
+        else:
+            if conn.in_transaction:
+                conn.commit()
+            cursor.execute("BEGIN IMMEDIATE")
+        _ensure_migrations_table(cursor, backend)
+
+        # Re-read under the lock: another worker may have just migrated
+        cursor.execute("SELECT version FROM schema_migrations")
+        done = {row[0] for row in cursor.fetchall()}
+        for migration in MIGRATIONS:
+            if migration.version in done or (target is not None and migration.version > target):
+                continue
+            try:
+                for step in migration.steps[backend]:
+                    if callable(step):
+                        step(cursor, backend)
+                    else:
+                        cursor.execute(step)
+            except MigrationBlocked as exc:
+                logger.warning(f"Stopped before migration {migration.version:04d}_{migration.name}: {exc}")
+                break
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (?, ?)",
+                (migration.version, migration.name)
+            )
+            ran.append((migration, [describe_step(s) for s in migration.steps[backend]]))
+            logger.info(f"Applied migration {migration.version:04d}_{migration.name}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if backend == 'azure_sql':
+            try:
+                cursor.execute("EXEC sp_releaseapplock @Resource = 'schema_migrations', @LockOwner = 'Session'")
+                conn.commit()
+            except Exception as exc:
+                logger.warning(f"Could not release migration lock: {exc}")
+        cursor.close()
+    return ran
+
+
+def hot_queries(has_user_id=True, backend='sqlite'):
+    """Return (name, sql, params) for the task list queries the app runs most"""
+    from database import SchemaInfo
+
+    columns = ['priority_rank'] + (['user_id'] if has_user_id else [])
+    schema = SchemaInfo(backend, columns, LATEST_VERSION)
+    now = datetime(2025, 1, 1, 12, 0)
+    queries = []
+    for name, filters in [
+        ('list_newest', TaskFilters(sort='created_desc')),
+        ('list_priority', TaskFilters()),
+        ('list_pending', TaskFilters(status='pending')),
+        ('list_overdue', TaskFilters(status='overdue')),
+        ('list_category', TaskFilters(category='Work')),
+    ]:
+        sql, params, _ = build_task_list_query(schema, 1, filters, now=now)
+        queries.append((name, sql, params))
+    return queries
+
+
+def check_index_usage(conn, backend):
+    """
+    Explain the hot task queries and report which index each one uses
+
+    Returns:
+        List of (query name, index name or None, plan text)
+    """
+    results = []
+    cursor = conn.cursor()
+    try:
+        for name, sql, params in hot_queries(backend=backend):
+            if backend == 'azure_sql':
+                cursor.execute("SET SHOWPLAN_XML ON")
+                try:
+                    cursor.execute(sql, params)
+                    plan = cursor.fetchone()[0]
+                finally:
+                    cursor.execute("SET SHOWPLAN_XML OFF")
+            else:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                plan = '\n'.join(str(row[-1]) for row in cursor.fetchall())
+            used = next((idx for idx, _ in TASK_INDEXES + [RANK_INDEX] if idx in plan), None)
+            results.append((name, used, plan))
+    finally:
+        cursor.close()
+    return results
@@ -0,0 +1,197 @@
+"""
+Password hashing in a bounded process pool
+
+A PBKDF2 hash at the configured cost takes hundreds of milliseconds of CPU.
+Hashes and verifications run in a small per-worker process pool at a lower
+scheduling priority, so page requests win the CPU over a burst of logins.
+Only PASSWORD_HASH_MAX_PENDING hashes per worker may run or queue at once
+(by default one per request thread, see gunicorn_config.py). Further callers
+wait up to PASSWORD_HASH_TIMEOUT, and never less than one hash takes, for a
+slot and then get PasswordHasherBusy (the routes answer 503), so a login
+storm cannot tie up every request thread.
+
+The pool uses the spawn start method: it is created lazily inside request
+threads, where forking a threaded process is unsafe. Spawned children would
+normally re-run the parent's __main__ (all of app.py under `python app.py`);
+the hashing processes skip that and only import this module.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import spawn
+from multiprocessing.context import SpawnContext, SpawnProcess
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _lower_priority(niceness):
+    """Pool initializer: let request workers win the CPU over hashing"""
+    if niceness and hasattr(os, 'nice'):
+        os.nice(niceness)
+
+
+def _timed_call(func, *args):
+    """Run func in a hashing process; returns (result, seconds it took)"""
+    started = time.monotonic()
+    result = func(*args)
+    return result, time.monotonic() - started
+
+
+_spawn_lock = threading.Lock()
+_get_preparation_data = spawn.get_preparation_data
+
+
+def _preparation_data_without_main(name):
+    data = _get_preparation_data(name)
+    data.pop('init_main_from_name', None)
+    data.pop('init_main_from_path', None)
+    return data
+
+
+class _HashingProcess(SpawnProcess):
+    """Spawned process that does not import the parent's __main__"""
+
+    @staticmethod
+    def _Popen(process_obj):
+        # Swapped only while this pool starts a process
+        with _spawn_lock:
+            spawn.get_preparation_data = _preparation_data_without_main
+            try:
+                return SpawnProcess._Popen(process_obj)
+            finally:
+                spawn.get_preparation_data = _get_preparation_data
+
+
+class _HashingContext(SpawnContext):
+    Process = _HashingProcess
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many requests are already waiting to hash a password"""
+
+
+class PasswordHasher:
+    """Hash and verify passwords with a method and a bounded pool of processes"""
+
+    def __init__(self, method, workers=1, max_pending=8, timeout=1.0, niceness=10):
+        """
+        Args:
+            method: Werkzeug hash method, e.g. 'pbkdf2:sha256:600000'
+            workers: Hashing processes; 0 hashes in the calling thread
+            max_pending: Calls allowed to run or queue at once; size it to
+                the request threads of the worker
+            timeout: Seconds to wait for a slot before raising
+                PasswordHasherBusy; raised to the last hash's duration
+            niceness: Scheduling priority drop for the hashing processes (POSIX)
+        """
+        self.method = method
+        self.workers = workers
+        self.niceness = niceness
+        self.timeout = timeout
+        self.hash_seconds = 0.0  # duration of the last hash or verification
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=_HashingContext(),
+                    initializer=_lower_priority, initargs=(self.niceness,)
+                )
+                self._executor_pid = os.getpid()
+                logger.info(f"Started password hashing pool with {self.workers} process(es)")
+            return self._executor
+
+    def _reset_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _run(self, func, *args):
+        # A slot frees up when a hash finishes, so never give up sooner than that
+        if not self._slots.acquire(timeout=max(self.timeout, self.hash_seconds)):
+            raise PasswordHasherBusy("Password hashing queue is full")
+        try:
+            for attempt in (1, 2):
+                if self.workers <= 0:
+                    result, self.hash_seconds = _timed_call(func, *args)
+                    return result
+                executor = self._get_executor()
+                try:
+                    result, self.hash_seconds = executor.submit(_timed_call, func, *args).result()
+                    return result
+                except BrokenProcessPool:
+                    # A hashing process died (OOM killer, signal); start a new pool once
+                    logger.warning("Password hashing pool broke, restarting it")
+                    self._reset_executor(executor)
+                    if attempt == 2:
+                        raise
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Return a salted hash of password with the configured method"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """Return True if password matches password_hash"""
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """
+        Return True if password_hash was made with other parameters than the
+        configured method (a method without parameters matches any of them)
+        """
+        stored = password_hash.split('$', 1)[0].split(':')
+        wanted = self.method.split(':')
+        return stored[:len(wanted)] != wanted
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    """Return the process-wide PasswordHasher built from Config"""
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher(
+                    Config.PASSWORD_HASH_METHOD, Config.PASSWORD_HASH_WORKERS,
+                    Config.PASSWORD_HASH_MAX_PENDING, Config.PASSWORD_HASH_TIMEOUT,
+                    Config.PASSWORD_HASH_NICE
+                )
+    return _hasher
+
+
+def hash_password(password):
+    """Hash password in the pool (see PasswordHasher.hash)"""
+    return get_hasher().hash(password)
+
+
+def verify_password(password_hash, password):
+    """Check password in the pool (see PasswordHasher.verify)"""
+    return get_hasher().verify(password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """See PasswordHasher.needs_rehash"""
+    return get_hasher().needs_rehash(password_hash)
@@ -0,0 +1,118 @@
+"""
+Health of the read replica, checked off the request path
+
+With READ_REPLICA on, read-only queries go to a replica (see
+database.get_read_connection()). A daemon thread in each worker measures
+every REPLICA_CHECK_INTERVAL seconds how far the replica trails the primary,
+using a heartbeat row that the primary updates and the replica receives
+like any other change. While the replica is unreachable or more than
+REPLICA_MAX_LAG seconds behind, reads go to the primary again. A worker
+reads from the primary until its first check has succeeded.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaMonitor:
+    """Per-worker view of the replica's lag, kept fresh by a background thread"""
+
+    def __init__(self, check, interval=2, max_lag=5, key=None):
+        """
+        Args:
+            check: Callable returning the replica's lag in seconds; raises
+                when the replica cannot be read
+            interval: Seconds between checks
+            max_lag: Most lag, in seconds, at which the replica is used
+            key: Optional callable naming the databases; a check made
+                against other databases does not count
+        """
+        self.check = check
+        self.interval = interval
+        self.max_lag = max_lag
+        self.key = key or (lambda: None)
+        self._lock = threading.Lock()
+        self._state = None
+        self._thread_pid = None
+
+    def refresh(self):
+        """Check the replica now and keep the result"""
+        key = self.key()
+        try:
+            lag = self.check()
+            error = None
+        except Exception as e:
+            lag, error = None, str(e)
+        healthy = error is None and lag <= self.max_lag
+        state = {
+            '_key': key,
+            '_pid': os.getpid(),
+            'healthy': healthy,
+            'lag_seconds': None if lag is None else round(lag, 3),
+            'error': error,
+            'checked_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        with self._lock:
+            previous = self._state
+            self._state = state
+        if previous is None or previous['healthy'] != healthy:
+            if healthy:
+                logger.info(f"Reading from the replica (lag {state['lag_seconds']}s)")
+            elif error:
+                logger.warning(f"Reading from the primary, replica unavailable: {error}")
+            else:
+                logger.warning(f"Reading from the primary, replica {state['lag_seconds']}s behind")
+        return state
+
+    def mark_failed(self, error):
+        """Stop using the replica until the next successful check"""
+        with self._lock:
+            if self._state is None or not self._state['healthy']:
+                return
+            self._state = dict(self._state, healthy=False, error=str(error))
+        logger.warning(f"Reading from the primary, replica failed: {error}")
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Could not check the replica: {e}")
+            time.sleep(self.interval)
+
+    def _ensure_thread(self):
+        # Threads do not survive fork, so each worker starts its own
+        pid = os.getpid()
+        with self._lock:
+            if self._thread_pid == pid:
+                return
+            self._thread_pid = pid
+        threading.Thread(target=self._run, name='replica-monitor', daemon=True).start()
+
+    def usable(self):
+        """Return True when the last check found the replica within max_lag"""
+        self._ensure_thread()
+        with self._lock:
+            state = self._state
+        # A forked worker does not trust its parent's last check
+        return (state is not None and state['healthy'] and state['_pid'] == os.getpid()
+                and state['_key'] == self.key())
+
+    def status(self):
+        """
+        Return the last check's result
+
+        Returns:
+            Dict with healthy, lag_seconds, error and checked_at (None before
+            the first check)
+        """
+        self._ensure_thread()
+        with self._lock:
+            state = self._state
+        if state is None or state['_pid'] != os.getpid():
+            return {'healthy': False, 'lag_seconds': None, 'error': None, 'checked_at': None}
+        return {key: value for key, value in state.items() if not key.startswith('_')}
@@ -0,0 +1,217 @@
+"""
+Full-text search over task titles and descriptions
+
+Three backends, picked once per process by detect_search_backend():
+
+- 'fts5': SQLite FTS5 table tasks_fts kept in sync by triggers (migration 3)
+- 'fulltext': Azure SQL full-text catalog and index on tasks (migration 3)
+- None: a per-user, in-process inverted index built on demand
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from metrics import run_query
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_MAX_RESULTS = 500  # Azure SQL allows ~2100 parameters per statement
+FALLBACK_TTL = 30           # seconds before another worker's edits become visible
+FALLBACK_MAX_USERS = 256
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Lower-cased word tokens of a string"""
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def fts5_query(q):
+    """FTS5 MATCH expression: every term must match as a prefix"""
+    return ' '.join(f'"{token}"*' for token in tokenize(q))
+
+
+def containstable_query(q):
+    """Azure SQL CONTAINSTABLE condition: every term must match as a prefix"""
+    return ' AND '.join(f'"{token}*"' for token in tokenize(q))
+
+
+# Migration steps
+
+SQLITE_FTS_STATEMENTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        title, description, content='tasks', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF title, description ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    "INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')",
+]
+
+
+def create_sqlite_fts(cursor, backend):
+    """Create the tasks_fts FTS5 index and sync triggers (skipped without FTS5)"""
+    cursor.execute("PRAGMA compile_options")
+    if 'ENABLE_FTS5' not in {row[0] for row in cursor.fetchall()}:
+        logger.warning("SQLite was built without FTS5; search uses the in-process index")
+        return
+    for statement in SQLITE_FTS_STATEMENTS:
+        cursor.execute(statement)
+
+
+def create_azure_fulltext(cursor, backend):
+    """Create the full-text catalog and index on tasks (skipped where unsupported)"""
+    # Full-text DDL cannot run inside a user transaction
+    conn = cursor.connection
+    conn.commit()
+    conn.autocommit = True
+    try:
+        cursor.execute("SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID('tasks') AND is_primary_key = 1")
+        key_index = cursor.fetchone()[0]
+        cursor.execute(
+            "IF NOT EXISTS (SELECT * FROM sys.fulltext_catalogs WHERE name = 'tasks_catalog') "
+            "CREATE FULLTEXT CATALOG tasks_catalog"
+        )
+        cursor.execute(
+            "IF NOT EXISTS (SELECT * FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('tasks')) "
+            f"CREATE FULLTEXT INDEX ON tasks (title, description) KEY INDEX [{key_index}] "
+            "ON tasks_catalog WITH CHANGE_TRACKING AUTO"
+        )
+    except Exception as exc:
+        logger.warning(f"Full-text search unavailable, using the in-process index: {exc}")
+    finally:
+        conn.autocommit = False
+
+
+def detect_search_backend(cursor, backend):
+    """Return 'fts5', 'fulltext' or None for the connected database"""
+    if backend == 'azure_sql':
+        cursor.execute("SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('tasks')")
+        return 'fulltext' if cursor.fetchone() else None
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks_fts'")
+    return 'fts5' if cursor.fetchone() else None
+
+
+# In-process fallback
+
+class InvertedIndex:
+    """Token -> {task id: term frequency} index with prefix lookup"""
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._docs = {}
+        self._sorted_tokens = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, task_id, title, description):
+        self.remove(task_id)
+        tokens = tokenize(title) + tokenize(description)
+        self._docs[task_id] = set(tokens)
+        for token in tokens:
+            postings = self._postings[token]
+            postings[task_id] = postings.get(task_id, 0) + 1
+        self._sorted_tokens = None
+
+    def remove(self, task_id):
+        for token in self._docs.pop(task_id, ()):
+            postings = self._postings[token]
+            postings.pop(task_id, None)
+            if not postings:
+                del self._postings[token]
+        self._sorted_tokens = None
+
+    def _expand(self, prefix):
+        """All indexed tokens starting with prefix"""
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._postings)
+        tokens = self._sorted_tokens
+        start = bisect.bisect_left(tokens, prefix)
+        end = start
+        while end < len(tokens) and tokens[end].startswith(prefix):
+            end += 1
+        return tokens[start:end]
+
+    def search(self, q, limit=FALLBACK_MAX_RESULTS):
+        """
+        Return task ids matching every term of q as a prefix, best first
+
+        Scores sum term frequencies, so titles/descriptions that repeat a
+        term rank higher; ties go to the newest (highest) id. limit=None
+        returns every match.
+        """
+        scores = None
+        for term in tokenize(q):
+            term_scores = defaultdict(int)
+            for token in self._expand(term):
+                for task_id, tf in self._postings[token].items():
+                    term_scores[task_id] += tf
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {tid: s + term_scores[tid] for tid, s in scores.items() if tid in term_scores}
+            if not scores:
+                return []
+        if not scores:
+            return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [task_id for task_id, _ in ranked[:limit]]
+
+
+_fallback = OrderedDict()  # user_id -> (built_at, InvertedIndex)
+_fallback_lock = threading.Lock()
+
+
+def fallback_search(conn, user_id, q, has_user_id=True, limit=FALLBACK_MAX_RESULTS):
+    """
+    Search a user's tasks with the in-process index, building it if needed
+
+    Args:
+        limit: Most ids to return, enough for a page; None for every match
+            (bulk changes, which bind them a chunk at a time)
+    """
+    now = time.monotonic()
+    with _fallback_lock:
+        entry = _fallback.get(user_id)
+        if entry is not None and now - entry[0] < FALLBACK_TTL:
+            _fallback.move_to_end(user_id)
+            return entry[1].search(q, limit)
+
+    index = InvertedIndex()
+    cursor = conn.cursor()
+    try:
+        if has_user_id:
+            rows = run_query(cursor, 'search_fallback_index', "SELECT id, title, description FROM tasks WHERE user_id = ?",
+                             (user_id,), fetch='all')
+        else:
+            rows = run_query(cursor, 'search_fallback_index', "SELECT id, title, description FROM tasks", fetch='all')
+        for task_id, title, description in rows:
+            index.add(task_id, title, description)
+    finally:
+        cursor.close()
+
+    with _fallback_lock:
+        _fallback[user_id] = (now, index)
+        _fallback.move_to_end(user_id)
+        while len(_fallback) > FALLBACK_MAX_USERS:
+            _fallback.popitem(last=False)
+    return index.search(q, limit)
+
+
+def invalidate(user_id):
+    """Drop a user's in-process index after their tasks change"""
+    with _fallback_lock:
+        _fallback.pop(user_id, None)
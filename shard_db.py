@@ -0,0 +1,257 @@
+"""
+Shard maintenance command line tool.
+
+Shows how tasks are spread over the SQLite shards (SQLITE_SHARDS, see
+shards.py) and moves buckets of users between shards. Rebalancing moves
+only the buckets whose shard changes, plus tasks still in the main
+database from before sharding was turned on. A bucket is copied to its new
+shard, then the shard map is updated, then the old copy is deleted, so an
+interrupted run is finished by running it again.
+
+Stop the app, or at least its writes, while rebalancing: workers read the
+shard map when they start, so restart them afterwards.
+
+Usage:
+    python shard_db.py --status                # buckets, users and tasks per shard
+    python shard_db.py --rebalance             # spread the buckets over SQLITE_SHARDS shards
+    python shard_db.py --rebalance --shards 8  # ... over 8 shards
+    python shard_db.py --rebalance --dry-run   # list the moves only
+"""
+import argparse
+import logging
+import sys
+from collections import defaultdict
+
+from database import Config, get_pool, get_schema, get_shard_pool, shard_database_path
+from shards import ShardMap, bucket_of, read_map, reset_sequence, write_map
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Users per IN (...) list, below SQLite's variable limit
+CHUNK_SIZE = 500
+
+
+def _chunks(ids):
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def task_owners(conn, versions=True):
+    """
+    Return {bucket: [user ids]} of the users with tasks, live, archived or deleted, in a database
+
+    Args:
+        versions: Include users with only a task counter (a shard), whose
+            counter must move with them so no old ETag matches again
+    """
+    sql = ("SELECT user_id FROM tasks UNION SELECT user_id FROM tasks_archive "
+           "UNION SELECT user_id FROM task_tombstones")
+    if versions:
+        sql += " UNION SELECT user_id FROM task_versions"
+    owners = defaultdict(list)
+    for (user_id,) in conn.execute(sql):
+        owners[bucket_of(user_id)].append(user_id)
+    return owners
+
+
+def delete_users(conn, user_ids, versions=True):
+    """Delete users' tasks, archived tasks, tombstones (and task counters) from a database and commit"""
+    try:
+        for chunk in _chunks(user_ids):
+            placeholders = ', '.join('?' * len(chunk))
+            conn.execute(f"DELETE FROM tasks WHERE user_id IN ({placeholders})", chunk)
+            conn.execute(f"DELETE FROM tasks_archive WHERE user_id IN ({placeholders})", chunk)
+            conn.execute(f"DELETE FROM task_tombstones WHERE user_id IN ({placeholders})", chunk)
+            if versions:
+                conn.execute(f"DELETE FROM task_versions WHERE user_id IN ({placeholders})", chunk)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def copy_users(source_path, target, shard, user_ids, from_main=False):
+    """
+    Copy users' tasks, archived tasks, tombstones and task counters into a shard and commit
+
+    Args:
+        source_path: Database file the tasks come from
+        target: Connection to the shard
+        shard: Shard number of target
+        user_ids: Users to copy
+        from_main: The source is the main database; its tasks are added to
+            what the users already have on the shard, instead of replacing it
+    """
+    # table_info leaves out generated columns, which cannot be inserted
+    columns = {table: ', '.join(row[1] for row in target.execute(f"PRAGMA table_info({table})"))
+               for table in ('tasks', 'tasks_archive', 'task_tombstones')}
+    target.execute("ATTACH DATABASE ? AS source", (source_path,))
+    try:
+        for chunk in _chunks(user_ids):
+            placeholders = ', '.join('?' * len(chunk))
+            if from_main:
+                for table, table_columns in columns.items():
+                    target.execute(
+                        f"INSERT INTO {table} ({table_columns}) SELECT {table_columns} FROM source.{table} AS s "
+                        f"WHERE user_id IN ({placeholders}) "
+                        f"AND NOT EXISTS (SELECT 1 FROM main.{table} WHERE id = s.id)",
+                        chunk
+                    )
+                # Past the counters on both sides, so no cached list or ETag survives the merge
+                target.execute(
+                    f"INSERT INTO task_versions (user_id, version) SELECT id, task_version + 1 FROM source.users "
+                    f"WHERE id IN ({placeholders}) "
+                    f"ON CONFLICT (user_id) DO UPDATE SET version = version + excluded.version",
+                    chunk
+                )
+                # Merged tasks are news to the change feed: stamp them all with the merged counter
+                for table in ('tasks', 'task_tombstones'):
+                    target.execute(
+                        f"UPDATE {table} SET change_version = (SELECT version FROM task_versions "
+                        f"WHERE task_versions.user_id = {table}.user_id) WHERE user_id IN ({placeholders})",
+                        chunk
+                    )
+            else:
+                for table, table_columns in columns.items():
+                    # Left over from an interrupted move; the source copy is the live one
+                    target.execute(f"DELETE FROM {table} WHERE user_id IN ({placeholders})", chunk)
+                    target.execute(
+                        f"INSERT INTO {table} ({table_columns}) SELECT {table_columns} FROM source.{table} "
+                        f"WHERE user_id IN ({placeholders})",
+                        chunk
+                    )
+                target.execute(
+                    f"INSERT OR REPLACE INTO task_versions (user_id, version) "
+                    f"SELECT user_id, version FROM source.task_versions WHERE user_id IN ({placeholders})",
+                    chunk
+                )
+        reset_sequence(target.cursor(), shard)
+        target.commit()
+    except Exception:
+        target.rollback()
+        raise
+    finally:
+        target.execute("DETACH DATABASE source")
+
+
+def status(main, shard_map):
+    """Print buckets, users and tasks per shard; returns a process exit code"""
+    buckets = defaultdict(int)
+    for shard in shard_map.shards:
+        buckets[shard] += 1
+    for shard in range(shard_map.count):
+        pool = get_shard_pool(shard)
+        conn = pool.acquire()
+        try:
+            users, tasks = conn.execute("SELECT COUNT(DISTINCT user_id), COUNT(*) FROM tasks").fetchone()
+        finally:
+            pool.release(conn)
+        print(f"shard {shard} ({shard_database_path(shard)}): {buckets[shard]} buckets, {users} users, {tasks} tasks")
+    left = main.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+    print(f"main ({Config.SQLITE_DATABASE}): {left} tasks not moved to a shard")
+    return 0
+
+
+def rebalance(main, current, count, dry_run=False):
+    """
+    Move buckets so count shards hold them evenly, and main database tasks to their shards
+
+    Returns:
+        Process exit code
+    """
+    target = current.rebalanced(count)
+    moves = current.moves(target)
+    # Shard of each bucket's live copy, updated as buckets move
+    placed = list(current.shards)
+    for shard in range(max(current.count, count)):
+        pool = get_shard_pool(shard)
+        conn = pool.acquire()
+        try:
+            for bucket, user_ids in task_owners(conn).items():
+                if placed[bucket] != shard:
+                    # The map points elsewhere: the rest of a copy that finished
+                    print(f"shard {shard}: removing {len(user_ids)} users of bucket {bucket}, "
+                          f"now on shard {placed[bucket]}")
+                    if not dry_run:
+                        delete_users(conn, user_ids)
+                elif target.shards[bucket] != shard:
+                    new = target.shards[bucket]
+                    print(f"bucket {bucket}: shard {shard} -> {new} ({len(user_ids)} users)")
+                    if dry_run:
+                        continue
+                    target_pool = get_shard_pool(new)
+                    target_conn = target_pool.acquire()
+                    try:
+                        copy_users(shard_database_path(shard), target_conn, new, user_ids)
+                    finally:
+                        target_pool.release(target_conn)
+                    main.execute("UPDATE shard_map SET shard = ? WHERE bucket = ?", (new, bucket))
+                    main.commit()
+                    placed[bucket] = new
+                    delete_users(conn, user_ids)
+        finally:
+            pool.release(conn)
+
+    if not dry_run:
+        # Buckets without users move too
+        write_map(main.cursor(), target)
+        main.commit()
+    print(f"{len(moves)} of {len(target.shards)} buckets {'would move' if dry_run else 'moved'}")
+
+    leftovers = defaultdict(list)
+    for bucket, user_ids in task_owners(main, versions=False).items():
+        leftovers[target.shards[bucket]].extend(user_ids)
+    for shard, user_ids in sorted(leftovers.items()):
+        print(f"main -> shard {shard}: tasks of {len(user_ids)} users")
+        if dry_run:
+            continue
+        pool = get_shard_pool(shard)
+        conn = pool.acquire()
+        try:
+            copy_users(Config.SQLITE_DATABASE, conn, shard, user_ids, from_main=True)
+        finally:
+            pool.release(conn)
+        delete_users(main, user_ids, versions=False)
+    return 0
+
+
+def run(args):
+    """Run the requested shard command; returns a process exit code"""
+    if Config.DB_TYPE == 'azure_sql':
+        logger.error("Sharding is only available with SQLite")
+        return 1
+    count = args.shards or Config.SQLITE_SHARDS
+    if count < 1:
+        logger.error("Set SQLITE_SHARDS or pass --shards")
+        return 1
+
+    get_schema()  # applies migration 7 (shard_map) to the main database
+    pool = get_pool()
+    main = pool.acquire()
+    try:
+        current = read_map(main.cursor())
+        if current is None:
+            current = ShardMap.spread(Config.SQLITE_SHARDS or count)
+            if not args.dry_run:
+                write_map(main.cursor(), current, replace=False)
+                main.commit()
+        if args.rebalance:
+            return rebalance(main, current, count, dry_run=args.dry_run)
+        return status(main, current)
+    finally:
+        pool.release(main)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and rebalance the SQLite task shards")
+    parser.add_argument('--status', action='store_true', help='show buckets, users and tasks per shard (default)')
+    parser.add_argument('--rebalance', action='store_true',
+                        help='move buckets evenly over the shards, and unsharded tasks to their shards')
+    parser.add_argument('--shards', type=int, help='number of shards to rebalance over (default: SQLITE_SHARDS)')
+    parser.add_argument('--dry-run', action='store_true', help='list the moves without making them')
+    return run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Placement of users' tasks on SQLite shard files
+
+With SQLITE_SHARDS set, tasks live in that many SQLite files beside
+SQLITE_DATABASE, which keeps the users and the shard map. Every file has
+its own write lock, so writes of users on different shards no longer wait
+for each other. All of a user's tasks are on one shard: the user id hashes
+(CRC-32) to one of SHARD_BUCKETS buckets, and the shard map assigns each
+bucket to a shard. Adding shards moves whole buckets; shard_db.py copies
+their tasks and updates the map.
+
+Task ids stay unique across shards. Shard n allocates ids from
+(n + 1) * SHARD_ID_SPAN, above every id created before sharding, so a task
+keeps its id when its bucket moves.
+"""
+import os
+import zlib
+
+import migrations
+
+SHARD_BUCKETS = 1024
+SHARD_ID_SPAN = 1 << 40
+
+# Per-user task change counter on a shard (users.task_version lives in the main database)
+TASK_VERSIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS task_versions (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+
+def bucket_of(user_id):
+    """Return the bucket of a user id, the same in every process and release"""
+    return zlib.crc32(str(user_id).encode()) % SHARD_BUCKETS
+
+
+def shard_path(database, shard, pattern=''):
+    """
+    Return the file of a shard
+
+    Args:
+        database: Main database file (SQLITE_DATABASE)
+        shard: Shard number
+        pattern: SQLITE_SHARD_PATH, e.g. '/data/tasks-{shard}.db'; by default
+            '<name>-shard<n>.db' beside the main database
+    """
+    if pattern:
+        return pattern.format(shard=shard)
+    stem, ext = os.path.splitext(database)
+    return f"{stem}-shard{shard}{ext}"
+
+
+class ShardMap:
+    """Shard of every bucket"""
+
+    def __init__(self, shards):
+        """
+        Args:
+            shards: Shard number of each bucket, indexed by bucket
+        """
+        self.shards = tuple(shards)
+
+    @classmethod
+    def spread(cls, count):
+        """Return a map dealing the buckets round-robin over count shards"""
+        return cls(bucket % count for bucket in range(SHARD_BUCKETS))
+
+    @property
+    def count(self):
+        """Number of shard files the map refers to"""
+        return max(self.shards) + 1
+
+    def shard_of(self, user_id):
+        """Return the shard holding a user's tasks"""
+        return self.shards[bucket_of(user_id)]
+
+    def rebalanced(self, count):
+        """
+        Return a map over count shards that moves as few buckets as possible
+
+        Each shard ends up with SHARD_BUCKETS / count buckets (one more for
+        the first SHARD_BUCKETS % count shards). Buckets stay where they are
+        unless their shard is over its share or no longer exists.
+        """
+        share = [SHARD_BUCKETS // count + (1 if shard < SHARD_BUCKETS % count else 0) for shard in range(count)]
+        held = [0] * count
+        homeless = []
+        for bucket, shard in enumerate(self.shards):
+            if shard < count and held[shard] < share[shard]:
+                held[shard] += 1
+            else:
+                homeless.append(bucket)
+        shards = list(self.shards)
+        for shard in range(count):
+            while held[shard] < share[shard]:
+                shards[homeless.pop()] = shard
+                held[shard] += 1
+        return ShardMap(shards)
+
+    def moves(self, other):
+        """
+        Return the buckets other places differently
+
+        Returns:
+            Dict of bucket -> (shard here, shard in other)
+        """
+        return {bucket: (old, new) for bucket, (old, new) in enumerate(zip(self.shards, other.shards)) if old != new}
+
+
+def read_map(cursor):
+    """Return the ShardMap stored in the main database, or None before one is stored"""
+    cursor.execute("SELECT bucket, shard FROM shard_map")
+    rows = cursor.fetchall()
+    if len(rows) < SHARD_BUCKETS:
+        return None
+    shards = [0] * SHARD_BUCKETS
+    for bucket, shard in rows:
+        shards[bucket] = shard
+    return ShardMap(shards)
+
+
+def write_map(cursor, shard_map, replace=True):
+    """
+    Store a ShardMap in the main database (within the caller's transaction)
+
+    Args:
+        replace: Overwrite stored buckets; with False, only buckets missing
+            from the stored map are written, so a worker starting at the
+            same time as another does not undo its map
+    """
+    verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+    cursor.executemany(f"{verb} INTO shard_map (bucket, shard) VALUES (?, ?)", enumerate(shard_map.shards))
+
+
+def reset_sequence(cursor, shard):
+    """
+    Point the shard's task id sequence at the top of its own id range
+
+    Rows copied in from other shards raise SQLite's AUTOINCREMENT sequence
+    to their ids; this puts it back, within the caller's write transaction.
+    Archived tasks keep their ids, so their range is skipped too.
+    """
+    low = (shard + 1) * SHARD_ID_SPAN
+    cursor.execute(
+        "SELECT MAX(id) FROM (SELECT id FROM tasks UNION ALL SELECT id FROM tasks_archive) WHERE id >= ? AND id < ?",
+        (low, low + SHARD_ID_SPAN)
+    )
+    top = cursor.fetchone()[0] or low
+    cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'tasks'")
+    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('tasks', ?)", (top,))
+
+
+def prepare_shard(conn, shard):
+    """
+    Bring a shard file to the current schema and its own task id range
+
+    Args:
+        conn: Connection to the shard (committed)
+        shard: Shard number
+    """
+    migrations.upgrade(conn, 'sqlite')
+    cursor = conn.cursor()
+    try:
+        cursor.execute(TASK_VERSIONS_TABLE)
+        if conn.in_transaction:
+            conn.commit()
+        # Under the write lock, so no other worker allocates an id meanwhile
+        cursor.execute("BEGIN IMMEDIATE")
+        reset_sequence(cursor, shard)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
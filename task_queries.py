@@ -0,0 +1,430 @@
+"""
+SQL builders for the task list: filtering, sorting and keyset pagination
+
+The task list is paged on (sort key, id) so the cost of a page depends on the
+page size, not on how many tasks the user has.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+
+import search
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Changes per /api/tasks/changes response
+DEFAULT_CHANGES_LIMIT = 500
+MAX_CHANGES_LIMIT = 2000
+
+TASK_COLUMNS = "id, title, description, completed, created_at, due_date, priority, category"
+
+# Definition of the generated tasks.priority_rank column, and the fallback
+# expression before migration 5 has added it
+PRIORITY_RANK_SQL = "CASE priority WHEN 'High' THEN 3 WHEN 'Low' THEN 1 ELSE 2 END"
+
+# sort option -> (sort key expression, direction)
+SORT_OPTIONS = {
+    'priority_desc': ('priority_rank', 'DESC'),
+    'priority_asc': ('priority_rank', 'ASC'),
+    'created_desc': ('created_at', 'DESC'),
+    'created_asc': ('created_at', 'ASC'),
+}
+DEFAULT_SORT = 'priority_desc'
+# Only meaningful with a search term; the expression depends on the search backend
+RELEVANCE_SORT = 'relevance'
+
+STATUS_FILTERS = ('all', 'pending', 'completed', 'overdue', 'today')
+
+# Canonical SQLite date text (CURRENT_TIMESTAMP's form). Older databases also
+# hold ISO 'T' strings, which datetime() normalises until migration 5 has
+# rewritten them.
+SQLITE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+class TaskFilters:
+    """Normalised task list parameters from the query string"""
+
+    def __init__(self, q='', status='all', category='all', sort=DEFAULT_SORT,
+                 page_size=DEFAULT_PAGE_SIZE, cursor=None):
+        self.q = (q or '').strip().lower()
+        # Words the search indexes see; a q without any (only punctuation or
+        # wildcards) matches no task rather than building an empty MATCH
+        self.terms = search.tokenize(self.q)
+        self.status = status if status in STATUS_FILTERS else 'all'
+        self.category = (category or '').strip() or 'all'
+        if sort == RELEVANCE_SORT and self.terms:
+            self.sort = RELEVANCE_SORT
+        else:
+            self.sort = sort if sort in SORT_OPTIONS else DEFAULT_SORT
+        self.page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+        self.cursor = cursor or None
+
+    @classmethod
+    def from_args(cls, args):
+        """Build filters from request.args, ignoring malformed values."""
+        try:
+            page_size = int(args.get('per_page', DEFAULT_PAGE_SIZE))
+        except (TypeError, ValueError):
+            page_size = DEFAULT_PAGE_SIZE
+        return cls(
+            q=args.get('q', ''),
+            status=args.get('status', 'all'),
+            category=args.get('category', 'all'),
+            sort=args.get('sort', DEFAULT_SORT),
+            page_size=page_size,
+            cursor=args.get('cursor'),
+        )
+
+    def as_dict(self):
+        """Filter values for templates and URLs (without the cursor)."""
+        values = {'q': self.q, 'status': self.status, 'sort': self.sort, 'category': self.category}
+        if self.page_size != DEFAULT_PAGE_SIZE:
+            values['per_page'] = self.page_size
+        return values
+
+    def cache_key(self):
+        """Stable string identifying this page of the list (for the task cache)."""
+        return json.dumps([self.q, self.status, self.category, self.sort, self.page_size, self.cursor],
+                          separators=(',', ':'))
+
+
+class Task:
+    """
+    One task of a list page, built straight from a query row
+
+    Slots keep a task to one small object instead of a row plus dicts; the
+    templates read the same attributes. build_task_list_query() selects the
+    columns in slot order, followed by sort_key.
+    """
+    __slots__ = ('id', 'title', 'description', 'completed', 'created_at', 'due_date',
+                 'priority', 'category', 'priority_rank', 'is_overdue', 'is_due_today')
+
+    def __init__(self, id, title, description, completed, created_at, due_date,
+                 priority, category, priority_rank, is_overdue, is_due_today):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.completed = bool(completed)
+        self.created_at = created_at
+        self.due_date = due_date
+        self.priority = priority
+        self.category = category
+        self.priority_rank = priority_rank
+        self.is_overdue = bool(is_overdue)
+        self.is_due_today = bool(is_due_today)
+
+    def __reduce__(self):
+        # Pickled as a plain tuple of values
+        return Task, tuple(getattr(self, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"<Task {self.id} {self.title!r}>"
+
+
+TASK_FIELD_COUNT = len(Task.__slots__)
+# Positions of the Task fields holding datetimes
+TASK_DATETIME_SLOTS = tuple(Task.__slots__.index(name) for name in ('created_at', 'due_date'))
+
+
+def task_row(cursor, row):
+    """
+    Row factory returning (Task, sort key) for a build_task_list_query() row
+
+    Usable as a sqlite3 cursor.row_factory, or applied to pyodbc rows.
+    """
+    return Task(*row[:TASK_FIELD_COUNT]), row[TASK_FIELD_COUNT]
+
+
+class TaskPage:
+    """One page of tasks with cursors for the neighbouring pages"""
+
+    def __init__(self, tasks, next_cursor=None, prev_cursor=None):
+        self.tasks = tasks
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def to_data(self):
+        """Return the page as JSON-ready lists (the shared task cache stores data, never code)."""
+        rows = []
+        for task in self.tasks:
+            row = [getattr(task, name) for name in Task.__slots__]
+            for index in TASK_DATETIME_SLOTS:
+                if isinstance(row[index], datetime):
+                    row[index] = row[index].isoformat(sep=' ')
+            rows.append(row)
+        return [rows, self.next_cursor, self.prev_cursor]
+
+    @classmethod
+    def from_data(cls, data):
+        """Rebuild a page from to_data()."""
+        rows, next_cursor, prev_cursor = data
+        tasks = []
+        for row in rows:
+            for index in TASK_DATETIME_SLOTS:
+                if isinstance(row[index], str):
+                    row[index] = datetime.fromisoformat(row[index])
+            tasks.append(Task(*row))
+        return cls(tasks, next_cursor, prev_cursor)
+
+
+def encode_cursor(sort_value, task_id, direction):
+    """Return an opaque URL-safe cursor for (sort key, id)."""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat(sep=' ')
+    payload = json.dumps([sort_value, task_id, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (sort value, id, direction) from a cursor made by encode_cursor()."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, task_id, direction = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor(f"Malformed cursor: {cursor!r}") from exc
+    if direction not in ('next', 'prev') or not isinstance(task_id, int) or isinstance(task_id, bool):
+        raise InvalidCursor(f"Malformed cursor: {cursor!r}")
+    # The sort value is bound as a query parameter, so only a column value will do
+    if sort_value is not None and (isinstance(sort_value, bool) or not isinstance(sort_value, (str, int, float))):
+        raise InvalidCursor(f"Malformed cursor: {cursor!r}")
+    return sort_value, task_id, direction
+
+
+class TaskChanges:
+    """One page of the change feed and the feed position after it"""
+
+    def __init__(self, changes, position, has_more=False):
+        self.changes = changes
+        self.position = position
+        self.has_more = has_more
+
+
+def encode_change_cursor(position, issued):
+    """
+    Return an opaque cursor for a change feed position
+
+    Args:
+        position: (change_version, last task id or None)
+        issued: Unix time the cursor was handed out, to tell when the
+            tombstones it still needs may have been purged
+    """
+    version, last_id = position
+    payload = json.dumps([version, last_id, int(issued)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_change_cursor(cursor):
+    """Return ((change_version, last task id or None), issued) from encode_change_cursor()."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        version, last_id, issued = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor(f"Malformed cursor: {cursor!r}") from exc
+    if not isinstance(version, int) or not isinstance(issued, int) or not (last_id is None or isinstance(last_id, int)):
+        raise InvalidCursor(f"Malformed cursor: {cursor!r}")
+    return (version, last_id), issued
+
+
+def _date_param(value, backend):
+    """Format a datetime for comparison against due_date on this backend."""
+    if backend == 'azure_sql':
+        return value
+    return value.strftime(SQLITE_DATETIME_FORMAT)
+
+
+def _due_expr(schema):
+    """due_date as an expression that compares correctly against _date_param()"""
+    if schema.backend == 'sqlite' and not schema.canonical_dates:
+        return 'datetime(due_date)'
+    return 'due_date'
+
+
+def _priority_rank_expr(schema):
+    return 'priority_rank' if schema.has_priority_rank else PRIORITY_RANK_SQL
+
+
+def _derived_columns(schema, now):
+    """
+    Return (select sql, params) for priority_rank, is_overdue and is_due_today
+
+    The flags are evaluated against now, so callers must not cache them for
+    longer than they are willing to show a stale flag.
+    """
+    backend = schema.backend
+    due = _due_expr(schema)
+    start = datetime(now.year, now.month, now.day)
+    sql = (f"{_priority_rank_expr(schema)} AS priority_rank, "
+           f"CASE WHEN completed = 0 AND {due} < ? THEN 1 ELSE 0 END AS is_overdue, "
+           f"CASE WHEN {due} >= ? AND {due} < ? THEN 1 ELSE 0 END AS is_due_today")
+    params = [_date_param(now, backend), _date_param(start, backend),
+              _date_param(start + timedelta(days=1), backend)]
+    return sql, params
+
+
+def _search_clause(schema, filters, search_ids):
+    """
+    Return (join sql, join params, where sql, where params, relevance sort) for q
+
+    The relevance sort is (expression, direction) ranking the best match first.
+    """
+    if not filters.terms:
+        return "", [], "1 = 0", [], ('id', 'DESC')
+    if schema.search == 'fts5':
+        join = (" JOIN (SELECT rowid AS fts_id, bm25(tasks_fts) AS score FROM tasks_fts"
+                " WHERE tasks_fts MATCH ?) AS m ON m.fts_id = tasks.id")
+        return join, [search.fts5_query(filters.q)], None, [], ('m.score', 'ASC')
+    if schema.search == 'fulltext':
+        join = " JOIN CONTAINSTABLE(tasks, (title, description), ?) AS m ON m.[KEY] = tasks.id"
+        return join, [search.containstable_query(filters.q)], None, [], ('m.[RANK]', 'DESC')
+    # In-process index: ids arrive best first and are our own integers
+    ids = [int(task_id) for task_id in (search_ids or [])]
+    if not ids:
+        return "", [], "1 = 0", [], ('id', 'DESC')
+    id_list = ', '.join(str(task_id) for task_id in ids)
+    ranking = ' '.join(f"WHEN {task_id} THEN {rank}" for rank, task_id in enumerate(ids))
+    return "", [], f"id IN ({id_list})", [], (f"CASE id {ranking} END", 'ASC')
+
+
+def _filter_clauses(schema, user_id, filters, now, search_ids):
+    """
+    Return (join sql, where clauses, params, relevance sort) selecting the
+    user's tasks that match filters (everything except the cursor)
+    """
+    now = now or datetime.now()
+    backend = schema.backend
+    due = _due_expr(schema)
+    join_sql = ""
+    where = []
+    params = []
+    relevance = None
+
+    if schema.has_user_id:
+        where.append("user_id = ?")
+        params.append(user_id)
+
+    if filters.status == 'pending':
+        where.append("completed = 0")
+    elif filters.status == 'completed':
+        where.append("completed = 1")
+    elif filters.status == 'overdue':
+        where.append(f"completed = 0 AND due_date IS NOT NULL AND {due} < ?")
+        params.append(_date_param(now, backend))
+    elif filters.status == 'today':
+        start = datetime(now.year, now.month, now.day)
+        where.append(f"{due} >= ? AND {due} < ?")
+        params.extend([_date_param(start, backend), _date_param(start + timedelta(days=1), backend)])
+
+    if filters.category != 'all':
+        # Case-insensitive and still able to use idx_tasks_user_category
+        # (Azure SQL's default collation is already case-insensitive)
+        where.append("category = ? COLLATE NOCASE" if backend == 'sqlite' else "category = ?")
+        params.append(filters.category)
+
+    if filters.q:
+        join_sql, join_params, search_where, search_params, relevance = _search_clause(schema, filters, search_ids)
+        params = join_params + params
+        if search_where:
+            where.append(search_where)
+            params.extend(search_params)
+
+    return join_sql, where, params, relevance
+
+
+def build_task_selection(schema, user_id, filters, now=None, search_ids=None):
+    """
+    Build a SELECT of the ids of every task matching filters (no paging)
+
+    Used as a subquery by set-based bulk updates and deletes.
+
+    Returns:
+        (sql, params)
+    """
+    join_sql, where, params, _ = _filter_clauses(schema, user_id, filters, now, search_ids)
+    where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+    return f"SELECT tasks.id FROM tasks{join_sql}{where_sql}", tuple(params)
+
+
+def build_task_list_query(schema, user_id, filters, now=None, search_ids=None):
+    """
+    Build the SELECT for one page of the task list
+
+    Args:
+        schema: SchemaInfo from database.get_schema()
+        user_id: Current user's id
+        filters: TaskFilters
+        now: Reference time for the overdue/today filters and flags
+        search_ids: Ranked task ids matching filters.q, required when the
+            database has no full-text index (see search.fallback_search)
+
+    Returns:
+        (sql, params, reverse): reverse is True when rows come back in
+        descending page order and must be flipped by the caller.
+    """
+    backend = schema.backend
+    now = now or datetime.now()
+    join_sql, where, params, relevance = _filter_clauses(schema, user_id, filters, now, search_ids)
+    derived_sql, derived_params = _derived_columns(schema, now)
+    sort_expr, direction = SORT_OPTIONS.get(filters.sort, (None, None))
+    if filters.sort == RELEVANCE_SORT and relevance:
+        sort_expr, direction = relevance
+    elif sort_expr == 'priority_rank':
+        sort_expr = _priority_rank_expr(schema)
+
+    reverse = False
+    if filters.cursor:
+        sort_value, last_id, cursor_direction = decode_cursor(filters.cursor)
+        if backend == 'azure_sql' and sort_expr == 'created_at' and isinstance(sort_value, str):
+            sort_value = datetime.fromisoformat(sort_value)
+        reverse = cursor_direction == 'prev'
+        # Walking backwards flips the comparison and the scan order
+        descending = (direction == 'DESC') != reverse
+        op = '<' if descending else '>'
+        where.append(f"({sort_expr} {op} ? OR ({sort_expr} = ? AND id {op} ?))")
+        params.extend([sort_value, sort_value, last_id])
+        if reverse:
+            direction = 'ASC' if direction == 'DESC' else 'DESC'
+
+    limit = filters.page_size + 1
+    columns = f"{TASK_COLUMNS}, {derived_sql}, {sort_expr} AS sort_key"
+    where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+    order_sql = f" ORDER BY {sort_expr} {direction}, id {direction}"
+    if backend == 'azure_sql':
+        sql = f"SELECT TOP {limit} {columns} FROM tasks{join_sql}{where_sql}{order_sql}"
+    else:
+        sql = f"SELECT {columns} FROM tasks{join_sql}{where_sql}{order_sql} LIMIT {limit}"
+    # Select-list placeholders come first in the statement
+    return sql, tuple(derived_params + params), reverse
+
+
+def paginate(rows, filters, reverse):
+    """
+    Trim the look-ahead row and work out neighbouring cursors
+
+    Args:
+        rows: List of (Task, sort_key) from task_row()
+        filters: TaskFilters used for the query
+        reverse: Value returned by build_task_list_query()
+
+    Returns:
+        TaskPage
+    """
+    has_more = len(rows) > filters.page_size
+    rows = rows[:filters.page_size]
+    if reverse:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        first_task, first_key = rows[0]
+        last_task, last_key = rows[-1]
+        # Forward: more rows ahead means a next page; a cursor means a page behind.
+        # Backward: the page we came from is ahead; more rows means a page behind.
+        if (has_more and not reverse) or (reverse and filters.cursor):
+            next_cursor = encode_cursor(last_key, last_task.id, 'next')
+        if (filters.cursor and not reverse) or (reverse and has_more):
+            prev_cursor = encode_cursor(first_key, first_task.id, 'prev')
+    return TaskPage([task for task, _ in rows], next_cursor, prev_cursor)
@@ -0,0 +1,402 @@
+"""
+Task reads and writes used by the routes
+
+Every statement is built once per schema, so its text never changes: sqlite3
+finds it in the connection's statement cache instead of compiling it again,
+and Azure SQL reuses its cached plan. Mutations are scoped to the task's
+owner (`AND user_id = ?`) and are a single statement each; toggling flips
+`completed` in the UPDATE itself and reads the new value back with
+RETURNING (SQLite 3.35+) or OUTPUT (Azure SQL). The owner's task_version is
+only bumped when a task actually changed.
+
+Writes go through database.run_write(), so they take part in group commit
+when it is enabled; reads go to the read replica when one is usable. With
+sharding on, both go to the owner's shard.
+
+Archived tasks (see archive.py) are only read by the archived view, one
+keyset page at a time, and restoring one moves it back under its own id.
+
+Every write also stamps the rows it changes with updated_at and the
+owner's next task_version (change_version), and a deleted task leaves a
+tombstone, so the change feed reads only what changed after a cursor.
+"""
+import sqlite3
+import threading
+from datetime import datetime
+
+import search
+from database import bump_task_version, get_schema, get_task_connection, next_task_version_sql, run_write
+from metrics import run_query
+from task_queries import (InvalidCursor, TaskChanges, TaskPage, build_task_list_query, decode_cursor, encode_cursor,
+                          paginate, task_row)
+
+# UPDATE/INSERT ... RETURNING arrived in SQLite 3.35
+SQLITE_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+EDIT_COLUMNS = ('id', 'title', 'description', 'priority', 'category', 'due_date')
+
+# Same result as the old read-then-write toggle for 0, 1 and NULL
+TOGGLED_COMPLETED = "CASE WHEN completed = 1 THEN 0 ELSE 1 END"
+# Completion time on the database clock, the one the archive job compares against
+TOGGLED_COMPLETED_AT = "completed_at = CASE WHEN completed = 1 THEN NULL ELSE CURRENT_TIMESTAMP END"
+
+# Columns tasks and tasks_archive share (see migrations.py)
+ARCHIVE_COLUMNS = ('id', 'title', 'description', 'completed', 'priority', 'category', 'due_date', 'created_at',
+                   'user_id', 'completed_at')
+# Fields of a change feed entry; tombstones only fill id, updated_at (their deleted_at) and deleted
+CHANGE_FIELDS = ('id', 'title', 'description', 'completed', 'priority', 'category', 'due_date', 'created_at',
+                 'updated_at', 'change_version', 'deleted')
+CHANGE_DATETIME_FIELDS = ('due_date', 'created_at', 'updated_at')
+ARCHIVED_FIELDS = ('id', 'title', 'description', 'completed', 'priority', 'category', 'due_date', 'created_at',
+                   'completed_at', 'archived_at')
+
+
+def _parse_datetime(value):
+    """Read canonical SQLite datetime text like the DATETIME converter does (None when unreadable)"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+class TaskRepository:
+    """Task statements for one schema (see database.get_schema())"""
+
+    def __init__(self, schema):
+        """
+        Args:
+            schema: SchemaInfo the statements are built for
+        """
+        self.schema = schema
+        azure = schema.backend == 'azure_sql'
+        self.returning = azure or SQLITE_RETURNING
+        owner = " AND user_id = ?" if schema.has_user_id else ""
+        columns = "title, description, due_date, priority, category"
+        placeholders = "?, ?, ?, ?, ?"
+        if schema.has_user_id:
+            columns += ", user_id"
+            placeholders += ", ?"
+        toggled = f"completed = {TOGGLED_COMPLETED}"
+        if schema.has_completed_at:
+            toggled += f", {TOGGLED_COMPLETED_AT}"
+        # The stamp's owner placeholder binds the user id (see _stamped())
+        stamp = ""
+        if schema.has_change_feed:
+            next_version = next_task_version_sql()
+            stamp = f", updated_at = CURRENT_TIMESTAMP, change_version = {next_version}"
+            columns += ", updated_at, change_version"
+            placeholders += f", CURRENT_TIMESTAMP, {next_version}"
+            toggled += stamp
+
+        if azure:
+            self.insert_sql = f"INSERT INTO tasks ({columns}) OUTPUT INSERTED.id VALUES ({placeholders})"
+            self.toggle_sql = f"UPDATE tasks SET {toggled} OUTPUT INSERTED.completed WHERE id = ?{owner}"
+        elif self.returning:
+            self.insert_sql = f"INSERT INTO tasks ({columns}) VALUES ({placeholders}) RETURNING id"
+            self.toggle_sql = f"UPDATE tasks SET {toggled} WHERE id = ?{owner} RETURNING completed"
+        else:
+            self.insert_sql = f"INSERT INTO tasks ({columns}) VALUES ({placeholders})"
+            self.toggle_sql = f"UPDATE tasks SET {toggled} WHERE id = ?{owner}"
+        self.completed_sql = f"SELECT completed FROM tasks WHERE id = ?{owner}"
+        self.update_sql = (f"UPDATE tasks SET title = ?, description = ?, priority = ?, category = ?, due_date = ?"
+                           f"{stamp} WHERE id = ?{owner}")
+        self.delete_sql = f"DELETE FROM tasks WHERE id = ?{owner}"
+        self.get_sql = f"SELECT {', '.join(EDIT_COLUMNS)} FROM tasks WHERE id = ?{owner}"
+
+        if schema.has_archive:
+            # Newest first; the page size is a parameter so the text never changes
+            fields = ', '.join(ARCHIVED_FIELDS)
+            top, limit = ("TOP (?) ", "") if azure else ("", " LIMIT ?")
+            order = " ORDER BY archived_at DESC, id DESC"
+            self.archived_sql = f"SELECT {top}{fields} FROM tasks_archive WHERE user_id = ?{order}{limit}"
+            self.archived_after_sql = (f"SELECT {top}{fields} FROM tasks_archive WHERE user_id = ? "
+                                       f"AND (archived_at < ? OR (archived_at = ? AND id < ?)){order}{limit}")
+            # Restored tasks count as completed now, so the job does not move them straight back
+            restored = ', '.join(ARCHIVE_COLUMNS[:-1])
+            restored_columns, restored_values = f"{restored}, completed_at", f"{restored}, CURRENT_TIMESTAMP"
+            if schema.has_change_feed:
+                restored_columns += ", updated_at, change_version"
+                restored_values += f", CURRENT_TIMESTAMP, {next_version}"
+            self.restore_sql = (f"INSERT INTO tasks ({restored_columns}) SELECT {restored_values} "
+                                f"FROM tasks_archive WHERE id = ? AND user_id = ?")
+            if azure:
+                # Task ids are an IDENTITY column on Azure SQL
+                self.restore_sql = f"SET IDENTITY_INSERT tasks ON; {self.restore_sql}; SET IDENTITY_INSERT tasks OFF"
+            self.unarchive_sql = "DELETE FROM tasks_archive WHERE id = ? AND user_id = ?"
+
+        if schema.has_change_feed:
+            self.tombstone_sql = (f"INSERT INTO task_tombstones (id, user_id, change_version) "
+                                  f"SELECT id, user_id, {next_version} FROM tasks WHERE id = ? AND user_id = ?")
+            self.untombstone_sql = "DELETE FROM task_tombstones WHERE id = ? AND user_id = ?"
+            # Oldest change first. A cursor ends either after a whole version
+            # or after a task within one (a page cut through a bulk change).
+            fields = ', '.join(CHANGE_FIELDS[:-1])
+            live_rows = f"{fields}, 0 AS deleted FROM tasks WHERE user_id = ?"
+            live = f"SELECT {live_rows}"
+            dead = ("SELECT id, NULL, NULL, NULL, NULL, NULL, NULL, NULL, deleted_at, change_version, 1 "
+                    "FROM task_tombstones WHERE user_id = ?")
+            top, limit = ("TOP (?) ", "") if azure else ("", " LIMIT ?")
+            order = " ORDER BY change_version, id"
+            # A first sync needs no tombstones
+            self.changes_sql = f"SELECT {top}{live_rows}{order}{limit}"
+            after_version = " AND change_version > ?"
+            after_task = " AND (change_version > ? OR (change_version = ? AND id > ?))"
+            self.changes_after_version_sql = (f"SELECT {top}* FROM ({live}{after_version} UNION ALL "
+                                              f"{dead}{after_version}) AS changes{order}{limit}")
+            self.changes_after_task_sql = (f"SELECT {top}* FROM ({live}{after_task} UNION ALL "
+                                           f"{dead}{after_task}) AS changes{order}{limit}")
+
+    def _key(self, task_id, user_id):
+        """Parameters of the `id = ? [AND user_id = ?]` condition"""
+        return (task_id, user_id) if self.schema.has_user_id else (task_id,)
+
+    def _stamped(self, user_id):
+        """Parameters of the change stamp (the owner of next_task_version_sql())"""
+        return (user_id,) if self.schema.has_change_feed else ()
+
+    def list_page(self, user_id, filters, now=None):
+        """
+        Read one page of a user's tasks, with flags evaluated at now
+
+        Returns:
+            TaskPage of Task objects
+        """
+        conn = get_task_connection(user_id)
+        search_ids = None
+        if filters.terms and self.schema.search is None:
+            search_ids = search.fallback_search(conn, user_id, filters.q, self.schema.has_user_id)
+        sql, params, reverse = build_task_list_query(self.schema, user_id, filters, now=now, search_ids=search_ids)
+        cursor = conn.cursor()
+        # Dates arrive as datetimes: from pyodbc, or the DATETIME converter on SQLite
+        if self.schema.backend == 'sqlite':
+            cursor.row_factory = task_row
+            rows = run_query(cursor, 'fetch_tasks', sql, params, fetch='all')
+        else:
+            rows = [task_row(cursor, row) for row in run_query(cursor, 'fetch_tasks', sql, params, fetch='all')]
+        cursor.close()
+        conn.close()
+        return paginate(rows, filters, reverse)
+
+    def get(self, user_id, task_id):
+        """
+        Read the editable fields of one of the user's tasks
+
+        Returns:
+            Dict of EDIT_COLUMNS, or None when the user has no such task
+        """
+        conn = get_task_connection(user_id)
+        cursor = conn.cursor()
+        try:
+            row = run_query(cursor, 'task_by_id', self.get_sql, self._key(task_id, user_id), fetch='one')
+        finally:
+            cursor.close()
+            conn.close()
+        return dict(zip(EDIT_COLUMNS, row)) if row else None
+
+    def add(self, user_id, title, description, due_date, priority, category):
+        """
+        Create a task owned by user_id
+
+        Returns:
+            New task id
+        """
+        params = (title, description, due_date, priority, category)
+        if self.schema.has_user_id:
+            params += (user_id,)
+        params += self._stamped(user_id)
+
+        def insert(cursor):
+            if self.returning:
+                task_id = run_query(cursor, 'insert_task', self.insert_sql, params, fetch='all')[0][0]
+            else:
+                task_id = run_query(cursor, 'insert_task', self.insert_sql, params).lastrowid
+            bump_task_version(cursor, user_id)
+            return task_id
+
+        return run_write(insert, user_id)
+
+    def toggle(self, user_id, task_id):
+        """
+        Flip a task's completion status in one UPDATE
+
+        Returns:
+            New status (0 or 1), or None when the user has no such task
+        """
+        key = self._key(task_id, user_id)
+        params = self._stamped(user_id) + key
+
+        def toggle(cursor):
+            if self.returning:
+                # fetch='all' leaves no statement half-read before the commit
+                rows = run_query(cursor, 'toggle_task', self.toggle_sql, params, fetch='all')
+                if not rows:
+                    return None
+                completed = rows[0][0]
+            else:
+                if run_query(cursor, 'toggle_task', self.toggle_sql, params).rowcount == 0:
+                    return None
+                completed = run_query(cursor, 'toggle_read', self.completed_sql, key, fetch='one')[0]
+            bump_task_version(cursor, user_id)
+            return 1 if completed else 0
+
+        return run_write(toggle, user_id)
+
+    def update(self, user_id, task_id, title, description, priority, category, due_date):
+        """
+        Replace the editable fields of a task
+
+        Returns:
+            True when the task was updated, False when the user has no such task
+        """
+        params = (title, description, priority, category, due_date) + self._stamped(user_id)
+        params += self._key(task_id, user_id)
+
+        def update(cursor):
+            changed = run_query(cursor, 'edit_task', self.update_sql, params).rowcount > 0
+            if changed:
+                bump_task_version(cursor, user_id)
+            return changed
+
+        return run_write(update, user_id)
+
+    def delete(self, user_id, task_id):
+        """
+        Delete a task
+
+        Returns:
+            True when the task was deleted, False when the user has no such task
+        """
+        key = self._key(task_id, user_id)
+
+        def delete(cursor):
+            if self.schema.has_change_feed:
+                run_query(cursor, 'tombstone_task', self.tombstone_sql, self._stamped(user_id) + key)
+            deleted = run_query(cursor, 'delete_task', self.delete_sql, key).rowcount > 0
+            if deleted:
+                bump_task_version(cursor, user_id)
+            return deleted
+
+        return run_write(delete, user_id)
+
+    def list_archived(self, user_id, filters):
+        """
+        Read one page of a user's archived tasks, most recently archived first
+
+        Args:
+            filters: TaskFilters; only page_size and a 'next' cursor are used
+
+        Returns:
+            TaskPage of dicts of ARCHIVED_FIELDS
+        """
+        if not self.schema.has_archive:
+            return TaskPage([])
+        limit = filters.page_size + 1
+        if filters.cursor:
+            archived_at, last_id, direction = decode_cursor(filters.cursor)
+            if direction != 'next':
+                raise InvalidCursor(f"Archived pages only go forward: {filters.cursor!r}")
+            sql, params = self.archived_after_sql, (user_id, archived_at, archived_at, last_id)
+        else:
+            sql, params = self.archived_sql, (user_id,)
+        # TOP comes before the other placeholders, LIMIT after them
+        params = (limit,) + params if self.schema.backend == 'azure_sql' else params + (limit,)
+        conn = get_task_connection(user_id)
+        cursor = conn.cursor()
+        try:
+            rows = run_query(cursor, 'fetch_archived', sql, params, fetch='all')
+        finally:
+            cursor.close()
+            conn.close()
+        tasks = [dict(zip(ARCHIVED_FIELDS, row)) for row in rows[:filters.page_size]]
+        next_cursor = None
+        if len(rows) > filters.page_size:
+            last = tasks[-1]
+            next_cursor = encode_cursor(last['archived_at'], last['id'], 'next')
+        return TaskPage(tasks, next_cursor)
+
+    def restore(self, user_id, task_id):
+        """
+        Move an archived task back to the user's task list, keeping its id
+
+        Returns:
+            True when the task was restored, False when the user has no such archived task
+        """
+        if not self.schema.has_archive:
+            return False
+        key = (task_id, user_id)
+
+        def restore(cursor):
+            run_query(cursor, 'restore_task', self.restore_sql, self._stamped(user_id) + key)
+            restored = run_query(cursor, 'unarchive_task', self.unarchive_sql, key).rowcount > 0
+            if restored:
+                if self.schema.has_change_feed:
+                    # The task is live again under the same id
+                    run_query(cursor, 'untombstone_task', self.untombstone_sql, key)
+                bump_task_version(cursor, user_id)
+            return restored
+
+        return run_write(restore, user_id)
+
+    def changes(self, user_id, since=None, limit=500, current=None):
+        """
+        Read the user's task changes after a change feed position, oldest first
+
+        Args:
+            since: (change_version, last task id or None) from a previous
+                call; None reads every live task (a first sync)
+            limit: Most changes returned
+            current: The user's task_version read before this call; a
+                complete read then ends at it, past versions that left
+                nothing to read (such as deletes before a first sync)
+
+        Returns:
+            TaskChanges with dicts of CHANGE_FIELDS and the position after them
+        """
+        if not self.schema.has_change_feed:
+            return TaskChanges([], since)
+        if since is None:
+            sql, params = self.changes_sql, (user_id,)
+        else:
+            version, last_id = since
+            if last_id is None:
+                sql, params = self.changes_after_version_sql, (user_id, version) * 2
+            else:
+                sql, params = self.changes_after_task_sql, (user_id, version, version, last_id) * 2
+        params = (limit + 1,) + params if self.schema.backend == 'azure_sql' else params + (limit + 1,)
+        conn = get_task_connection(user_id)
+        cursor = conn.cursor()
+        try:
+            rows = run_query(cursor, 'fetch_changes', sql, params, fetch='all')
+        finally:
+            cursor.close()
+            conn.close()
+        changes = [dict(zip(CHANGE_FIELDS, row)) for row in rows[:limit]]
+        for change in changes:
+            # SQLite loses the DATETIME column types through the UNION
+            for field in CHANGE_DATETIME_FIELDS:
+                if isinstance(change[field], str):
+                    change[field] = _parse_datetime(change[field])
+        if len(rows) > limit:
+            # The page may have cut through the last version
+            last = changes[-1]
+            return TaskChanges(changes, (last['change_version'], last['id']), True)
+        # Versions commit in order, so everything up to the newest one seen has been read
+        seen = [current, since[0] if since else None, changes[-1]['change_version'] if changes else None]
+        return TaskChanges(changes, (max((v for v in seen if v is not None), default=0), None), False)
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_task_repository():
+    """Return the TaskRepository for the current schema, building it when the schema changes"""
+    global _repository
+    schema = get_schema()
+    repository = _repository
+    if repository is None or repository.schema is not schema:
+        with _repository_lock:
+            if _repository is None or _repository.schema is not schema:
+                _repository = TaskRepository(schema)
+            repository = _repository
+    return repository
@@ -0,0 +1,119 @@
+import pytest
+import sys
+import os
+import gzip
+import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config
+from database import create_user, dispose_pool, init_database
+
+
+@pytest.fixture
+def client(tmp_path):
+    """Logged-in test client on a fresh database"""
+    from app import app
+
+    original_db = Config.SQLITE_DATABASE
+    Config.SQLITE_DATABASE = str(tmp_path / 'tasks.db')
+    dispose_pool()
+    init_database()
+    user_id = create_user('poller', 'poller@example.com', 'secret123')
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['username'] = 'poller'
+        yield client
+    dispose_pool()
+    Config.SQLITE_DATABASE = original_db
+
+
+def test_requires_login():
+    """Test anonymous API calls get 401 JSON instead of a redirect"""
+    from app import app
+
+    with app.test_client() as anonymous:
+        response = anonymous.get('/api/tasks')
+    assert response.status_code == 401
+    assert response.get_json()['error']
+
+
+def test_lists_tasks_with_field_selection(client):
+    """Test the API applies home() filters and returns only requested fields"""
+    client.post('/task/add', data={'title': 'Write report', 'category': 'Work', 'due_date': '2030-01-01T09:00'})
+    client.post('/task/add', data={'title': 'Buy milk', 'category': 'Home'})
+
+    data = client.get('/api/tasks?category=Work&fields=id,title,due_date').get_json()
+    assert [set(task) for task in data['tasks']] == [{'id', 'title', 'due_date'}]
+    assert data['tasks'][0]['title'] == 'Write report'
+    assert data['tasks'][0]['due_date'] == '2030-01-01T09:00:00'
+    assert data['next_cursor'] is None
+
+
+def test_rejects_unknown_fields_and_cursors(client):
+    """Test bad field names and cursors are client errors"""
+    assert client.get('/api/tasks?fields=id,password_hash').status_code == 400
+    assert client.get('/api/tasks?cursor=garbage').status_code == 400
+
+
+def test_conditional_get(client):
+    """Test If-None-Match returns 304 until the user's tasks change"""
+    client.post('/task/add', data={'title': 'First'})
+    first = client.get('/api/tasks?fields=id,title')
+    etag = first.headers['ETag']
+    assert not etag.startswith('W/')
+
+    repeat = client.get('/api/tasks?fields=id,title', headers={'If-None-Match': etag})
+    assert repeat.status_code == 304
+    assert repeat.data == b''
+
+    other_fields = client.get('/api/tasks?fields=id', headers={'If-None-Match': etag})
+    assert other_fields.status_code == 200
+
+    task_id = first.get_json()['tasks'][0]['id']
+    client.post(f'/task/{task_id}/toggle')
+    changed = client.get('/api/tasks?fields=id,title', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_every_mutation_changes_etag(client):
+    """Test add, edit, toggle and delete each bump the change version"""
+    etags = set()
+
+    def current():
+        etags.add(client.get('/api/tasks?fields=id').headers['ETag'])
+
+    current()
+    client.post('/task/add', data={'title': 'Versioned'})
+    current()
+    task_id = client.get('/api/tasks').get_json()['tasks'][0]['id']
+    client.post(f'/task/{task_id}/edit', data={'title': 'Versioned again'})
+    current()
+    client.post(f'/task/{task_id}/toggle')
+    current()
+    client.post(f'/task/{task_id}/delete')
+    current()
+    assert len(etags) == 5
+
+
+def test_large_responses_are_gzipped(client):
+    """Test big payloads are compressed for gzip clients only"""
+    for i in range(30):
+        client.post('/task/add', data={'title': f'Task number {i}', 'description': 'x' * 50})
+
+    plain = client.get('/api/tasks')
+    assert 'Content-Encoding' not in plain.headers
+
+    compressed = client.get('/api/tasks', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert len(compressed.data) < len(plain.data)
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+
+    repeat = client.get('/api/tasks', headers={'Accept-Encoding': 'gzip',
+                                               'If-None-Match': compressed.headers['ETag']})
+    assert repeat.status_code == 304
@@ -124,3 +124,18 @@ def test_edit_task(client):
 
     assert response.status_code == 200
     assert b'Updated Title' in response.data
+
+def test_template_cache_needs_private_directory(tmp_path):
+    """Test compiled templates are only cached in a directory other users cannot write"""
+    from app import template_bytecode_cache
+    private = tmp_path / 'private'
+    cache = template_bytecode_cache(str(private))
+    assert cache is not None and cache.directory == str(private)
+    assert os.stat(private).st_mode & 0o777 == 0o700
+
+    planted = tmp_path / 'planted'
+    planted.mkdir(mode=0o777)
+    os.chmod(planted, 0o777)
+    assert template_bytecode_cache(str(planted)) is None
+    # Jinja's own per-user directory, which it checks itself
+    assert template_bytecode_cache('') is not None
@@ -0,0 +1,189 @@
+import pytest
+import sys
+import os
+import sqlite3
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import shard_db
+from archive import ArchiveJob
+from config import Config
+from database import create_user, dispose_pool, get_task_version, init_database, shard_database_path, shard_of
+from task_queries import TaskFilters
+from task_repository import get_task_repository
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Fresh migrated database, unsharded until a test sets SQLITE_SHARDS"""
+    original = Config.SQLITE_DATABASE, Config.SQLITE_SHARDS
+    Config.SQLITE_DATABASE = str(tmp_path / 'tasks.db')
+    Config.SQLITE_SHARDS = 0
+    dispose_pool()
+    init_database()
+    yield Config.SQLITE_DATABASE
+    dispose_pool()
+    Config.SQLITE_DATABASE, Config.SQLITE_SHARDS = original
+
+
+def age_completed(path, days):
+    """Backdate the completion of every completed task in a database file"""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("UPDATE tasks SET completed_at = datetime('now', ?) WHERE completed = 1", (f'-{days} days',))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def titles(user_id):
+    return sorted(task.title for task in get_task_repository().list_page(user_id, TaskFilters()).tasks)
+
+
+def archived_titles(user_id):
+    return sorted(task['title'] for task in get_task_repository().list_archived(user_id, TaskFilters()).tasks)
+
+
+def test_completion_time_follows_every_write(db_path):
+    """Test toggles and bulk updates set completed_at on completion and clear it on undo"""
+    import bulk
+    from database import get_db_connection, get_schema
+
+    user_id = create_user('alice', 'alice@example.com', 'secret123')
+    repository = get_task_repository()
+    task_id = repository.add(user_id, 'Toggled', '', None, 'Medium', 'General')
+
+    def completed_at():
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute("SELECT completed_at FROM tasks WHERE id = ?", (task_id,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    repository.toggle(user_id, task_id)
+    assert completed_at() is not None
+    repository.toggle(user_id, task_id)
+    assert completed_at() is None
+
+    conn = get_db_connection()
+    try:
+        bulk.update_tasks(conn, get_schema(), user_id, {'completed': True}, ids=[task_id])
+        first = completed_at()
+        assert first is not None
+        age_completed(db_path, 3)
+        # Setting completed on a completed task keeps its completion time
+        bulk.update_tasks(conn, get_schema(), user_id, {'completed': True}, ids=[task_id])
+        assert completed_at() < first
+        bulk.create_tasks(conn, get_schema(), user_id, [{'title': 'Born done', 'completed': True}], 10)
+    finally:
+        conn.close()
+    check = sqlite3.connect(db_path)
+    try:
+        assert check.execute("SELECT completed_at IS NOT NULL FROM tasks WHERE title = 'Born done'").fetchone()[0]
+    finally:
+        check.close()
+
+
+def test_job_moves_old_completed_tasks_in_batches(db_path):
+    """Test only tasks completed long ago move, batch by batch, and can be paged through and restored"""
+    user_id = create_user('alice', 'alice@example.com', 'secret123')
+    repository = get_task_repository()
+    ids = [repository.add(user_id, f'Task {n}', '', None, 'Medium', 'General') for n in range(5)]
+    for task_id in ids[:3]:
+        repository.toggle(user_id, task_id)
+    age_completed(db_path, 40)
+    repository.toggle(user_id, ids[3])  # completed just now: stays
+    version = get_task_version(user_id)
+
+    notified = []
+    job = ArchiveJob(max_age_days=30, batch_size=2, pause=0, on_archive=notified.append)
+    assert job.run_once() == 3
+    assert notified == [{user_id}, {user_id}]
+    assert get_task_version(user_id) == version + 2
+    assert titles(user_id) == ['Task 3', 'Task 4']
+    assert job.run_once() == 0
+
+    first = repository.list_archived(user_id, TaskFilters(page_size=2))
+    assert len(first.tasks) == 2 and first.next_cursor
+    rest = repository.list_archived(user_id, TaskFilters(page_size=2, cursor=first.next_cursor))
+    assert len(rest.tasks) == 1 and rest.next_cursor is None
+    assert sorted(task['id'] for task in first.tasks + rest.tasks) == ids[:3]
+
+    assert repository.restore(user_id, ids[0])
+    assert not repository.restore(user_id, ids[0])
+    assert titles(user_id) == ['Task 0', 'Task 3', 'Task 4']
+    assert archived_titles(user_id) == ['Task 1', 'Task 2']
+    # Restored tasks count as completed now, so the job leaves them alone
+    assert job.run_once() == 0
+    assert ArchiveJob(max_age_days=0).run_once() == 0
+
+
+def test_archived_view_and_api(db_path):
+    """Test the archived page, its JSON twin, and restoring through both"""
+    from app import app
+
+    user_id = create_user('bob', 'bob@example.com', 'secret123')
+    other_id = create_user('eve', 'eve@example.com', 'secret123')
+    repository = get_task_repository()
+    first = repository.add(user_id, 'Old report', '', None, 'High', 'Work')
+    second = repository.add(user_id, 'Old invoice', '', None, 'Low', 'Work')
+    for task_id in (first, second):
+        repository.toggle(user_id, task_id)
+    age_completed(db_path, 90)
+    ArchiveJob(max_age_days=30, pause=0).run_once()
+
+    app.config['TESTING'] = True
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['username'] = 'bob'
+    page = client.get('/tasks/archived')
+    assert page.status_code == 200 and b'Old report' in page.data
+    body = client.get('/api/tasks/archived').get_json()
+    assert sorted(task['title'] for task in body['tasks']) == ['Old invoice', 'Old report']
+    assert all(task['completed'] is True and task['archived_at'] for task in body['tasks'])
+    assert client.get('/api/tasks/archived?cursor=bogus').status_code == 400
+
+    assert client.post(f'/api/tasks/{first}/restore').get_json() == {'restored': first}
+    assert client.post(f'/api/tasks/{first}/restore').status_code == 404
+    assert [task['title'] for task in client.get('/api/tasks').get_json()['tasks']] == ['Old report']
+    client.post(f'/task/{second}/restore')
+    assert titles(user_id) == ['Old invoice', 'Old report']
+
+    # Another user cannot restore someone else's archived task
+    repository.toggle(user_id, second)
+    age_completed(db_path, 90)
+    ArchiveJob(max_age_days=30, pause=0).run_once()
+    other = app.test_client()
+    with other.session_transaction() as sess:
+        sess['user_id'] = other_id
+        sess['username'] = 'eve'
+    assert other.post(f'/api/tasks/{second}/restore').status_code == 404
+    assert other.get('/api/tasks/archived').get_json()['tasks'] == []
+
+
+def test_archive_on_shards_moves_with_rebalance(db_path):
+    """Test the job archives on every shard and shard_db.py moves archived tasks with their owners"""
+    Config.SQLITE_SHARDS = 2
+    dispose_pool()
+    users = [create_user(f'user{n}', f'user{n}@example.com', 'secret123') for n in range(8)]
+    repository = get_task_repository()
+    archived = {}
+    for user_id in users:
+        archived[user_id] = repository.add(user_id, f'Done {user_id}', '', None, 'Low', 'Home')
+        repository.toggle(user_id, archived[user_id])
+        repository.add(user_id, f'Open {user_id}', '', None, 'Low', 'Home')
+    for shard in range(2):
+        age_completed(shard_database_path(shard), 40)
+    assert ArchiveJob(max_age_days=30, pause=0).run_once() == 8
+
+    assert shard_db.main(['--rebalance', '--shards', '3']) == 0
+    Config.SQLITE_SHARDS = 3
+    dispose_pool()
+    repository = get_task_repository()
+    assert {shard_of(user_id) for user_id in users} == {0, 1, 2}
+    for user_id in users:
+        assert titles(user_id) == [f'Open {user_id}']
+        assert archived_titles(user_id) == [f'Done {user_id}']
+        assert repository.restore(user_id, archived[user_id])
+        assert titles(user_id) == [f'Done {user_id}', f'Open {user_id}']
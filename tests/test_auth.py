@@ -0,0 +1,162 @@
+import pytest
+import sys
+import os
+import sqlite3
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from werkzeug.security import generate_password_hash
+
+import passwords
+from config import Config
+from database import create_user, dispose_pool, get_user_by_login, init_database
+from passwords import PasswordHasher, PasswordHasherBusy
+
+
+@pytest.fixture
+def client(tmp_path):
+    """Anonymous test client on a fresh database"""
+    from app import app
+
+    original_db = Config.SQLITE_DATABASE
+    Config.SQLITE_DATABASE = str(tmp_path / 'tasks.db')
+    dispose_pool()
+    init_database()
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+    dispose_pool()
+    Config.SQLITE_DATABASE = original_db
+
+
+def signup(client, username, email, password='secret123'):
+    return client.post('/signup', data={'username': username, 'email': email,
+                                        'password': password, 'confirm_password': password})
+
+
+def stored_hash(username):
+    conn = sqlite3.connect(Config.SQLITE_DATABASE)
+    try:
+        return conn.execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_signup_relies_on_unique_constraints(client):
+    """Test signup creates the account and reports which field is taken"""
+    response = signup(client, 'alice', 'alice@example.com')
+    assert response.status_code == 302
+    client.get('/logout')
+
+    assert b'Username already exists' in signup(client, 'alice', 'other@example.com').data
+    assert b'Email already registered' in signup(client, 'alicia', 'alice@example.com').data
+    conn = sqlite3.connect(Config.SQLITE_DATABASE)
+    assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
+    conn.close()
+
+
+def test_login_by_username_or_email(client):
+    """Test one lookup finds users by username or email"""
+    create_user('bob', 'bob@example.com', 'secret123')
+    for login in ('bob', 'bob@example.com'):
+        response = client.post('/login', data={'username': login, 'password': 'secret123'})
+        assert response.status_code == 302
+        client.get('/logout')
+    response = client.post('/login', data={'username': 'bob', 'password': 'wrong'})
+    assert b'Invalid username or password' in response.data
+
+
+def test_username_match_wins_over_email_match(client):
+    """Test a login equal to one user's username and another's email picks the username"""
+    create_user('carol@example.com', 'carol1@example.com', 'secret123')
+    create_user('carol', 'carol@example.com', 'secret123')
+    assert get_user_by_login('carol@example.com')['username'] == 'carol@example.com'
+
+
+def test_login_upgrades_old_password_hashes(client):
+    """Test a hash made with other parameters is replaced on the next login"""
+    create_user('dave', 'dave@example.com', 'secret123')
+    old_hash = generate_password_hash('secret123', method='pbkdf2:sha256:1000')
+    conn = sqlite3.connect(Config.SQLITE_DATABASE)
+    conn.execute("UPDATE users SET password_hash = ? WHERE username = 'dave'", (old_hash,))
+    conn.commit()
+    conn.close()
+
+    response = client.post('/login', data={'username': 'dave', 'password': 'secret123'})
+    assert response.status_code == 302
+    new_hash = stored_hash('dave')
+    assert new_hash != old_hash
+    assert new_hash.startswith(Config.PASSWORD_HASH_METHOD + '$')
+
+
+def test_needs_rehash():
+    """Test rehash detection compares only the configured parameters"""
+    hasher = PasswordHasher('pbkdf2:sha256:600000', workers=0)
+    assert not hasher.needs_rehash('pbkdf2:sha256:600000$salt$hash')
+    assert hasher.needs_rehash('pbkdf2:sha256:260000$salt$hash')
+    assert hasher.needs_rehash('scrypt:32768:8:1$salt$hash')
+    assert not PasswordHasher('pbkdf2', workers=0).needs_rehash('pbkdf2:sha256:260000$salt$hash')
+
+
+def test_hashing_runs_in_process_pool():
+    """Test hashes made in the pool verify, in the pool and inline"""
+    hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1)
+    try:
+        password_hash = hasher.hash('secret123')
+        assert password_hash.startswith('pbkdf2:sha256:1000$')
+        assert hasher.verify(password_hash, 'secret123')
+        assert not hasher.verify(password_hash, 'wrong')
+        assert PasswordHasher('pbkdf2:sha256:1000', workers=0).verify(password_hash, 'secret123')
+    finally:
+        hasher.shutdown()
+
+
+def test_concurrent_verifies_within_thread_count_succeed():
+    """Test as many simultaneous logins as the configured slots all verify at the real cost"""
+    count = Config.PASSWORD_HASH_MAX_PENDING
+    hasher = PasswordHasher(Config.PASSWORD_HASH_METHOD, workers=1, max_pending=count,
+                            timeout=Config.PASSWORD_HASH_TIMEOUT)
+    password_hash = generate_password_hash('secret123', method=Config.PASSWORD_HASH_METHOD)
+    try:
+        with ThreadPoolExecutor(max_workers=count) as pool:
+            results = list(pool.map(lambda _: hasher.verify(password_hash, 'secret123'), range(count)))
+        assert results == [True] * count
+        assert hasher.hash_seconds > 0
+    finally:
+        hasher.shutdown()
+
+
+def test_hashing_processes_skip_main_module(tmp_path):
+    """Test spawned hashing processes import passwords, not the script that started them"""
+    marker = tmp_path / 'imports.txt'
+    script = tmp_path / 'main.py'
+    script.write_text(
+        "import sys\n"
+        f"sys.path.insert(0, {os.path.dirname(os.path.dirname(os.path.abspath(__file__)))!r})\n"
+        f"with open({str(marker)!r}, 'a') as f:\n"
+        "    f.write('x')\n"
+        "from passwords import PasswordHasher\n"
+        "if __name__ == '__main__':\n"
+        "    hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1)\n"
+        "    assert hasher.verify(hasher.hash('secret123'), 'secret123')\n"
+        "    hasher.shutdown()\n"
+    )
+    subprocess.run([sys.executable, str(script)], check=True, timeout=60)
+    assert marker.read_text() == 'x'
+
+
+def test_saturated_hashing_sheds_logins(client, monkeypatch):
+    """Test logins beyond the hashing queue get a quick 503 instead of waiting"""
+    create_user('erin', 'erin@example.com', 'secret123')
+    busy = PasswordHasher(Config.PASSWORD_HASH_METHOD, workers=1, max_pending=1, timeout=0.05)
+    busy._slots.acquire()
+    monkeypatch.setattr(passwords, '_hasher', busy)
+    with pytest.raises(PasswordHasherBusy):
+        busy.verify(stored_hash('erin'), 'secret123')
+
+    response = client.post('/login', data={'username': 'erin', 'password': 'secret123'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert b'Too many sign-ins' in response.data
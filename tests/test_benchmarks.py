@@ -0,0 +1,60 @@
+import pytest
+import sys
+import os
+import sqlite3
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.clients import percentile
+from benchmarks.run import compare
+from benchmarks.seed import seed, username
+
+
+def result(p95, rps):
+    return {'routes': {'tasks': {'p95_ms': p95, 'rps': rps}}}
+
+
+def test_seed_creates_users_and_tasks(tmp_path):
+    path = str(tmp_path / 'bench.db')
+    task_ids = seed(path, users=3, tasks_per_user=25)
+    assert sorted(task_ids) == [username(0), username(1), username(2)]
+    assert all(len(ids) == 25 for ids in task_ids.values())
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] == 75
+        assert conn.execute("SELECT COUNT(*) FROM tasks WHERE due_date IS NULL").fetchone()[0] > 0
+        assert conn.execute("SELECT COUNT(DISTINCT category) FROM tasks").fetchone()[0] > 1
+    finally:
+        conn.close()
+
+
+def test_seed_is_reproducible(tmp_path):
+    def titles(path):
+        conn = sqlite3.connect(path)
+        try:
+            return [row[0] for row in conn.execute("SELECT title FROM tasks ORDER BY id")]
+        finally:
+            conn.close()
+
+    seed(str(tmp_path / 'a.db'), tasks_per_user=20, random_seed=7)
+    seed(str(tmp_path / 'b.db'), tasks_per_user=20, random_seed=7)
+    assert titles(str(tmp_path / 'a.db')) == titles(str(tmp_path / 'b.db'))
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 95) == 0.0
+
+
+@pytest.mark.parametrize('p95, rps, regressed', [
+    (10.0, 100.0, []),
+    (11.5, 95.0, []),
+    (13.0, 100.0, ['tasks']),
+    (10.0, 70.0, ['tasks']),
+])
+def test_compare_flags_regressions(p95, rps, regressed):
+    rows, names = compare(result(10.0, 100.0), result(p95, rps), threshold=0.2)
+    assert names == regressed
+    assert rows[0][0] == 'tasks'
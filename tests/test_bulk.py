@@ -0,0 +1,163 @@
+import pytest
+import copy
+import sys
+import os
+import sqlite3
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import bulk
+from config import Config
+from database import create_user, dispose_pool, init_database
+
+
+@pytest.fixture
+def client(tmp_path):
+    """Logged-in test client on a fresh database"""
+    from app import app
+
+    original_db = Config.SQLITE_DATABASE
+    Config.SQLITE_DATABASE = str(tmp_path / 'tasks.db')
+    dispose_pool()
+    init_database()
+    user_id = create_user('bulker', 'bulker@example.com', 'secret123')
+    other_id = create_user('other', 'other@example.com', 'secret123')
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['username'] = 'bulker'
+        client.other_id = other_id
+        yield client
+    dispose_pool()
+    Config.SQLITE_DATABASE = original_db
+
+
+def tasks_of(client):
+    return client.get('/api/tasks?per_page=200&sort=created_asc&fields=id,title,completed,category').get_json()['tasks']
+
+
+def create(client, tasks):
+    return client.post('/api/tasks/bulk', json={'tasks': tasks})
+
+
+def test_bulk_create(client):
+    """Test many tasks are created in one request"""
+    response = create(client, [{'title': f'Imported {i}', 'category': 'Import', 'due_date': '2030-01-01T09:00'}
+                               for i in range(150)])
+    assert response.get_json() == {'created': 150}
+    tasks = tasks_of(client)
+    assert len(tasks) == 150
+    assert {t['category'] for t in tasks} == {'Import'}
+
+
+def test_bulk_create_is_all_or_nothing(client):
+    """Test one invalid task rejects the whole batch"""
+    response = create(client, [{'title': 'Good'}, {'title': ''}])
+    assert response.status_code == 400
+    assert 'tasks[1]' in response.get_json()['error']
+    assert tasks_of(client) == []
+
+
+def test_bulk_create_limit(client, monkeypatch):
+    """Test the per-request task limit"""
+    from app import app
+
+    monkeypatch.setitem(app.config, 'BULK_MAX_TASKS', 2)
+    assert create(client, [{'title': 'x'}] * 3).status_code == 400
+
+
+def test_complete_by_filter(client):
+    """Test "complete all in category X" updates only matching tasks"""
+    create(client, [{'title': 'Work 1', 'category': 'Work'}, {'title': 'Work 2', 'category': 'work'},
+                    {'title': 'Home 1', 'category': 'Home'}])
+    response = client.patch('/api/tasks/bulk', json={'filter': {'category': 'Work'}, 'set': {'completed': True}})
+    assert response.get_json() == {'updated': 2}
+    done = {t['title']: t['completed'] for t in tasks_of(client)}
+    assert done == {'Work 1': True, 'Work 2': True, 'Home 1': False}
+
+
+def test_toggle_and_edit_by_ids(client):
+    """Test toggling and editing an id list"""
+    create(client, [{'title': 'A'}, {'title': 'B', 'completed': True}, {'title': 'C'}])
+    ids = [t['id'] for t in tasks_of(client)]
+    response = client.patch('/api/tasks/bulk', json={'ids': ids[:2], 'toggle': True, 'set': {'category': 'Moved'}})
+    assert response.get_json() == {'updated': 2}
+    tasks = tasks_of(client)
+    assert [t['completed'] for t in tasks] == [True, False, False]
+    assert [t['category'] for t in tasks] == ['Moved', 'Moved', 'General']
+
+
+def test_delete_all_completed(client):
+    """Test "delete all completed" by filter"""
+    create(client, [{'title': 'Done', 'completed': True}, {'title': 'Open'}])
+    response = client.delete('/api/tasks/bulk', json={'filter': {'status': 'completed'}})
+    assert response.get_json() == {'deleted': 1}
+    assert [t['title'] for t in tasks_of(client)] == ['Open']
+
+
+def test_delete_by_search_filter(client):
+    """Test filters reuse the task list search"""
+    create(client, [{'title': 'Old receipts'}, {'title': 'Keep me'}])
+    response = client.delete('/api/tasks/bulk', json={'filter': {'q': 'receipt'}})
+    assert response.get_json() == {'deleted': 1}
+    # A q without words selects nothing, instead of failing or matching everything
+    for q in ('"', '*'):
+        assert client.delete('/api/tasks/bulk', json={'filter': {'q': q}}).get_json() == {'deleted': 0}
+    assert [t['title'] for t in tasks_of(client)] == ['Keep me']
+
+
+def test_bulk_never_touches_other_users(client):
+    """Test ids belonging to another user are ignored"""
+    conn = sqlite3.connect(Config.SQLITE_DATABASE)
+    conn.execute("INSERT INTO tasks (title, user_id) VALUES ('Not yours', ?)", (client.other_id,))
+    conn.commit()
+    other_task = conn.execute("SELECT id FROM tasks").fetchone()[0]
+    conn.close()
+
+    assert client.delete('/api/tasks/bulk', json={'ids': [other_task]}).get_json() == {'deleted': 0}
+    assert client.delete('/api/tasks/bulk', json={'filter': {}}).get_json() == {'deleted': 0}
+
+
+def test_rejects_ambiguous_or_typoed_requests(client):
+    """Test risky requests are refused instead of widened"""
+    assert client.delete('/api/tasks/bulk', json={}).status_code == 400
+    assert client.delete('/api/tasks/bulk', json={'ids': [1], 'filter': {}}).status_code == 400
+    assert client.delete('/api/tasks/bulk', json={'filter': {'status': 'complete'}}).status_code == 400
+    assert client.patch('/api/tasks/bulk', json={'ids': [1]}).status_code == 400
+    assert client.patch('/api/tasks/bulk', json={'ids': [1], 'toggle': True,
+                                                 'set': {'completed': True}}).status_code == 400
+
+
+def test_bulk_changes_etag_and_cache(client):
+    """Test bulk writes invalidate cached lists and API ETags"""
+    create(client, [{'title': 'One'}])
+    etag = client.get('/api/tasks').headers['ETag']
+    assert b'One' in client.get('/tasks').data
+    client.delete('/api/tasks/bulk', json={'filter': {}})
+    assert client.get('/api/tasks', headers={'If-None-Match': etag}).status_code == 200
+    assert b'One' not in client.get('/tasks').data
+
+
+def test_filter_applies_to_every_fallback_search_match(client, monkeypatch):
+    """Test a bulk filter matching more tasks than one search page changes them all on the in-process index"""
+    import app as app_module
+    from search import FALLBACK_MAX_RESULTS
+
+    fallback = copy.copy(app_module.get_schema())
+    fallback.search = None
+    monkeypatch.setattr(app_module, 'get_schema', lambda: fallback)
+    matches = FALLBACK_MAX_RESULTS + 20
+    create(client, [{'title': f'Invoice {n}'} for n in range(matches)] + [{'title': 'Keep me'}])
+
+    response = client.patch('/api/tasks/bulk', json={'filter': {'q': 'invoice'}, 'set': {'category': 'Work'}})
+    assert response.get_json() == {'updated': matches}
+    response = client.delete('/api/tasks/bulk', json={'filter': {'q': 'invoice', 'category': 'Work'}})
+    assert response.get_json() == {'deleted': matches}
+    assert [t['title'] for t in tasks_of(client)] == ['Keep me']
+
+
+def test_ids_are_chunked(monkeypatch):
+    """Test long id lists are split to stay under parameter limits"""
+    monkeypatch.setattr(bulk, 'ID_CHUNK_SIZE', 2)
+    assert list(bulk._chunks([1, 2, 3, 4, 5])) == [[1, 2], [3, 4], [5]]
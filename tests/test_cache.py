@@ -0,0 +1,197 @@
+import pytest
+import sys
+import os
+import re
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cache import MemoryCacheBackend, SQLiteCacheBackend, TaskListCache, create_backend, private_directory
+from config import Config
+from database import create_user, dispose_pool, init_database
+from task_queries import Task, TaskPage
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_backend(request, tmp_path):
+    """Factory for each backend; sqlite instances share one file like workers do"""
+    def make(**limits):
+        if request.param == 'memory':
+            return MemoryCacheBackend(**limits)
+        return SQLiteCacheBackend(str(tmp_path / 'cache.db'), **limits)
+    return make
+
+
+def test_hit_after_store(make_backend):
+    """Test a stored page is returned and counted as a hit"""
+    events = []
+    task_cache = TaskListCache(make_backend(), on_event=events.append)
+    value, token = task_cache.lookup('db#1', 'page')
+    assert value is None
+    task_cache.store('db#1', 'page', {'tasks': [1, 2]}, token)
+    value, _ = task_cache.lookup('db#1', 'page')
+    assert value == {'tasks': [1, 2]}
+    assert events == ['miss', 'hit']
+
+
+def test_invalidate_drops_only_that_scope(make_backend):
+    """Test invalidation forgets one user's pages and keeps the others"""
+    task_cache = TaskListCache(make_backend())
+    for scope in ('db#1', 'db#2'):
+        _, token = task_cache.lookup(scope, 'page')
+        task_cache.store(scope, 'page', scope, token)
+    task_cache.invalidate('db#1')
+    assert task_cache.lookup('db#1', 'page')[0] is None
+    assert task_cache.lookup('db#2', 'page')[0] == 'db#2'
+
+
+def test_store_after_concurrent_write_is_ignored(make_backend):
+    """Test a page read before a write is not cached after the write"""
+    task_cache = TaskListCache(make_backend())
+    _, token = task_cache.lookup('db#1', 'page')
+    task_cache.invalidate('db#1')  # another request commits meanwhile
+    task_cache.store('db#1', 'page', 'stale', token)
+    assert task_cache.lookup('db#1', 'page')[0] is None
+
+
+def test_ttl_expires_entries(make_backend):
+    """Test entries are not served after their TTL"""
+    task_cache = TaskListCache(make_backend(ttl=0.05))
+    _, token = task_cache.lookup('db#1', 'page')
+    task_cache.store('db#1', 'page', 'value', token)
+    time.sleep(0.1)
+    assert task_cache.lookup('db#1', 'page')[0] is None
+
+
+def test_lru_eviction_by_entries(make_backend):
+    """Test the least recently used page is evicted at the entry limit"""
+    task_cache = TaskListCache(make_backend(max_entries=2))
+    for key in ('a', 'b'):
+        _, token = task_cache.lookup('db#1', key)
+        task_cache.store('db#1', key, key, token)
+        time.sleep(0.01)
+    task_cache.lookup('db#1', 'a')  # touch a so b is the oldest
+    time.sleep(0.01)
+    _, token = task_cache.lookup('db#1', 'c')
+    task_cache.store('db#1', 'c', 'c', token)
+    assert task_cache.lookup('db#1', 'a')[0] == 'a'
+    assert task_cache.lookup('db#1', 'b')[0] is None
+    assert task_cache.stats['eviction'] == 1
+
+
+def test_memory_ceiling(make_backend):
+    """Test cached bytes stay under the ceiling and oversized pages are skipped"""
+    backend = make_backend(max_bytes=2000)
+    task_cache = TaskListCache(backend)
+    for key in range(5):
+        _, token = task_cache.lookup('db#1', str(key))
+        task_cache.store('db#1', str(key), 'x' * 600, token)
+    entries, size = backend.size()
+    assert size <= 2000 and entries < 5
+    _, token = task_cache.lookup('db#1', 'huge')
+    task_cache.store('db#1', 'huge', 'x' * 5000, token)
+    assert task_cache.lookup('db#1', 'huge')[0] is None
+
+
+def test_sqlite_backend_is_shared(tmp_path):
+    """Test two workers see each other's entries and invalidations"""
+    path = str(tmp_path / 'cache.db')
+    worker_a = TaskListCache(SQLiteCacheBackend(path))
+    worker_b = TaskListCache(SQLiteCacheBackend(path))
+    _, token = worker_a.lookup('db#1', 'page')
+    worker_a.store('db#1', 'page', 'shared', token)
+    assert worker_b.lookup('db#1', 'page')[0] == 'shared'
+    worker_b.invalidate('db#1')
+    assert worker_a.lookup('db#1', 'page')[0] is None
+
+
+def test_backend_errors_are_misses(tmp_path):
+    """Test an unusable cache falls back to the database"""
+    task_cache = TaskListCache(SQLiteCacheBackend(str(tmp_path / 'missing' / 'cache.db')))
+    assert task_cache.lookup('db#1', 'page') == (None, None)
+    task_cache.invalidate('db#1')
+    assert task_cache.stats['error'] == 2
+
+
+def test_pages_are_stored_as_json(tmp_path):
+    """Test task pages round-trip through JSON and a planted pickle is never loaded"""
+    backend = SQLiteCacheBackend(str(tmp_path / 'cache.db'))
+    task_cache = TaskListCache(backend, encode=TaskPage.to_data, decode=TaskPage.from_data)
+    task = Task(7, 'Report', '', 0, datetime(2025, 1, 2, 3, 4, 5), None, 'High', 'Work', 3, 1, 0)
+    _, token = task_cache.lookup('db#1', 'page')
+    task_cache.store('db#1', 'page', TaskPage([task], next_cursor='abc'), token)
+    page, _ = task_cache.lookup('db#1', 'page')
+    assert page.next_cursor == 'abc' and page.prev_cursor is None
+    assert page.tasks[0].created_at == datetime(2025, 1, 2, 3, 4, 5) and page.tasks[0].is_overdue is True
+
+    backend.set('db#1', 'evil', token, b'cos\nsystem\n(S"true"\ntR.')
+    assert task_cache.lookup('db#1', 'evil') == (None, token)
+    assert task_cache.stats['error'] == 1
+
+
+def test_default_cache_directory_must_be_private(tmp_path, monkeypatch):
+    """Test the default cache file lives in a 0700 directory and a planted one is refused"""
+    monkeypatch.setattr('tempfile.gettempdir', lambda: str(tmp_path))
+    backend = create_backend('sqlite', 60, 100, 1024)
+    assert isinstance(backend, SQLiteCacheBackend)
+    directory = os.path.dirname(backend.path)
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+    os.chmod(directory, 0o777)
+    with pytest.raises(OSError):
+        private_directory(directory)
+    assert isinstance(create_backend('sqlite', 60, 100, 1024), MemoryCacheBackend)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Logged-in test client on a fresh database with a fresh cache"""
+    import app as app_module
+
+    fresh = TaskListCache(SQLiteCacheBackend(str(tmp_path / 'cache.db')), on_event=app_module.task_cache.on_event,
+                          encode=TaskPage.to_data, decode=TaskPage.from_data)
+    monkeypatch.setattr(app_module, 'task_cache', fresh)
+    original_db = Config.SQLITE_DATABASE
+    Config.SQLITE_DATABASE = str(tmp_path / 'tasks.db')
+    dispose_pool()
+    init_database()
+    user_id = create_user('cacher', 'cacher@example.com', 'secret123')
+    app_module.app.config['TESTING'] = True
+    with app_module.app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['username'] = 'cacher'
+        yield client, app_module.task_cache
+    dispose_pool()
+    Config.SQLITE_DATABASE = original_db
+
+
+def test_task_list_served_from_cache(client):
+    """Test repeated renders hit the cache and every mutation invalidates it"""
+    client, task_cache = client
+    client.post('/task/add', data={'title': 'Cached task'})
+    assert b'Cached task' in client.get('/tasks').data
+    assert b'Cached task' in client.get('/tasks').data
+    assert task_cache.stats['hit'] == 1
+
+    task_id = int(re.search(r'/task/(\d+)/edit', client.get('/tasks').data.decode()).group(1))
+    client.post(f'/task/{task_id}/edit', data={'title': 'Renamed task'})
+    assert b'Renamed task' in client.get('/tasks').data
+
+    client.post(f'/task/{task_id}/toggle')
+    assert b'Renamed task' not in client.get('/tasks?status=pending').data
+
+    client.post(f'/task/{task_id}/delete')
+    assert b'Renamed task' not in client.get('/tasks').data
+    assert task_cache.stats['invalidation'] == 4
+
+
+def test_metrics_export_cache_counters(client):
+    """Test cache counters appear on /metrics"""
+    client, _ = client
+    client.get('/tasks')
+    client.get('/tasks')
+    body = client.get('/metrics').data
+    assert b'task_cache_events_total{event="hit"}' in body
+    assert b'task_cache_entries' in body
@@ -0,0 +1,160 @@
+import pytest
+import sys
+import os
+import sqlite3
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from archive import ArchiveJob
+from config import Config
+from database import create_user, dispose_pool, init_database
+from task_queries import encode_change_cursor
+from task_repository import get_task_repository
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Fresh migrated database"""
+    original = Config.SQLITE_DATABASE, Config.SQLITE_SHARDS
+    Config.SQLITE_DATABASE = str(tmp_path / 'tasks.db')
+    Config.SQLITE_SHARDS = 0
+    dispose_pool()
+    init_database()
+    yield Config.SQLITE_DATABASE
+    dispose_pool()
+    Config.SQLITE_DATABASE, Config.SQLITE_SHARDS = original
+
+
+@pytest.fixture
+def client(db_path):
+    """Test client logged in as a fresh user; the user id is client.user_id"""
+    from app import app
+    app.config['TESTING'] = True
+    test_client = app.test_client()
+    test_client.user_id = create_user('alice', 'alice@example.com', 'secret123')
+    with test_client.session_transaction() as sess:
+        sess['user_id'] = test_client.user_id
+        sess['username'] = 'alice'
+    return test_client
+
+
+def sync(client, cursor=None, limit=None):
+    """Follow the feed from cursor until has_more is false; returns (changes, cursor)"""
+    changes = []
+    while True:
+        args = {}
+        if cursor:
+            args['since'] = cursor
+        if limit:
+            args['limit'] = limit
+        response = client.get('/api/tasks/changes', query_string=args)
+        assert response.status_code == 200
+        body = response.get_json()
+        changes.extend(body['changes'])
+        cursor = body['cursor']
+        if not body['has_more']:
+            return changes, cursor
+
+
+def test_feed_returns_only_changes_and_tombstones(client):
+    """Test every mutation route shows up in the feed, and nothing else does"""
+    repository = get_task_repository()
+    user_id = client.user_id
+    ids = [repository.add(user_id, f'Task {n}', '', None, 'Medium', 'General') for n in range(4)]
+    repository.delete(user_id, repository.add(user_id, 'Gone before sync', '', None, 'Low', 'General'))
+
+    first, cursor = sync(client)
+    assert [change['id'] for change in first] == ids
+    assert all(change['deleted'] is False and change['updated_at'] for change in first)
+    assert first[0]['completed'] is False and 'change_version' not in first[0]
+    # Nothing new: an empty page and a cursor that still works
+    again, cursor = sync(client, cursor)
+    assert again == []
+
+    client.post(f'/task/{ids[0]}/toggle')
+    client.post(f'/task/{ids[1]}/edit', data={'title': 'Renamed', 'priority': 'High', 'category': 'Work'})
+    client.post(f'/task/{ids[2]}/delete')
+    client.post('/api/tasks/bulk', json={'tasks': [{'title': 'Bulk one'}, {'title': 'Bulk two'}]})
+    changes, cursor = sync(client, cursor)
+
+    by_id = {change['id']: change for change in changes}
+    assert ids[3] not in by_id
+    assert by_id[ids[0]]['completed'] is True
+    assert by_id[ids[1]]['title'] == 'Renamed' and by_id[ids[1]]['category'] == 'Work'
+    assert by_id[ids[2]] == {'id': ids[2], 'deleted': True, 'deleted_at': by_id[ids[2]]['deleted_at']}
+    assert sorted(change['title'] for change in changes if change.get('title', '').startswith('Bulk')) == \
+        ['Bulk one', 'Bulk two']
+    assert len(changes) == 5
+
+    client.delete('/api/tasks/bulk', json={'filter': {'q': 'Bulk'}})
+    changes, cursor = sync(client, cursor)
+    assert len(changes) == 2 and all(change['deleted'] for change in changes)
+    assert sync(client, cursor)[0] == []
+
+
+def test_small_pages_split_a_bulk_change(client):
+    """Test a bulk update larger than the page size is read in full, page by page"""
+    created = client.post('/api/tasks/bulk', json={'tasks': [{'title': f'Task {n}'} for n in range(7)]})
+    assert created.get_json() == {'created': 7}
+    first, cursor = sync(client, limit=3)
+    assert len(first) == 7
+
+    client.patch('/api/tasks/bulk', json={'filter': {}, 'set': {'priority': 'High'}})
+    pages = []
+    while True:
+        body = client.get('/api/tasks/changes', query_string={'since': cursor, 'limit': 3}).get_json()
+        pages.append(len(body['changes']))
+        cursor = body['cursor']
+        if not body['has_more']:
+            break
+    assert sum(pages) == 7 and max(pages) == 3
+    assert sync(client, cursor)[0] == []
+
+
+def test_archive_leaves_tombstone_and_restore_brings_task_back(client, db_path):
+    """Test archived tasks leave the feed like deletes, restores come back, and old tombstones are purged"""
+    repository = get_task_repository()
+    user_id = client.user_id
+    task_id = repository.add(user_id, 'Old report', '', None, 'High', 'Work')
+    repository.toggle(user_id, task_id)
+    _, cursor = sync(client)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("UPDATE tasks SET completed_at = datetime('now', '-90 days')")
+        conn.commit()
+    finally:
+        conn.close()
+    assert ArchiveJob(max_age_days=30, pause=0).run_once() == 1
+    changes, cursor = sync(client, cursor)
+    assert [(change['id'], change['deleted']) for change in changes] == [(task_id, True)]
+
+    assert repository.restore(user_id, task_id)
+    changes, cursor = sync(client, cursor)
+    assert [(change['id'], change['deleted']) for change in changes] == [(task_id, False)]
+
+    repository.delete(user_id, task_id)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("UPDATE task_tombstones SET deleted_at = datetime('now', '-40 days')")
+        conn.commit()
+    finally:
+        conn.close()
+    ArchiveJob(max_age_days=0, tombstone_days=30, pause=0).run_once()
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM task_tombstones").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+def test_bad_and_expired_cursors(client):
+    """Test malformed cursors get 400 and cursors older than the tombstones get 410"""
+    assert client.get('/api/tasks/changes?since=bogus').status_code == 400
+    stale = encode_change_cursor((0, None), time.time() - (Config.TASK_TOMBSTONE_DAYS + 1) * 86400)
+    assert client.get('/api/tasks/changes', query_string={'since': stale}).status_code == 410
+    fresh = encode_change_cursor((0, None), time.time())
+    assert client.get('/api/tasks/changes', query_string={'since': fresh}).get_json()['changes'] == []
+    anonymous = client.application.test_client()
+    assert anonymous.get('/api/tasks/changes').status_code == 401
@@ -42,6 +42,8 @@ def test_config_environment_defaults():
     config_obj = Config()
     # Should have default values when env vars not set
     assert config_obj.SQLITE_DATABASE == 'tasks.db'
+    # Archiving moves users' tasks out of their list, so it is opt-in
+    assert config_obj.ARCHIVE_AFTER_DAYS == 0
     assert config_obj.ENVIRONMENT in ['development', 'production']
 
 
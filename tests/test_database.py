@@ -164,3 +164,172 @@ def test_config_db_type():
     """Test Config DB_TYPE configuration"""
     config = Config()
     assert config.DB_TYPE in ['sqlite', 'azure_sql']
+
+
+def test_pool_reuses_released_connection(cleanup_test_db):
+    """Test that closing a pooled connection returns it for reuse"""
+    from database import dispose_pool
+
+    dispose_pool()
+    conn = get_db_connection()
+    conn.close()
+    assert get_db_connection() is conn
+    conn.close()
+    dispose_pool()
+
+
+def test_pool_is_bounded(cleanup_test_db):
+    """Test that checkout blocks and times out once the pool is exhausted"""
+    from database import ConnectionPool, PoolTimeout
+
+    pool = ConnectionPool(get_sqlite_connection, max_size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    conn.close()
+    assert pool.acquire() is conn
+    pool.release(conn)
+    pool.dispose()
+
+
+def test_pool_recycles_old_connections(cleanup_test_db):
+    """Test that connections past their max lifetime are replaced"""
+    from database import ConnectionPool
+
+    pool = ConnectionPool(get_sqlite_connection, max_size=2, max_lifetime=1)
+    conn = pool.acquire()
+    conn._pool_created -= 5
+    conn.close()
+    fresh = pool.acquire()
+    assert fresh is not conn
+    assert pool.size == 1
+    fresh.close()
+    pool.dispose()
+
+
+def test_pool_discards_connection_to_replaced_file(cleanup_test_db):
+    """Test that the SQLite health check drops connections to a recreated file"""
+    from database import dispose_pool
+
+    dispose_pool()
+    conn = get_db_connection()
+    conn.close()
+    # Pretend the file on disk was deleted and recreated since the connection opened
+    conn._file_id = (-1, -1)
+    replacement = get_db_connection()
+    assert replacement is not conn
+    replacement.close()
+    dispose_pool()
+
+
+def test_pool_forgets_connections_after_fork(cleanup_test_db, monkeypatch):
+    """Test that a forked child never reuses its parent's connections"""
+    import database
+    from database import ConnectionPool
+
+    pool = ConnectionPool(get_sqlite_connection, max_size=2)
+    conn = pool.acquire()
+    conn.close()
+
+    parent_pid = os.getpid()
+    monkeypatch.setattr(database.os, 'getpid', lambda: parent_pid + 1)
+    child_conn = pool.acquire()
+    assert child_conn is not conn
+    assert pool.size == 1
+    child_conn.close()
+
+
+def test_request_shares_one_connection(cleanup_test_db):
+    """Test that a Flask request reuses one connection and releases it on teardown"""
+    from flask import Flask
+    from database import init_app, dispose_pool, get_pool
+
+    dispose_pool()
+    flask_app = Flask(__name__)
+    init_app(flask_app)
+
+    with flask_app.app_context():
+        first = get_db_connection()
+        first.close()
+        assert get_db_connection() is first
+        assert get_pool().idle == 0
+
+    assert get_pool().idle == 1
+    dispose_pool()
+
+
+def test_schema_probe_runs_once(cleanup_test_db, monkeypatch):
+    """Test that schema capabilities are probed once and then cached"""
+    import database
+    from database import get_schema
+    from migrations import LATEST_VERSION
+
+    init_database()
+    calls = []
+    original = database.probe_schema
+    monkeypatch.setattr(database, 'probe_schema', lambda: calls.append(1) or original())
+
+    info = get_schema()
+    assert get_schema() is info
+    assert len(calls) == 1
+    assert info.has_user_id
+    assert info.version == LATEST_VERSION
+
+
+def test_schema_probe_adds_columns_to_legacy_table(cleanup_test_db):
+    """Test that an old tasks table gets new columns but no user-scoped indexes"""
+    from database import dispose_pool, get_schema
+
+    conn = sqlite3.connect(cleanup_test_db)
+    conn.execute("CREATE TABLE tasks (id INTEGER PRIMARY KEY, title TEXT, completed INTEGER)")
+    conn.close()
+    dispose_pool()
+
+    info = get_schema()
+    assert not info.has_user_id
+    assert info.version == 1
+    assert {'due_date', 'priority', 'category'} <= info.task_columns
+    dispose_pool()
+
+
+def test_threaded_requests_are_isolated(tmp_path, monkeypatch):
+    """Test concurrent request threads never share a connection or lose writes"""
+    import threading
+    from app import app
+    from database import create_user, dispose_pool, get_pool
+
+    monkeypatch.setattr(Config, 'SQLITE_DATABASE', str(tmp_path / 'threads.db'))
+    monkeypatch.setattr(Config, 'DB_POOL_SIZE', 2)  # fewer connections than threads
+    dispose_pool()
+    init_database()
+    user_id = create_user('threads', 'threads@example.com', 'secret123')
+    app.config['TESTING'] = True
+    errors = []
+
+    def worker(n):
+        try:
+            with app.test_client() as client:
+                with client.session_transaction() as sess:
+                    sess['user_id'] = user_id
+                    sess['username'] = 'threads'
+                for i in range(10):
+                    client.post('/task/add', data={'title': f'Thread {n} task {i}'})
+                    response = client.get('/api/tasks?fields=id')
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert get_pool().size <= 2
+    conn = sqlite3.connect(Config.SQLITE_DATABASE)
+    assert conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] == 80
+    assert conn.execute("SELECT task_version FROM users").fetchone()[0] == 80
+    conn.close()
+    dispose_pool()
@@ -0,0 +1,114 @@
+import pytest
+import sys
+import os
+import sqlite3
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config
+from database import create_user, dispose_pool, get_sqlite_connection, init_database
+from group_commit import WriteCoalescer
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Fresh migrated database file"""
+    original_db = Config.SQLITE_DATABASE
+    Config.SQLITE_DATABASE = str(tmp_path / 'tasks.db')
+    dispose_pool()
+    init_database()
+    yield Config.SQLITE_DATABASE
+    dispose_pool()
+    Config.SQLITE_DATABASE = original_db
+
+
+def submit_all(coalescer, works):
+    """Submit every work from its own thread at once; return results or exceptions in order"""
+    outcomes = [None] * len(works)
+    start = threading.Barrier(len(works))
+
+    def run(index):
+        start.wait()
+        try:
+            outcomes[index] = coalescer.submit(works[index])
+        except Exception as e:
+            outcomes[index] = e
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(len(works))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return outcomes
+
+
+@pytest.fixture
+def user_id(db_path):
+    return create_user('grouped', 'grouped@example.com', 'secret123')
+
+
+def insert(title, user_id):
+    def work(cursor):
+        cursor.execute("INSERT INTO tasks (title, user_id) VALUES (?, ?)", (title, user_id))
+        return cursor.lastrowid
+    return work
+
+
+def titles(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return sorted(row[0] for row in conn.execute("SELECT title FROM tasks"))
+    finally:
+        conn.close()
+
+
+def test_concurrent_writes_share_commits(db_path, user_id):
+    """Test writes submitted together are committed in fewer transactions"""
+    coalescer = WriteCoalescer(get_sqlite_connection, window=0.05)
+    outcomes = submit_all(coalescer, [insert(f'Task {i:02}', user_id) for i in range(20)])
+
+    assert len(set(outcomes)) == 20 and all(isinstance(task_id, int) for task_id in outcomes)
+    assert coalescer.writes == 20
+    assert coalescer.batches < 20
+    assert titles(db_path) == [f'Task {i:02}' for i in range(20)]
+
+
+def test_failed_write_only_fails_its_caller(db_path, user_id):
+    """Test a failing write is rolled back alone and the rest of its batch commits"""
+    def bad(cursor):
+        cursor.execute("INSERT INTO tasks (title, user_id) VALUES (?, ?)", ('Half done', user_id))
+        raise ValueError('invalid task')
+
+    coalescer = WriteCoalescer(get_sqlite_connection, window=0.2, max_batch=3)
+    outcomes = submit_all(coalescer, [insert('First', user_id), bad, insert('Last', user_id)])
+
+    assert coalescer.batches == 1
+    assert isinstance(outcomes[1], ValueError)
+    assert isinstance(outcomes[0], int) and isinstance(outcomes[2], int)
+    assert titles(db_path) == ['First', 'Last']
+
+
+def test_routes_write_through_coalescer(db_path, user_id, monkeypatch):
+    """Test adding, toggling and deleting a task with WRITE_COALESCE on"""
+    from app import app
+    import database
+
+    monkeypatch.setattr(Config, 'WRITE_COALESCE', True)
+    monkeypatch.setattr(database, '_coalescer', None)
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['username'] = 'grouped'
+
+        client.post('/task/add', data={'title': 'Grouped task'})
+        task = client.get('/api/tasks').get_json()['tasks'][0]
+        assert task['title'] == 'Grouped task'
+        client.post(f"/task/{task['id']}/toggle")
+        assert client.get('/api/tasks').get_json()['tasks'][0]['completed']
+        client.post(f"/task/{task['id']}/delete")
+        assert client.get('/api/tasks').get_json()['tasks'] == []
+
+    coalescer = database.get_write_coalescer()
+    assert coalescer.writes == 3
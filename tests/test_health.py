@@ -0,0 +1,94 @@
+import pytest
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database
+from config import Config
+from database import dispose_pool, get_pool, init_database
+from health import TableStats
+
+
+@pytest.fixture
+def client(tmp_path):
+    """Test client on a fresh, migrated database"""
+    from app import app
+
+    original_db = Config.SQLITE_DATABASE
+    Config.SQLITE_DATABASE = str(tmp_path / 'tasks.db')
+    dispose_pool()
+    init_database()
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+    dispose_pool()
+    Config.SQLITE_DATABASE = original_db
+
+
+def test_live_does_no_io(client, monkeypatch):
+    """Test the liveness probe answers without touching the database"""
+    def fail():
+        raise AssertionError("liveness probe used the database")
+    monkeypatch.setattr(database, 'get_pool', fail)
+    response = client.get('/health/live')
+    assert response.status_code == 200
+    assert response.get_json() == {'status': 'alive'}
+
+
+def test_ready_pings_pooled_connection(client):
+    """Test readiness succeeds with a free connection and fails fast without one"""
+    response = client.get('/health/ready')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'ready'
+
+    from app import app
+    pool = get_pool()
+    held = [pool.acquire() for _ in range(pool.max_size)]
+    app.config['HEALTH_READY_TIMEOUT'] = 0.05
+    try:
+        start = time.monotonic()
+        response = client.get('/health/ready')
+        assert time.monotonic() - start < 2
+        assert response.status_code == 503
+        assert response.get_json()['status'] == 'unavailable'
+    finally:
+        app.config['HEALTH_READY_TIMEOUT'] = Config.HEALTH_READY_TIMEOUT
+        for conn in held:
+            pool.release(conn)
+
+
+def test_stats_serve_cached_counts(client):
+    """Test /health/stats reports counts of the current database"""
+    response = client.get('/health/stats')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['tables'] == {'tasks': 0, 'users': 0}
+    assert data['source'] == 'count'
+    assert 'refreshed_at' in data and data['age_seconds'] >= 0
+
+
+def test_table_stats_refresh_in_background():
+    """Test counts are fetched once, then refreshed by the worker's thread"""
+    calls = []
+
+    def fetch():
+        calls.append(time.monotonic())
+        return {'tasks': len(calls)}, 'test'
+
+    stats = TableStats(fetch, interval=0.05)
+    assert stats.get()['tables'] == {'tasks': 1}
+    deadline = time.monotonic() + 5
+    while len(calls) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert stats.get()['tables']['tasks'] >= 3
+
+
+def test_table_stats_refetch_for_other_database():
+    """Test counts taken from another database are not served"""
+    database_key = ['a']
+    stats = TableStats(lambda: ({'tasks': database_key[0]}, 'test'), interval=3600, key=lambda: database_key[0])
+    assert stats.get()['tables'] == {'tasks': 'a'}
+    database_key[0] = 'b'
+    assert stats.get()['tables'] == {'tasks': 'b'}
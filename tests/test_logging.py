@@ -0,0 +1,118 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import logging_config
+from logging_config import (DroppingQueueHandler, JSONFormatter, RateLimitFilter, SamplingFilter,
+                            configure_logging, parse_sampling)
+
+
+def make_record(msg, *args, name='app', level=logging.INFO, exc_info=None):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, exc_info)
+
+
+@pytest.fixture
+def settings(tmp_path):
+    """LOG_* settings writing to a temporary file"""
+    return SimpleNamespace(
+        LOG_LEVEL='INFO', LOG_FORMAT='text', LOG_FILE=str(tmp_path / 'app.log'),
+        LOG_QUEUE_SIZE=1000, LOG_RATE_LIMIT=0, LOG_RATE_WINDOW=60, LOG_SAMPLING='',
+    )
+
+
+@pytest.fixture
+def restore_logging():
+    """Put the root logger back as the app configured it"""
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    logging_config.stop_logging()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def test_records_are_written_by_listener_and_survive_external_rotation(settings, tmp_path, restore_logging):
+    """Test records reach the file through the queue, and the file is reopened after logrotate moves it"""
+    handler = configure_logging(settings)
+    assert logging.getLogger().handlers == [handler]
+    for i in range(10):
+        logging.getLogger('app').info("message number %d", i)
+    # Like logrotate: move the file away while the app keeps logging
+    deadline = time.time() + 5
+    log_file = tmp_path / 'app.log'
+    while not (log_file.exists() and 'message number 9' in log_file.read_text()) and time.time() < deadline:
+        time.sleep(0.01)
+    os.rename(tmp_path / 'app.log', tmp_path / 'app.log.1')
+    logging.getLogger('app').info("after rotation")
+    logging_config.stop_logging()
+
+    assert sorted(os.listdir(tmp_path)) == ['app.log', 'app.log.1']
+    assert 'app - INFO - message number 9' in (tmp_path / 'app.log.1').read_text()
+    assert 'app - INFO - after rotation' in (tmp_path / 'app.log').read_text()
+    assert 'number' not in (tmp_path / 'app.log').read_text()
+
+
+def test_full_queue_drops_instead_of_blocking():
+    """Test a full queue drops records and counts them"""
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+    start = time.perf_counter()
+    for i in range(5):
+        handler.handle(make_record("record %d", i))
+    assert time.perf_counter() - start < 1
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+    # Arguments are merged before the record is queued
+    assert handler.queue.get_nowait().msg == 'record 0'
+
+
+def test_rate_limit_reports_suppressed_messages(monkeypatch):
+    """Test hot INFO messages are limited per template and warnings always pass"""
+    clock = [0.0]
+    monkeypatch.setattr(logging_config.time, 'monotonic', lambda: clock[0])
+    limiter = RateLimitFilter(limit=2, window=10)
+
+    passed = [limiter.filter(make_record("Rendering %d tasks", i)) for i in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert limiter.filter(make_record("Other message"))
+    assert limiter.filter(make_record("Rendering %d tasks", 9, level=logging.WARNING))
+
+    clock[0] = 11
+    record = make_record("Rendering %d tasks", 7)
+    assert limiter.filter(record)
+    assert record.getMessage() == 'Rendering 7 tasks (3 similar messages suppressed)'
+
+
+def test_sampling_applies_to_logger_and_children(monkeypatch):
+    """Test sampling rates match a logger and its children, not other loggers"""
+    assert parse_sampling('app=0.1, cache=0.5') == {'app': 0.1, 'cache': 0.5}
+    sampler = SamplingFilter({'app': 0.0})
+    assert not sampler.filter(make_record("hot", name='app'))
+    assert not sampler.filter(make_record("hot", name='app.views'))
+    assert sampler.filter(make_record("hot", name='application'))
+    assert sampler.filter(make_record("kept", name='app', level=logging.ERROR))
+
+
+def test_json_format_keeps_exception_through_queue():
+    """Test JSON lines carry the message and the traceback of a queued record"""
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record("failed for %s", 'alice', level=logging.ERROR, exc_info=sys.exc_info())
+    queued = DroppingQueueHandler(queue.Queue()).prepare(record)
+    entry = json.loads(JSONFormatter().format(queued))
+    assert entry['message'] == 'failed for alice'
+    assert entry['level'] == 'ERROR'
+    assert entry['logger'] == 'app'
+    assert 'ValueError: boom' in entry['exception']
@@ -0,0 +1,150 @@
+import pytest
+import sys
+import os
+import sqlite3
+import shutil
+import stat
+import subprocess
+import importlib.util
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+prometheus_client = pytest.importorskip('prometheus_client')
+from prometheus_client import REGISTRY
+
+from config import Config
+from database import dispose_pool, init_database
+from metrics import multiprocess_registry, run_query
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture
+def client(tmp_path):
+    """Test client logged in as a new user on a fresh database"""
+    from app import app
+
+    original_db = Config.SQLITE_DATABASE
+    Config.SQLITE_DATABASE = str(tmp_path / 'tasks.db')
+    dispose_pool()
+    init_database()
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        client.post('/signup', data={'username': 'mia', 'email': 'mia@example.com',
+                                     'password': 'secret123', 'confirm_password': 'secret123'})
+        yield client
+    dispose_pool()
+    Config.SQLITE_DATABASE = original_db
+
+
+def test_named_queries_are_timed(client):
+    """Test each statement is recorded under its name with rows and time"""
+    client.post('/task/add', data={'title': 'Write report'})
+    before = sample('db_query_duration_seconds_count', query='toggle_task')
+    rows_before = sample('db_query_rows_sum', query='toggle_task')
+    client.post('/task/1/toggle')
+    assert sample('db_query_duration_seconds_count', query='toggle_task') == before + 1
+    assert sample('db_query_rows_sum', query='toggle_task') == rows_before + 1
+    assert sample('db_query_duration_seconds_count', query='commit') > 0
+
+
+def test_requests_count_round_trips_and_phases(client):
+    """Test a request records its database round-trips and db/render/python split"""
+    labels = {'endpoint': 'home'}
+    count_before = sample('http_request_db_queries_count', **labels)
+    queries_before = sample('http_request_db_queries_sum', **labels)
+    assert client.get('/tasks?per_page=5').status_code == 200
+    assert sample('http_request_db_queries_count', **labels) == count_before + 1
+    assert sample('http_request_db_queries_sum', **labels) > queries_before
+    for phase in ('db', 'render', 'python'):
+        assert sample('http_request_phase_seconds_count', phase=phase, **labels) > 0
+    assert sample('http_request_phase_seconds_sum', phase='render', **labels) > 0
+
+
+def test_failed_query_is_counted():
+    """Test a failing statement counts as an error and still raises"""
+    conn = sqlite3.connect(':memory:')
+    before = sample('db_query_errors_total', query='broken')
+    with pytest.raises(sqlite3.OperationalError):
+        run_query(conn.cursor(), 'broken', 'SELECT * FROM missing')
+    assert sample('db_query_errors_total', query='broken') == before + 1
+    assert run_query(conn.cursor(), 'one', 'SELECT 1', fetch='one') == (1,)
+    conn.close()
+
+
+def test_pool_gauges_are_published(client):
+    """Test /metrics reports opened and in-use pool connections"""
+    assert sample('db_connections_opened_total') > 0
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'db_pool_connections{state="open"}' in body
+    # The /metrics request itself holds no connection while reporting
+    assert sample('db_pool_connections', state='in_use') == 0
+
+
+def test_worker_metrics_are_merged(tmp_path):
+    """Test multiprocess mode sums every worker's samples and drops dead workers' gauges"""
+    from prometheus_client import multiprocess
+
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    code = "import metrics; metrics.record_query('fetch_tasks', 0.002, 5); metrics.set_pool_connections(2, 1)"
+    workers = [subprocess.Popen([sys.executable, '-c', code], env=env,
+                                cwd=os.path.join(os.path.dirname(__file__), '..')) for _ in range(2)]
+    for worker in workers:
+        assert worker.wait(timeout=60) == 0
+
+    registry = multiprocess_registry(str(tmp_path))
+    assert registry.get_sample_value('db_query_duration_seconds_count', {'query': 'fetch_tasks'}) == 2
+    assert registry.get_sample_value('db_query_rows_sum', {'query': 'fetch_tasks'}) == 10
+    assert registry.get_sample_value('db_pool_connections', {'state': 'open'}) == 4
+
+    multiprocess.mark_process_dead(workers[0].pid, str(tmp_path))
+    registry = multiprocess_registry(str(tmp_path))
+    assert registry.get_sample_value('db_pool_connections', {'state': 'open'}) == 2
+    # Counters of recycled workers keep counting towards the total
+    assert registry.get_sample_value('db_query_duration_seconds_count', {'query': 'fetch_tasks'}) == 2
+
+
+def load_gunicorn_config(monkeypatch, metrics_dir):
+    """Import gunicorn_config.py afresh without leaking its environment defaults"""
+    for name in ('DB_POOL_SIZE', 'PASSWORD_HASH_MAX_PENDING'):
+        monkeypatch.setenv(name, os.environ.get(name, '1'))
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', metrics_dir)
+    path = os.path.join(os.path.dirname(__file__), '..', 'gunicorn_config.py')
+    spec = importlib.util.spec_from_file_location('gunicorn_config_under_test', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_default_metrics_directory_is_private_and_emptied(monkeypatch):
+    """Test the default metrics directory is a fresh 0700 mkdtemp and stale files are cleared on start"""
+    gunicorn_config = load_gunicorn_config(monkeypatch, '')
+    metrics_dir = gunicorn_config.metrics_dir
+    try:
+        assert os.environ['PROMETHEUS_MULTIPROC_DIR'] == metrics_dir
+        assert os.path.basename(metrics_dir).startswith('taskmanager-prometheus-')
+        assert stat.S_IMODE(os.lstat(metrics_dir).st_mode) == 0o700
+        with open(os.path.join(metrics_dir, 'counter_1.db'), 'w'):
+            pass
+        gunicorn_config.on_starting(None)
+        assert os.listdir(metrics_dir) == []
+    finally:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def test_shared_metrics_directory_is_refused(tmp_path, monkeypatch):
+    """Test gunicorn will not start on a metrics directory others can write or that is a symlink"""
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(OSError):
+        load_gunicorn_config(monkeypatch, str(shared)).on_starting(None)
+
+    private = tmp_path / 'private'
+    private.mkdir(mode=0o700)
+    link = tmp_path / 'link'
+    link.symlink_to(private)
+    with pytest.raises(OSError):
+        load_gunicorn_config(monkeypatch, str(link)).on_starting(None)
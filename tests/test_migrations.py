@@ -0,0 +1,93 @@
+import pytest
+import sys
+import os
+import sqlite3
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import migrations
+from migrations import LATEST_VERSION, applied_versions, check_index_usage, upgrade
+
+
+@pytest.fixture
+def conn():
+    """Fresh in-memory SQLite connection"""
+    conn = sqlite3.connect(':memory:')
+    yield conn
+    conn.close()
+
+
+def test_upgrade_applies_all_and_is_idempotent(conn):
+    """Test migrations run once and are recorded in schema_migrations"""
+    ran = upgrade(conn, 'sqlite')
+    assert [m.version for m, _ in ran] == [m.version for m in migrations.MIGRATIONS]
+    assert applied_versions(conn, 'sqlite') == {m.version for m in migrations.MIGRATIONS}
+    assert upgrade(conn, 'sqlite') == []
+
+
+def test_dry_run_changes_nothing(conn):
+    """Test dry runs list pending steps without touching the database"""
+    planned = upgrade(conn, 'sqlite', dry_run=True)
+    assert [m.version for m, _ in planned] == [m.version for m in migrations.MIGRATIONS]
+    assert any('idx_tasks_user_created' in step for _, steps in planned for step in steps)
+    assert applied_versions(conn, 'sqlite') == set()
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'tasks'").fetchone() is None
+
+
+def test_upgrade_to_target(conn):
+    """Test migrations can stop at a target version"""
+    upgrade(conn, 'sqlite', target=1)
+    assert applied_versions(conn, 'sqlite') == {1}
+    upgrade(conn, 'sqlite')
+    assert max(applied_versions(conn, 'sqlite')) == LATEST_VERSION
+
+
+def test_legacy_table_blocks_user_indexes(conn):
+    """Test index migration waits until tasks.user_id exists"""
+    conn.execute("CREATE TABLE tasks (id INTEGER PRIMARY KEY, title TEXT, completed INTEGER)")
+    conn.commit()
+    upgrade(conn, 'sqlite')
+    assert applied_versions(conn, 'sqlite') == {1}
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+    assert {'due_date', 'priority', 'category'} <= columns
+
+
+def test_failed_step_rolls_back(conn, monkeypatch):
+    """Test a failing migration leaves no partial changes behind"""
+    broken = migrations.Migration(99, 'broken', sqlite=["CREATE TABLE t99 (x)", "NOT SQL"], azure_sql=[])
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [broken])
+    with pytest.raises(sqlite3.Error):
+        upgrade(conn, 'sqlite')
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 't99'").fetchone() is None
+    assert applied_versions(conn, 'sqlite') == set()
+
+
+def test_hot_queries_use_task_indexes(conn):
+    """Test every hot task list query is served by one of the task indexes"""
+    upgrade(conn, 'sqlite')
+    for name, index, plan in check_index_usage(conn, 'sqlite'):
+        assert index is not None, f"{name} does not use a task index:\n{plan}"
+
+
+def test_canonical_dates_and_priority_rank(conn):
+    """Test migration 5 normalises stored dates and adds the generated priority rank"""
+    upgrade(conn, 'sqlite', target=4)
+    conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('a', 'a@x', 'h')")
+    conn.executemany(
+        "INSERT INTO tasks (title, priority, due_date, created_at, user_id) VALUES (?, ?, ?, ?, 1)",
+        [('iso', 'High', '2025-03-01T09:30', '2025-01-01T08:00:00.123456'),
+         ('canonical', 'Low', '2025-03-02 10:00:00', '2025-01-02 08:00:00'),
+         ('none', 'Medium', None, '2025-01-03 08:00:00'),
+         ('garbage', 'Medium', 'someday', '2025-01-04 08:00:00')]
+    )
+    conn.commit()
+    upgrade(conn, 'sqlite')
+    rows = conn.execute("SELECT title, due_date, created_at, priority_rank FROM tasks ORDER BY id").fetchall()
+    assert rows == [
+        ('iso', '2025-03-01 09:30:00', '2025-01-01 08:00:00', 3),
+        ('canonical', '2025-03-02 10:00:00', '2025-01-02 08:00:00', 1),
+        ('none', None, '2025-01-03 08:00:00', 2),
+        ('garbage', 'someday', '2025-01-04 08:00:00', 2),
+    ]
+    conn.execute("UPDATE tasks SET priority = 'High' WHERE title = 'none'")
+    assert conn.execute("SELECT priority_rank FROM tasks WHERE title = 'none'").fetchone()[0] == 3
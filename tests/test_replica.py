@@ -0,0 +1,153 @@
+import pytest
+import sys
+import os
+import sqlite3
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database
+from config import Config
+from database import (create_user, dispose_pool, get_read_connection, get_replica_monitor, init_database,
+                      sqlite_replica_path)
+from replica import ReplicaMonitor
+from task_queries import TaskFilters
+from task_repository import get_task_repository
+
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    """Fresh primary with READ_REPLICA on, copied once into its local replica"""
+    from app import app
+
+    original_db = Config.SQLITE_DATABASE
+    Config.SQLITE_DATABASE = str(tmp_path / 'tasks.db')
+    dispose_pool()
+    init_database()
+    monkeypatch.setattr(Config, 'READ_REPLICA', True)
+    monkeypatch.setitem(app.config, 'READ_REPLICA', True)
+    # Checks run when the test asks for them, and never copy on their own
+    monkeypatch.setattr(Config, 'REPLICA_CHECK_INTERVAL', 3600)
+    monkeypatch.setattr(Config, 'REPLICA_SYNC_INTERVAL', 3600)
+    monkeypatch.setattr(database, '_replica_monitor', None)
+    user_id = create_user('reader', 'reader@example.com', 'secret123')
+    monitor = get_replica_monitor()
+    monitor._thread_pid = os.getpid()  # no background checks
+    assert monitor.refresh()['healthy']
+    yield monitor, user_id
+    dispose_pool()
+    Config.SQLITE_DATABASE = original_db
+
+
+def add_on_primary(user_id, title):
+    conn = sqlite3.connect(Config.SQLITE_DATABASE)
+    try:
+        conn.execute("INSERT INTO tasks (title, user_id) VALUES (?, ?)", (title, user_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def titles_read(user_id):
+    conn = get_read_connection()
+    try:
+        return [row[0] for row in conn.execute("SELECT title FROM tasks WHERE user_id = ?", (user_id,))]
+    finally:
+        conn.close()
+
+
+def test_reads_go_to_the_replica(replica):
+    """Test reads see the replica's copy until the next sync, and nothing can be written there"""
+    monitor, user_id = replica
+    assert os.path.exists(sqlite_replica_path())
+    add_on_primary(user_id, 'Fresh')
+    assert titles_read(user_id) == []
+
+    database.sync_sqlite_replica(sqlite3.connect(Config.SQLITE_DATABASE))
+    assert titles_read(user_id) == ['Fresh']
+
+    conn = get_read_connection()
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM tasks")
+    finally:
+        conn.close()
+
+
+def test_lagging_or_broken_replica_falls_back(replica, monkeypatch):
+    """Test reads use the primary while the replica lags or fails"""
+    monitor, user_id = replica
+    add_on_primary(user_id, 'Fresh')
+
+    assert titles_read(user_id) == []
+
+    monkeypatch.setattr(monitor, 'check', lambda: Config.REPLICA_MAX_LAG + 1)
+    assert not monitor.refresh()['healthy']
+    assert titles_read(user_id) == ['Fresh']
+    assert get_task_repository().list_page(user_id, TaskFilters()).tasks[0].title == 'Fresh'
+
+    def unreachable():
+        raise sqlite3.OperationalError('unable to open database file')
+    monkeypatch.setattr(monitor, 'check', unreachable)
+    status = monitor.refresh()
+    assert not status['healthy'] and 'unable to open' in status['error']
+    assert titles_read(user_id) == ['Fresh']
+
+
+def test_session_reads_its_own_writes(replica):
+    """Test a session sees its new task at once while another session still reads the replica"""
+    from app import app
+
+    monitor, user_id = replica
+    app.config['TESTING'] = True
+    # Separate clients outside `with`, so no request context (and g) is kept between them
+    writer, other = app.test_client(), app.test_client()
+    for client in (writer, other):
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['username'] = 'reader'
+    writer.post('/task/add', data={'title': 'Mine'})
+    assert [task['title'] for task in writer.get('/api/tasks').get_json()['tasks']] == ['Mine']
+    assert other.get('/api/tasks').get_json()['tasks'] == []
+
+    status = writer.get('/health/stats').get_json()['replica']
+    assert status['healthy'] and status['lag_seconds'] == 0
+
+
+def test_cached_replica_page_never_serves_own_writes(replica, monkeypatch):
+    """Test a stale replica page cached after a write is not served to the writer's sticky reads"""
+    import app as app_module
+    from cache import MemoryCacheBackend, TaskListCache
+    from task_queries import TaskPage
+
+    monkeypatch.setattr(app_module, 'task_cache', TaskListCache(MemoryCacheBackend(), encode=TaskPage.to_data,
+                                                                decode=TaskPage.from_data))
+    monitor, user_id = replica
+    app_module.app.config['TESTING'] = True
+    writer, other = app_module.app.test_client(), app_module.app.test_client()
+    for client in (writer, other):
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['username'] = 'reader'
+    writer.post('/task/add', data={'title': 'Mine'})
+    # A request that is not sticky reads the lagging replica and caches that page
+    assert b'Mine' not in other.get('/tasks').data
+    assert b'Mine' not in other.get('/tasks').data
+    assert app_module.task_cache.stats['hit'] == 1
+    assert b'Mine' in writer.get('/tasks').data
+
+
+def test_monitor_reports_lag():
+    """Test the monitor marks the replica unusable beyond max_lag or after a failure"""
+    lags = iter([0.5, 0.5, 3.0])
+    monitor = ReplicaMonitor(lambda: next(lags), interval=3600, max_lag=2)
+    monitor._thread_pid = os.getpid()  # no background checks
+    assert monitor.refresh()['healthy']
+    assert monitor.usable()
+    monitor.mark_failed(RuntimeError('connection reset'))
+    assert not monitor.usable()
+    assert monitor.status()['error'] == 'connection reset'
+
+    assert monitor.refresh()['healthy']
+    status = monitor.refresh()
+    assert not status['healthy'] and status['lag_seconds'] == 3.0
+    assert not monitor.usable()
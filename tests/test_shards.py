@@ -0,0 +1,154 @@
+import pytest
+import sys
+import os
+import sqlite3
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import shard_db
+from config import Config
+from database import (count_table_rows, create_user, dispose_pool, get_db_connection, get_task_version, init_database,
+                      shard_database_path, shard_of)
+from shards import SHARD_BUCKETS, SHARD_ID_SPAN, ShardMap, bucket_of
+from task_queries import TaskFilters
+from task_repository import get_task_repository
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Fresh migrated main database, unsharded until a test sets SQLITE_SHARDS"""
+    original = Config.SQLITE_DATABASE, Config.SQLITE_SHARDS
+    Config.SQLITE_DATABASE = str(tmp_path / 'tasks.db')
+    Config.SQLITE_SHARDS = 0
+    dispose_pool()
+    init_database()
+    yield Config.SQLITE_DATABASE
+    dispose_pool()
+    Config.SQLITE_DATABASE, Config.SQLITE_SHARDS = original
+
+
+def use_shards(count):
+    Config.SQLITE_SHARDS = count
+    dispose_pool()
+
+
+def titles(user_id):
+    return sorted(task.title for task in get_task_repository().list_page(user_id, TaskFilters()).tasks)
+
+
+def stored_ids(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0] for row in conn.execute("SELECT id FROM tasks")}
+    finally:
+        conn.close()
+
+
+def test_rebalanced_map_moves_few_buckets():
+    """Test buckets are stable, and rebalancing evens the shards while moving only what it must"""
+    assert bucket_of(42) == 136
+    two = ShardMap.spread(2)
+    three = two.rebalanced(3)
+    per_shard = [three.shards.count(shard) for shard in range(3)]
+    assert sum(per_shard) == SHARD_BUCKETS and max(per_shard) - min(per_shard) <= 1
+    assert len(two.moves(three)) == per_shard[2]
+    assert three.rebalanced(3).shards == three.shards
+    assert set(three.rebalanced(1).shards) == {0}
+
+
+def test_tasks_live_on_their_owners_shard(db_path):
+    """Test task reads, writes and counters go to the owner's shard, and health counts add the shards up"""
+    use_shards(2)
+    users = [create_user(f'user{n}', f'user{n}@example.com', 'secret123') for n in range(8)]
+    assert {shard_of(user_id) for user_id in users} == {0, 1}
+    repository = get_task_repository()
+    for user_id in users:
+        task_id = repository.add(user_id, f'Task of {user_id}', '', None, 'High', 'Work')
+        shard = shard_of(user_id)
+        # Each shard allocates ids from its own range
+        assert (shard + 1) * SHARD_ID_SPAN < task_id < (shard + 2) * SHARD_ID_SPAN
+        assert task_id in stored_ids(shard_database_path(shard))
+        assert repository.toggle(user_id, task_id) == 1
+        assert titles(user_id) == [f'Task of {user_id}']
+        assert get_task_version(user_id) == 2
+    assert stored_ids(db_path) == set()
+    assert count_table_rows()[0] == {'tasks': 8, 'users': 8}
+
+
+def test_stats_load_the_shard_map_with_a_single_pooled_connection(db_path, monkeypatch):
+    """Test health counts do not wait on themselves for a second connection (sync profile pool of one)"""
+    monkeypatch.setattr(Config, 'DB_POOL_SIZE', 1)
+    monkeypatch.setattr(Config, 'DB_POOL_TIMEOUT', 2)
+    create_user('solo', 'solo@example.com', 'secret123')
+    use_shards(2)
+    assert count_table_rows()[0] == {'tasks': 0, 'users': 1}
+
+
+def test_shard_map_loads_without_a_second_connection(db_path, monkeypatch):
+    """Test the shard map loads on the request's connection, and up front for callers holding the only one"""
+    from app import app
+
+    monkeypatch.setattr(Config, 'DB_POOL_SIZE', 1)
+    monkeypatch.setattr(Config, 'DB_POOL_TIMEOUT', 2)
+    user_id = create_user('solo', 'solo@example.com', 'secret123')
+    use_shards(2)
+    with app.test_request_context():
+        get_db_connection()
+        assert shard_of(user_id) in (0, 1)
+
+    use_shards(2)
+    init_database()
+    conn = get_db_connection()
+    try:
+        assert shard_of(user_id) in (0, 1)
+    finally:
+        conn.close()
+
+
+def test_rebalance_moves_tasks_with_their_ids(db_path, capsys):
+    """Test the tool moves unsharded tasks in, then spreads them over more shards, keeping ids"""
+    users = [create_user(f'user{n}', f'user{n}@example.com', 'secret123') for n in range(12)]
+    repository = get_task_repository()
+    before = {user_id: repository.add(user_id, f'Before {user_id}', '', None, 'Low', 'Home') for user_id in users}
+
+    use_shards(2)
+    repository = get_task_repository()
+    for user_id in users:
+        repository.add(user_id, f'After {user_id}', '', None, 'Low', 'Home')
+    assert shard_db.main(['--rebalance']) == 0
+    assert stored_ids(db_path) == set()
+
+    assert shard_db.main(['--rebalance', '--shards', '3']) == 0
+    use_shards(3)
+    repository = get_task_repository()
+    assert {shard_of(user_id) for user_id in users} == {0, 1, 2}
+    for user_id in users:
+        assert titles(user_id) == [f'After {user_id}', f'Before {user_id}']
+        assert before[user_id] in stored_ids(shard_database_path(shard_of(user_id)))
+        # New ids come from the shard's own range even after rows were copied in
+        task_id = repository.add(user_id, 'Later', '', None, 'Low', 'Home')
+        assert (shard_of(user_id) + 1) * SHARD_ID_SPAN < task_id < (shard_of(user_id) + 2) * SHARD_ID_SPAN
+    assert count_table_rows()[0]['tasks'] == 36
+
+    capsys.readouterr()
+    assert shard_db.main(['--rebalance']) == 0
+    assert '0 of 1024 buckets moved' in capsys.readouterr().out
+
+
+def test_routes_use_the_shards(db_path):
+    """Test adding and listing tasks through the app with sharding on"""
+    from app import app
+
+    use_shards(2)
+    user_id = create_user('sharded', 'sharded@example.com', 'secret123')
+    app.config['TESTING'] = True
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['username'] = 'sharded'
+    client.post('/task/add', data={'title': 'Routed'})
+    assert [task['title'] for task in client.get('/api/tasks').get_json()['tasks']] == ['Routed']
+    response = client.post('/api/tasks/bulk', json={'tasks': [{'title': 'Bulk one'}, {'title': 'Bulk two'}]})
+    assert response.get_json() == {'created': 2}
+    assert titles(user_id) == ['Bulk one', 'Bulk two', 'Routed']
+    assert stored_ids(db_path) == set()
@@ -0,0 +1,88 @@
+import pytest
+import sys
+import os
+import sqlite3
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config
+from database import (bump_task_version, create_user, dispose_pool, get_db_connection, get_schema, init_database,
+                      sqlite_maintenance)
+from metrics import run_query
+
+WRITERS = 16
+TASKS_PER_WRITER = 25
+
+
+def write_tasks(db_path, user_id, writer, count):
+    """Add and then toggle tasks one transaction at a time, as the routes do"""
+    Config.SQLITE_DATABASE = db_path
+    get_schema()  # probed at worker start, as init_app() does
+    for i in range(count):
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            run_query(cursor, 'insert_task', "INSERT INTO tasks (title, user_id) VALUES (?, ?)",
+                      (f"writer {writer} task {i}", user_id))
+            task_id = cursor.lastrowid
+            bump_task_version(cursor, user_id)
+            conn.commit()
+
+            completed = run_query(cursor, 'toggle_select', "SELECT completed FROM tasks WHERE id = ?", (task_id,),
+                                  fetch='one')[0]
+            run_query(cursor, 'toggle_update', "UPDATE tasks SET completed = ? WHERE id = ?",
+                      (0 if completed else 1, task_id))
+            bump_task_version(cursor, user_id)
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+    return count
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Fresh migrated database file"""
+    original_db = Config.SQLITE_DATABASE
+    Config.SQLITE_DATABASE = str(tmp_path / 'tasks.db')
+    dispose_pool()
+    init_database()
+    yield Config.SQLITE_DATABASE
+    dispose_pool()
+    Config.SQLITE_DATABASE = original_db
+
+
+def test_connections_use_the_sqlite_profile(db_path):
+    """Test new connections are in WAL mode with the configured pragmas"""
+    conn = get_db_connection()
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == Config.SQLITE_BUSY_TIMEOUT
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+        assert conn.isolation_level == 'IMMEDIATE'
+    finally:
+        conn.close()
+    busy, frames, checkpointed = sqlite_maintenance()
+    assert busy == 0 and checkpointed == frames
+
+
+def test_parallel_writers_lose_no_writes(db_path):
+    """Test 16 writer processes complete every transaction"""
+    user_id = create_user('writer', 'writer@example.com', 'secret123')
+    dispose_pool()
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(WRITERS) as pool:
+        results = [pool.apply_async(write_tasks, (db_path, user_id, writer, TASKS_PER_WRITER))
+                   for writer in range(WRITERS)]
+        written = sum(result.get(timeout=120) for result in results)
+
+    expected = WRITERS * TASKS_PER_WRITER
+    assert written == expected
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*), SUM(completed) FROM tasks").fetchone() == (expected, expected)
+        assert conn.execute("SELECT task_version FROM users WHERE id = ?", (user_id,)).fetchone()[0] == 2 * expected
+    finally:
+        conn.close()
@@ -0,0 +1,265 @@
+import pytest
+import base64
+import json
+import sys
+import os
+import pickle
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config
+from migrations import LATEST_VERSION, upgrade
+from search import InvertedIndex
+from database import SchemaInfo, create_user, dispose_pool, init_database
+from task_queries import (Task, TaskFilters, InvalidCursor, build_task_list_query, decode_cursor,
+                          encode_cursor, paginate, task_row)
+
+COLUMNS = ['id', 'title', 'description', 'completed', 'created_at', 'due_date', 'priority', 'category', 'user_id']
+SCHEMA = SchemaInfo('sqlite', COLUMNS, search='fts5')
+
+
+@pytest.fixture
+def db():
+    """In-memory tasks table with two users' tasks"""
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    upgrade(conn, 'sqlite')
+    conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('a', 'a@x', 'h')")
+    conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('b', 'b@x', 'h')")
+    now = datetime.now()
+    rows = [
+        ('Write report', 0, 'High', 'Work', (now - timedelta(days=1)).isoformat(), '2025-01-01 10:00:00', 1),
+        ('Buy milk', 1, 'Low', 'Home', None, '2025-01-02 10:00:00', 1),
+        ('Call 50% plan', 0, 'Medium', 'Work', now.replace(hour=23, minute=59).strftime('%Y-%m-%d %H:%M:%S'),
+         '2025-01-03 10:00:00', 1),
+        ('Other user task', 0, 'High', 'Work', None, '2025-01-04 10:00:00', 2),
+    ]
+    conn.executemany(
+        "INSERT INTO tasks (title, completed, priority, category, due_date, created_at, user_id) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+    )
+    yield conn
+    conn.close()
+
+
+def run(conn, filters, user_id=1, schema=SCHEMA, search_ids=None):
+    sql, params, reverse = build_task_list_query(schema, user_id, filters, search_ids=search_ids)
+    rows = [task_row(None, tuple(row)) for row in conn.execute(sql, params)]
+    return paginate(rows, filters, reverse)
+
+
+def titles(page):
+    return [task.title for task in page.tasks]
+
+
+def test_default_sort_is_priority_then_newest(db):
+    """Test that the default list is scoped to the user and sorted by priority"""
+    page = run(db, TaskFilters())
+    assert titles(page) == ['Write report', 'Call 50% plan', 'Buy milk']
+    assert page.next_cursor is None and page.prev_cursor is None
+
+
+def test_status_filters(db):
+    """Test pending, completed, overdue and today filters run in SQL"""
+    assert titles(run(db, TaskFilters(status='completed'))) == ['Buy milk']
+    assert titles(run(db, TaskFilters(status='pending', sort='created_asc'))) == ['Write report', 'Call 50% plan']
+    assert titles(run(db, TaskFilters(status='overdue'))) == ['Write report']
+    assert titles(run(db, TaskFilters(status='today'))) == ['Call 50% plan']
+
+
+def test_search_and_category(db):
+    """Test full-text prefix search and the case-insensitive category filter"""
+    assert titles(run(db, TaskFilters(q='MILK'))) == ['Buy milk']
+    assert titles(run(db, TaskFilters(q='rep'))) == ['Write report']
+    assert titles(run(db, TaskFilters(q='50% plan'))) == ['Call 50% plan']
+    assert titles(run(db, TaskFilters(q='milk report'))) == []
+    assert titles(run(db, TaskFilters(category='work', sort='created_desc'))) == ['Call 50% plan', 'Write report']
+
+
+def test_search_covers_description_and_ranks(db):
+    """Test search matches descriptions, stays in sync via triggers and ranks by relevance"""
+    db.execute("UPDATE tasks SET description = 'milk milk milk' WHERE title = 'Write report'")
+    db.execute("DELETE FROM tasks WHERE title = 'Other user task'")
+    found = run(db, TaskFilters(q='milk', sort='relevance'))
+    assert titles(found) == ['Write report', 'Buy milk']
+    assert titles(run(db, TaskFilters(q='other'))) == []
+
+
+def test_search_fallback_index(db):
+    """Test the in-process inverted index when no full-text index exists"""
+    index = InvertedIndex()
+    for row in db.execute("SELECT id, title, description FROM tasks WHERE user_id = 1"):
+        index.add(row['id'], row['title'], row['description'])
+    fallback = SchemaInfo('sqlite', COLUMNS)
+
+    ids = index.search('rep')
+    assert titles(run(db, TaskFilters(q='rep'), schema=fallback, search_ids=ids)) == ['Write report']
+    assert titles(run(db, TaskFilters(q='nothing'), schema=fallback, search_ids=[])) == []
+
+    index.add(ids[0], 'Renamed', '')
+    assert index.search('rep') == []
+
+
+@pytest.mark.parametrize('q', ['"', '*', '" * -'])
+def test_search_without_words_matches_nothing(db, q):
+    """Test punctuation- or wildcard-only queries match no task on either search path"""
+    filters = TaskFilters(q=q, sort='relevance')
+    assert filters.terms == [] and filters.sort != 'relevance'
+    assert titles(run(db, filters)) == []
+    assert titles(run(db, filters, schema=SchemaInfo('sqlite', COLUMNS))) == []
+
+
+def test_derived_fields_come_from_sql(db):
+    """Test priority_rank and the overdue/today flags are selected with the tasks"""
+    db.execute("UPDATE tasks SET due_date = strftime('%Y-%m-%d %H:%M:%S', due_date)")
+    current = SchemaInfo('sqlite', COLUMNS + ['priority_rank'], LATEST_VERSION, search='fts5')
+    sql, _, _ = build_task_list_query(current, 1, TaskFilters())
+    assert 'datetime(due_date)' not in sql and 'CASE priority' not in sql
+    page = run(db, TaskFilters(), schema=current)
+    flags = {task.title: (task.priority_rank, task.is_overdue, task.is_due_today) for task in page.tasks}
+    assert flags == {'Write report': (3, True, False), 'Call 50% plan': (2, False, True), 'Buy milk': (1, False, False)}
+
+
+def test_keyset_pagination_walks_both_ways(db):
+    """Test next and prev cursors cover every task exactly once"""
+    first = run(db, TaskFilters(sort='created_desc', page_size=2))
+    assert titles(first) == ['Call 50% plan', 'Buy milk']
+    assert first.prev_cursor is None
+
+    second = run(db, TaskFilters(sort='created_desc', page_size=2, cursor=first.next_cursor))
+    assert titles(second) == ['Write report']
+    assert second.next_cursor is None
+
+    back = run(db, TaskFilters(sort='created_desc', page_size=2, cursor=second.prev_cursor))
+    assert titles(back) == titles(first)
+    assert back.prev_cursor is None
+    assert back.next_cursor is not None
+
+
+def test_task_rows_are_compact_and_picklable(db):
+    """Test tasks are slotted objects that survive the task cache's pickling"""
+    task = run(db, TaskFilters()).tasks[0]
+    assert not hasattr(task, '__dict__')
+    assert task.title == 'Write report' and task.completed is False
+    copy = pickle.loads(pickle.dumps(task))
+    assert isinstance(copy, Task)
+    assert [getattr(copy, name) for name in Task.__slots__] == [getattr(task, name) for name in Task.__slots__]
+
+
+def test_page_size_is_clamped():
+    """Test per_page is bounded and malformed values fall back to the default"""
+    assert TaskFilters.from_args({'per_page': '100000'}).page_size == 200
+    assert TaskFilters.from_args({'per_page': 'x'}).page_size == 50
+    assert TaskFilters(page_size=0).page_size == 1
+
+
+def test_cursor_round_trip():
+    """Test cursors encode and reject tampered values"""
+    assert decode_cursor(encode_cursor(3, 17, 'next')) == (3, 17, 'next')
+    with pytest.raises(InvalidCursor):
+        decode_cursor('not-a-cursor')
+
+
+def forged_cursor(value):
+    """Return a cursor encoding value as-is, bypassing encode_cursor()"""
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('value', [[[1], 1, 'next'], [{'a': 1}, 1, 'prev'], [True, 1, 'next'], ['x', [1], 'next']])
+def test_cursor_rejects_malformed_values(value):
+    """Test cursors whose sort value or id is not a plain column value are rejected"""
+    with pytest.raises(InvalidCursor):
+        decode_cursor(forged_cursor(value))
+    assert decode_cursor(forged_cursor([None, 1, 'next'])) == (None, 1, 'next')
+    assert decode_cursor(forged_cursor([1.5, 1, 'prev'])) == (1.5, 1, 'prev')
+
+
+@pytest.fixture
+def client(tmp_path):
+    """Logged-in test client on a fresh database"""
+    from app import app
+
+    original_db = Config.SQLITE_DATABASE
+    Config.SQLITE_DATABASE = str(tmp_path / 'tasks.db')
+    dispose_pool()
+    init_database()
+    user_id = create_user('pager', 'pager@example.com', 'secret123')
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['username'] = 'pager'
+        yield client
+    dispose_pool()
+    Config.SQLITE_DATABASE = original_db
+
+
+def test_home_paginates(client):
+    """Test the task list renders a page and a working next link"""
+    for i in range(3):
+        client.post('/task/add', data={'title': f'Paged task {i}'})
+
+    response = client.get('/tasks?per_page=2&sort=created_desc')
+    assert b'Paged task 2' in response.data
+    assert b'Paged task 0' not in response.data
+    assert b'NEXT' in response.data
+
+    next_url = re.search(r'href="([^"]*cursor=[^"]*)"', response.data.decode()).group(1)
+    response = client.get(next_url.replace('&amp;', '&'))
+    assert b'Paged task 0' in response.data
+    assert b'Paged task 2' not in response.data
+
+
+def test_home_rejects_bad_cursor(client):
+    """Test a tampered cursor redirects back to the first page"""
+    response = client.get('/tasks?cursor=garbage')
+    assert response.status_code == 302
+    response = client.get('/tasks', query_string={'cursor': forged_cursor([[1], 1, 'next'])})
+    assert response.status_code == 302
+
+
+def test_home_search_uses_full_text(client):
+    """Test the q box searches titles and descriptions"""
+    client.post('/task/add', data={'title': 'Quarterly taxes', 'description': 'send receipts to accountant'})
+    client.post('/task/add', data={'title': 'Walk dog'})
+
+    response = client.get('/tasks?q=recei&sort=relevance')
+    assert b'Quarterly taxes' in response.data
+    assert b'Walk dog' not in response.data
+
+    for q in ('%22', '*'):
+        response = client.get(f'/tasks?q={q}')
+        assert response.status_code == 200 and b'Error loading tasks' not in response.data
+        assert b'Walk dog' not in response.data
+
+
+def test_edit_form_is_loaded_on_demand(client):
+    """Test task cards link to an edit form fragment instead of embedding the form"""
+    client.post('/task/add', data={'title': 'Lazy task', 'description': 'edit me later', 'priority': 'Low'})
+    page = client.get('/tasks').data.decode()
+    assert 'edit me later</textarea>' not in page
+    form_url = re.search(r'data-form-url="([^"]+)"', page).group(1)
+
+    fragment = client.get(form_url, headers={'X-Requested-With': 'fetch'})
+    assert fragment.status_code == 200
+    assert 'X-Requested-With' in fragment.headers['Vary']
+    html = fragment.data.decode()
+    assert '<html' not in html
+    assert 'value="Lazy task"' in html and 'edit me later</textarea>' in html
+    assert '<option value="Low" selected>' in html
+
+    standalone = client.get(form_url).data.decode()
+    assert '<!DOCTYPE html>' in standalone and 'value="Lazy task"' in standalone
+
+
+def test_edit_form_is_scoped_to_owner(client):
+    """Test another user's task has no edit form"""
+    other_id = create_user('stranger', 'stranger@example.com', 'secret123')
+    conn = sqlite3.connect(Config.SQLITE_DATABASE)
+    task_id = conn.execute("INSERT INTO tasks (title, user_id) VALUES ('Private', ?)", (other_id,)).lastrowid
+    conn.commit()
+    conn.close()
+    assert client.get(f'/task/{task_id}/edit').status_code == 404
@@ -0,0 +1,85 @@
+import pytest
+import sys
+import os
+import sqlite3
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config
+from database import create_user, dispose_pool, get_task_version, init_database
+from task_repository import get_task_repository
+
+
+@pytest.fixture
+def users(tmp_path):
+    """Two users on a fresh migrated database"""
+    original_db = Config.SQLITE_DATABASE
+    Config.SQLITE_DATABASE = str(tmp_path / 'tasks.db')
+    dispose_pool()
+    init_database()
+    owner = create_user('owner', 'owner@example.com', 'secret123')
+    intruder = create_user('intruder', 'intruder@example.com', 'secret123')
+    yield owner, intruder
+    dispose_pool()
+    Config.SQLITE_DATABASE = original_db
+
+
+def stored(task_id):
+    conn = sqlite3.connect(Config.SQLITE_DATABASE)
+    try:
+        return conn.execute("SELECT title, completed FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    finally:
+        conn.close()
+
+
+def test_mutations_return_their_result(users):
+    """Test add returns the id, toggle the new status, update and delete whether they matched"""
+    owner, _ = users
+    repository = get_task_repository()
+    task_id = repository.add(owner, 'Plan trip', '', None, 'High', 'Travel')
+    assert stored(task_id) == ('Plan trip', 0)
+
+    assert repository.toggle(owner, task_id) == 1
+    assert repository.toggle(owner, task_id) == 0
+    assert repository.update(owner, task_id, 'Plan holiday', 'Beach', 'Low', 'Travel', None)
+    assert repository.get(owner, task_id)['title'] == 'Plan holiday'
+    assert repository.delete(owner, task_id)
+    assert stored(task_id) is None
+    assert repository.toggle(owner, task_id) is None
+    assert not repository.delete(owner, task_id)
+
+
+def test_other_users_tasks_are_untouched(users):
+    """Test toggle, update, delete and get only match the owner's tasks"""
+    owner, intruder = users
+    repository = get_task_repository()
+    task_id = repository.add(owner, 'Private', '', None, 'Medium', 'General')
+    version = get_task_version(intruder)
+
+    assert repository.get(intruder, task_id) is None
+    assert repository.toggle(intruder, task_id) is None
+    assert not repository.update(intruder, task_id, 'Hijacked', '', 'Medium', 'General', None)
+    assert not repository.delete(intruder, task_id)
+    assert stored(task_id) == ('Private', 0)
+    # Nothing changed, so nobody's cached lists or ETags are invalidated
+    assert get_task_version(intruder) == version
+
+
+def test_routes_refuse_other_users_tasks(users):
+    """Test the task routes answer 'not found' for another user's task"""
+    from app import app
+
+    owner, intruder = users
+    task_id = get_task_repository().add(owner, 'Private', '', None, 'Medium', 'General')
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'] = intruder
+            sess['username'] = 'intruder'
+        for path in (f'/task/{task_id}/toggle', f'/task/{task_id}/delete'):
+            response = client.post(path, follow_redirects=True)
+            assert b'Task not found' in response.data
+        response = client.post(f'/task/{task_id}/edit', data={'title': 'Hijacked'}, follow_redirects=True)
+        assert b'Task not found' in response.data
+        assert client.get(f'/task/{task_id}/edit').status_code == 404
+    assert stored(task_id) == ('Private', 0)